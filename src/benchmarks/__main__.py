@@ -0,0 +1,103 @@
+"""
+Offline micro-benchmarks of the crypto and data paths on synthetic vaults.
+
+Run from src/:
+    python -m benchmarks [-k decrypt] [--sizes 10,1000,100000] [-o results.json] [--compare old.json]
+
+`--db` adds the benchmarks of the configured relational backend: imports into PostgreSQL,
+or imports, exports and searches on a temporary SQLite database.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import platform
+import subprocess
+import time
+from typing import Optional
+
+from config import relational_db_cfg
+from . import cases  # noqa: F401, registers the cases
+from .runner import Result, get_cases, run_case
+
+DEFAULT_SIZES = (10, 1_000, 10_000, 100_000)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_result(result: Result, baseline: dict[tuple[str, int], dict]) -> None:
+    line = (
+        f"{result.name:>20} {result.size:>7} {result.ops_per_sec:>12,.1f} "
+        f"{result.records_per_sec:>14,.0f} {result.p50_ms:>10.3f} {result.p99_ms:>10.3f} "
+        f"{result.peak_memory_kib:>11,.0f}"
+    )
+    previous = baseline.get((result.name, result.size))
+    if previous:
+        change = result.ops_per_sec / previous["ops_per_sec"] - 1
+        line += f" {change:>+8.1%}"
+    print(line, flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run crypto and data-path micro-benchmarks.")
+    parser.add_argument("-k", dest="pattern", help="only run cases whose name contains this")
+    parser.add_argument(
+        "--sizes", type=lambda v: tuple(int(s) for s in v.split(",")), default=DEFAULT_SIZES,
+        help="vault sizes in records, comma-separated"
+    )
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds per case and size")
+    parser.add_argument("--min-iterations", type=int, default=5)
+    parser.add_argument("-o", "--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="show the ops/sec change against a saved JSON file")
+    parser.add_argument(
+        "--db", action="store_true",
+        help="also run the benchmarks of the configured relational backend"
+    )
+    args = parser.parse_args()
+    if args.db:
+        module = ".sqlite_cases" if relational_db_cfg.backend == "sqlite" else ".db_cases"
+        importlib.import_module(module, __package__)  # registers the cases
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+
+    print(
+        f"{'case':>20} {'size':>7} {'ops/s':>12} {'records/s':>14} {'p50 ms':>10} "
+        f"{'p99 ms':>10} {'peak KiB':>11}" + (f" {'vs base':>8}" if baseline else "")
+    )
+    results = []
+    loop = asyncio.new_event_loop()
+    try:
+        for bench in get_cases(args.pattern):
+            for size in bench.sizes or args.sizes:
+                result = run_case(
+                    loop, bench.name, bench.setup(size), size, args.min_time, args.min_iterations
+                )
+                _print_result(result, baseline)
+                results.append(result)
+    finally:
+        loop.close()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "results": [r._asdict() for r in results],
+            }, f, indent=2)
+        print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
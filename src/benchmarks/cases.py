@@ -0,0 +1,149 @@
+import csv
+import io
+import os
+import tempfile
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+from database.key_value_db.memory import MemoryStorageManager
+from helpers.pwd_mgr_helper import (
+    BulkCryptoEngine,
+    DecryptedRecord,
+    EncryptedRecord,
+    KdfParams,
+    derive_key,
+    gen_salt,
+    parse_csv_records,
+    write_csv_export,
+    write_csv_rows,
+)
+from config import relational_db_cfg
+from utils import escape_markdown_v2, strip_protocol
+from .runner import case
+from .vault import gen_csv_lines, gen_decrypted_records, gen_encrypted_records
+
+KEY = os.urandom(32)
+
+
+@case("derive_key", sizes=(1,))
+def bench_derive_key(_):
+    salt, kdf_params = gen_salt(), KdfParams.current()
+    # A distinct password per call, so single-flight deduplication doesn't kick in
+    passwords = (f"Benchmark-Password-{i}!" for i in range(1_000_000))
+    return lambda: derive_key(next(passwords), salt, kdf_params)
+
+
+@case("encrypt")
+def bench_encrypt(size):
+    decrypted_records = gen_decrypted_records(size)
+    return lambda: EncryptedRecord._encrypt(decrypted_records, KEY)
+
+
+@case("decrypt")
+def bench_decrypt(size):
+    encrypted_records = gen_encrypted_records(size, KEY)
+    return lambda: DecryptedRecord._decrypt(encrypted_records, KEY)
+
+
+def _bench_bulk(engine: BulkCryptoEngine, encrypt: bool, size: int):
+    if encrypt:
+        records, run = gen_decrypted_records(size), engine.encrypt
+    else:
+        records, run = gen_encrypted_records(size, KEY), engine.decrypt
+
+    async def operation():
+        async for _ in run(records, KEY):
+            pass
+    return operation
+
+
+@case("bulk_encrypt")
+def bench_bulk_encrypt(size):
+    return _bench_bulk(BulkCryptoEngine(workers=1, chunk_size=512), True, size)
+
+
+@case("bulk_decrypt")
+def bench_bulk_decrypt(size):
+    return _bench_bulk(BulkCryptoEngine(workers=1, chunk_size=512), False, size)
+
+
+@case("bulk_encrypt_procs")
+def bench_bulk_encrypt_processes(size):
+    engine = BulkCryptoEngine(workers=os.cpu_count() or 1, chunk_size=512, processes=True)
+    return _bench_bulk(engine, True, size)
+
+
+@case("bulk_decrypt_procs")
+def bench_bulk_decrypt_processes(size):
+    engine = BulkCryptoEngine(workers=os.cpu_count() or 1, chunk_size=512, processes=True)
+    return _bench_bulk(engine, False, size)
+
+
+@case("records_from_rows")
+def bench_records_from_rows(size):
+    rows = [tuple(record) for record in gen_encrypted_records(size, KEY)]
+    return lambda: list(map(EncryptedRecord._make, rows))
+
+
+@case("csv_parse")
+def bench_csv_parse(size):
+    lines = gen_csv_lines(size)
+    return lambda: parse_csv_records(lines)
+
+
+@case("csv_build")
+def bench_csv_build(size):
+    decrypted_records = gen_decrypted_records(size)
+
+    def operation():
+        writer = csv.writer(io.StringIO(), quoting=csv.QUOTE_ALL, lineterminator="\n")
+        write_csv_rows(writer, decrypted_records)
+    return operation
+
+
+@case("export_csv")
+def bench_export_csv(size):
+    """The export pipeline minus the database; peak memory should not grow with `size`."""
+    encrypted_records = gen_encrypted_records(size, KEY)
+    batch_size = relational_db_cfg.export_batch_size
+
+    async def batches():
+        for start in range(0, size, batch_size):
+            yield encrypted_records[start:start + batch_size]
+
+    async def operation():
+        with tempfile.TemporaryFile() as file:
+            await write_csv_export(file, batches(), KEY)
+    return operation
+
+
+@case("escape_markdown_v2")
+def bench_escape_markdown_v2(size):
+    services = [record.service for record in gen_decrypted_records(size)]
+    return lambda: [escape_markdown_v2(service) for service in services]
+
+
+@case("strip_protocol")
+def bench_strip_protocol(size):
+    services = [record.service for record in gen_decrypted_records(size)]
+    return lambda: [strip_protocol(service) for service in services]
+
+
+@case("kv_batch", sizes=(1,))
+def bench_kv_batch(_):
+    """The key-value batch of a callback handler, on the in-memory store."""
+    manager = MemoryStorageManager()
+    state = FSMContext(manager.storage, StorageKey(bot_id=1, chat_id=1, user_id=1))
+
+    async def operation():
+        return await (
+            manager.batch(state)
+            .get_service()
+            .set_password_id(1)
+            .set_state("PasswordManagerStates:DeletePassword")
+            .set_message_id_to_delete(1)
+            .set_input_format_text("Send your master password")
+            .execute()
+        )
+    return operation
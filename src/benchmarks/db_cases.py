@@ -0,0 +1,98 @@
+"""
+Import benchmarks against a live PostgreSQL with the bot's schema, enabled with `--db`.
+
+Every operation runs in a transaction that is rolled back, so the database is left as it was.
+"""
+import os
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+from asyncpg import Connection
+
+from database.relational_db.connection import connect_params
+from database.relational_db.postgresql import PostgresqlManager
+from helpers.pwd_mgr_helper import EncryptedRecord
+from .runner import case
+from .vault import gen_encrypted_records
+
+KEY = os.urandom(32)
+BENCH_USER_ID = -1  # not a valid Telegram user ID
+COPY_BATCH_SIZE = 512
+
+_connection: Optional[Connection] = None
+
+
+async def _rolled_back(insert: Callable[[Connection], Awaitable[object]]) -> None:
+    global _connection
+    if _connection is None:
+        _connection = await asyncpg.connect(**connect_params())
+    transaction = _connection.transaction()
+    await transaction.start()
+    try:
+        await _connection.execute(
+            "INSERT INTO public.users (user_id, full_name, salt) VALUES ($1, '', '')",
+            BENCH_USER_ID
+        )
+        await insert(_connection)
+    finally:
+        await transaction.rollback()
+
+
+async def _insert_unnest(
+    con: Connection, user_id: int, encrypted_records: list[EncryptedRecord]
+) -> None:
+    """The import before COPY: one INSERT from unnest arrays, without deduplication."""
+    await con.execute(
+        """
+        WITH input AS (
+            SELECT service COLLATE "C" AS service, record, fingerprint
+            FROM unnest($2::text[], $3::bytea[], $4::bytea[]) AS t(service, record, fingerprint)
+        ), upserted AS (
+            INSERT INTO public.services (user_id, name, password_count)
+            SELECT $1, service, count(*) FROM input GROUP BY service
+            ON CONFLICT (user_id, name) DO UPDATE
+            SET password_count = services.password_count + EXCLUDED.password_count,
+                last_activity = now()
+            RETURNING service_id, name
+        )
+        INSERT INTO public.passwords (user_id, service_id, record, fingerprint)
+        SELECT $1, upserted.service_id, input.record, input.fingerprint
+        FROM input JOIN upserted ON upserted.name = input.service
+        """,
+        user_id,
+        [r.service for r in encrypted_records],
+        [r.ciphertext for r in encrypted_records],
+        [r.fingerprint for r in encrypted_records]
+    )
+
+
+async def _batches(encrypted_records: list[EncryptedRecord]):
+    for start in range(0, len(encrypted_records), COPY_BATCH_SIZE):
+        yield encrypted_records[start:start + COPY_BATCH_SIZE]
+
+
+@case("import_unnest")
+def bench_import_unnest(size):
+    encrypted_records = gen_encrypted_records(size, KEY)
+    return lambda: _rolled_back(lambda con: _insert_unnest(con, BENCH_USER_ID, encrypted_records))
+
+
+@case("import_copy")
+def bench_import_copy(size):
+    encrypted_records = gen_encrypted_records(size, KEY)
+    return lambda: _rolled_back(
+        lambda con: PostgresqlManager._copy_passwords(
+            con, BENCH_USER_ID, _batches(encrypted_records)
+        )
+    )
+
+
+@case("import_copy_reimport")
+def bench_import_copy_reimport(size):
+    """Importing a file again, every record is skipped as a duplicate."""
+    encrypted_records = gen_encrypted_records(size, KEY)
+
+    async def insert(con: Connection) -> None:
+        await _insert_unnest(con, BENCH_USER_ID, encrypted_records)
+        await PostgresqlManager._copy_passwords(con, BENCH_USER_ID, _batches(encrypted_records))
+    return lambda: _rolled_back(insert)
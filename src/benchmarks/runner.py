@@ -0,0 +1,89 @@
+import asyncio
+import statistics
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, NamedTuple, Optional, Union
+
+Operation = Callable[[], Union[Any, Awaitable[Any]]]
+
+
+class Case(NamedTuple):
+    """
+    A benchmarked operation. `setup(size)` builds the input vault and returns the operation.
+    """
+    name: str
+    setup: Callable[[int], Operation]
+    sizes: Optional[tuple[int, ...]] = None  # fixed sizes, e.g. for size-independent operations
+
+
+class Result(NamedTuple):
+    name: str
+    size: int
+    iterations: int
+    ops_per_sec: float
+    records_per_sec: float
+    p50_ms: float
+    p99_ms: float
+    peak_memory_kib: float
+
+
+_cases: list[Case] = []
+
+
+def case(name: str, sizes: Optional[tuple[int, ...]] = None):
+    """Registers the decorated setup function as a benchmark case."""
+    def decorator(setup: Callable[[int], Operation]) -> Callable[[int], Operation]:
+        _cases.append(Case(name, setup, sizes))
+        return setup
+    return decorator
+
+
+def get_cases(pattern: Optional[str] = None) -> list[Case]:
+    return [c for c in _cases if pattern is None or pattern in c.name]
+
+
+def run_case(
+    loop: asyncio.AbstractEventLoop, name: str, operation: Operation, size: int,
+    min_time: float, min_iterations: int
+) -> Result:
+    """
+    Runs `operation` for at least `min_time` seconds and `min_iterations` times, then once more
+    under tracemalloc for the peak memory, which is kept out of the timings.
+    """
+    def call() -> Any:
+        result = operation()
+        if asyncio.iscoroutine(result):
+            result = loop.run_until_complete(result)
+        return result
+
+    call()  # warm-up
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < min_iterations or time.perf_counter() - started < min_time:
+        op_started = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - op_started)
+
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    ops_per_sec = len(durations) / sum(durations)
+    return Result(
+        name=name,
+        size=size,
+        iterations=len(durations),
+        ops_per_sec=ops_per_sec,
+        records_per_sec=ops_per_sec * size,
+        p50_ms=statistics.median(durations) * 1000,
+        p99_ms=_percentile(durations, 0.99) * 1000,
+        peak_memory_kib=peak / 1024,
+    )
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
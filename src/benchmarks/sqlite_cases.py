@@ -0,0 +1,84 @@
+"""
+Benchmarks of `SqliteManager` on a temporary database file, enabled with `--db` when
+RELATIONAL_DB_BACKEND=sqlite. They need no database server.
+"""
+import os
+import tempfile
+from typing import Optional
+
+from database.relational_db import SqliteManager
+from database.relational_db.registrations import Registration
+from helpers.pwd_mgr_helper import EncryptedRecord
+from .runner import case
+from .vault import gen_encrypted_records
+
+KEY = os.urandom(32)
+BATCH_SIZE = 512
+
+_manager: Optional[SqliteManager] = None
+_user_ids = iter(range(1, 1 << 62))
+
+
+async def _connected() -> SqliteManager:
+    global _manager
+    if _manager is None:
+        _manager = SqliteManager(os.path.join(tempfile.mkdtemp(), "benchmarks.sqlite3"))
+        await _manager.connect()
+        # Users are created directly, stopping the buffer's task keeps the loop free of it
+        await _manager._registrations.close()
+    return _manager
+
+
+async def _new_user(manager: SqliteManager) -> int:
+    user_id = next(_user_ids)
+    await manager._create_users([Registration(user_id, None, "Benchmark", 0)])
+    return user_id
+
+
+async def _batches(encrypted_records: list[EncryptedRecord]):
+    for start in range(0, len(encrypted_records), BATCH_SIZE):
+        yield encrypted_records[start:start + BATCH_SIZE]
+
+
+@case("sqlite_import")
+def bench_sqlite_import(size):
+    """Every iteration imports into a new user, the database grows across iterations."""
+    encrypted_records = gen_encrypted_records(size, KEY)
+
+    async def operation():
+        manager = await _connected()
+        user_id = await _new_user(manager)
+        await manager.import_passwords(user_id, _batches(encrypted_records))
+    return operation
+
+
+@case("sqlite_export")
+def bench_sqlite_export(size):
+    encrypted_records = gen_encrypted_records(size, KEY)
+    user_id: Optional[int] = None
+
+    async def operation():
+        nonlocal user_id
+        manager = await _connected()
+        if user_id is None:
+            user_id = await _new_user(manager)
+            await manager.import_passwords(user_id, _batches(encrypted_records))
+        async for _ in manager.export_passwords(user_id):
+            pass
+    return operation
+
+
+@case("sqlite_search")
+def bench_sqlite_search(size):
+    """A search keystroke in a vault of `size` records over up to 500 services."""
+    encrypted_records = gen_encrypted_records(size, KEY)
+    user_id: Optional[int] = None
+
+    async def operation():
+        nonlocal user_id
+        manager = await _connected()
+        if user_id is None:
+            user_id = await _new_user(manager)
+            await manager.import_passwords(user_id, _batches(encrypted_records))
+        await manager.inline_search_service(user_id, "servce-42")
+    return operation
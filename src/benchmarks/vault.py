@@ -0,0 +1,38 @@
+"""
+Deterministic synthetic vaults, so runs on different commits process the same data.
+"""
+import csv
+import io
+import random
+
+from helpers.pwd_mgr_helper import DecryptedRecord, EncryptedRecord
+from helpers.pwd_mgr_helper.pwd_mgr_fsm import CSV_FIELDS
+
+SERVICES_PER_VAULT = 500
+_ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$%^&*()-_=+[]."
+
+
+def gen_decrypted_records(size: int, seed: int = 0) -> list[DecryptedRecord]:
+    rand = random.Random(seed)
+    return [
+        DecryptedRecord(
+            service=f"https://www.service-{rand.randrange(SERVICES_PER_VAULT)}.example.com",
+            login=f"user.{i}@example.com",
+            password="".join(rand.choices(_ALPHABET, k=rand.randint(12, 32))),
+        )
+        for i in range(size)
+    ]
+
+
+def gen_encrypted_records(size: int, derived_key: bytes, seed: int = 0) -> list[EncryptedRecord]:
+    return EncryptedRecord._encrypt(gen_decrypted_records(size, seed), derived_key)
+
+
+def gen_csv_lines(size: int, seed: int = 0) -> list[str]:
+    """A file in the format of browser password exports, as read by the import."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    writer.writerow(CSV_FIELDS)
+    for record in gen_decrypted_records(size, seed):
+        writer.writerow((record.service, record.login, record.password))
+    return buffer.getvalue().splitlines()
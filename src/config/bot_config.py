@@ -17,6 +17,7 @@ class BotConfig(BaseSettings):
     dynamic_buttons_limit: int = Field(default=16, ge=1)
     dynamical_buttons_per_row: int = Field(default=2, ge=1)
     ttl: int = Field(default=600, ge=1)
+    export_spool_size: int = Field(default=1048576, ge=0)  # bytes kept in memory, then on disk
 
     # WEBHOOK
     web_server_host: str = "0.0.0.0"
@@ -30,6 +31,7 @@ class BotConfig(BaseSettings):
     webhook_path: str = "/webhook"
     webhook_secret: str = os.urandom(32).hex()
     webhook_url: str = ""
+    metrics_path: str = "/metrics"
 
 
 bot_cfg: BotConfig = BotConfig()
@@ -6,6 +6,7 @@ from argon2 import (
     DEFAULT_RANDOM_SALT_LENGTH,
     Type,
 )
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 from config.settings import base_settings_config
@@ -25,5 +26,23 @@ class CryptographyConfig(BaseSettings):
     argon2_random_salt_length: int = DEFAULT_RANDOM_SALT_LENGTH  # 16 (128-bit)
     argon2_type: Type = Type.ID  # Argon2id
 
+    # Argon2 executor: concurrent derivations are admitted while their memory fits the budget
+    kdf_memory_budget: int = Field(default=262144, ge=1)  # KiB (256 MiB)
+    kdf_max_queue: int = Field(default=32, ge=0)  # callers waiting for budget, 0 to never wait
+    kdf_queue_timeout: float = Field(default=10.0, gt=0)  # seconds
+
+    # Whole-vault encryption/decryption (export, master password change)
+    bulk_crypto_workers: int = Field(default=1, ge=1)
+    # Run the workers in processes instead of threads (opt-in). Spawned workers re-import the
+    # app, and the derived keys sent to them are never zeroized there
+    bulk_crypto_processes: bool = False
+    bulk_crypto_chunk_size: int = Field(default=512, ge=1)
+
+    # Unlock session: derived keys cached in-process after a successful unlock (opt-in)
+    key_cache_enabled: bool = False
+    key_cache_idle_ttl: int = Field(default=300, ge=1)  # seconds since the last use
+    key_cache_absolute_ttl: int = Field(default=1800, ge=1)  # seconds since the unlock
+    key_cache_max_entries: int = Field(default=1024, ge=1)
+
 
 crypto_cfg: CryptographyConfig = CryptographyConfig()
@@ -1,9 +1,7 @@
 from __future__ import annotations
 
-import inspect
 import json
 from abc import ABC, abstractmethod
-from functools import cached_property
 
 from config import key_value_db_cfg
 import models.kv
@@ -22,6 +20,92 @@ class AbstractDatabase(ABC):
         """Method for closing a connection."""
 
 
+class KeyValueBatch:
+    """
+    Builder of actions on the keys of an FSM state, sent to the store together by `execute`.
+    The state's data is read once and, if changed, written once. Reads of the data see the
+    writes added before them.
+    """
+
+    def __init__(self, db, state):
+        self.db = db
+        self.storage_key = state.key
+        self.actions = []
+
+    @property
+    def data_key(self):
+        return models.kv.GetData(self.storage_key).key
+
+    async def execute(self):
+        """
+        Sends the actions to the store.
+
+        :return: The values read, in the order of their actions.
+        """
+        return await self.db._execute_batch(self)
+
+    def set_state(self, state_value, expire = key_value_db_cfg.state_ttl):
+        return self._add(SetAction(models.kv.SetState(self.storage_key, state_value, expire)))
+
+    def get_state(self):
+        return self._add(GetAction(models.kv.GetState(self.storage_key)))
+
+    def clear_state(self):
+        return self._add(DeleteAction(models.kv.GetState(self.storage_key)))
+
+    def set_message_id_to_delete(self, msg_id, expire = key_value_db_cfg.data_ttl):
+        return self._set_data(models.kv.SetMessageIdToDelete(self.storage_key, msg_id, expire))
+
+    def set_service(self, service_name, expire = key_value_db_cfg.data_ttl):
+        return self._set_data(models.kv.SetService(self.storage_key, service_name, expire))
+
+    def set_hash_type(self, hash_type, expire = key_value_db_cfg.data_ttl):
+        return self._set_data(models.kv.SetHashType(self.storage_key, hash_type, expire))
+
+    def set_input_format_text(self, text, expire = key_value_db_cfg.data_ttl):
+        return self._set_data(models.kv.SetInputFormat(self.storage_key, text, expire))
+
+    def set_pwds_offset(self, offset, expire = key_value_db_cfg.data_ttl):
+        return self._set_data(models.kv.SetPasswordsOffset(self.storage_key, offset, expire))
+
+    def set_password_id(self, password_id, expire = key_value_db_cfg.data_ttl):
+        return self._set_data(models.kv.SetPasswordId(self.storage_key, password_id, expire))
+
+    def set_services_cursor(self, cursor, expire = key_value_db_cfg.data_ttl):
+        return self._set_data(models.kv.SetServicesCursor(self.storage_key, cursor, expire))
+
+    def get_message_id_to_delete(self):
+        return self._get_from_data(models.kv.GetMessageIdToDelete(self.storage_key))
+
+    def get_service(self):
+        return self._get_from_data(models.kv.GetService(self.storage_key))
+
+    def get_hash_type(self):
+        return self._get_from_data(models.kv.GetHashType(self.storage_key))
+
+    def get_input_format_text(self):
+        return self._get_from_data(models.kv.GetInputFormat(self.storage_key))
+
+    def get_pwds_offset(self):
+        return self._get_from_data(models.kv.GetPasswordsOffset(self.storage_key))
+
+    def get_password_id(self):
+        return self._get_from_data(models.kv.GetPasswordId(self.storage_key))
+
+    def get_services_cursor(self):
+        return self._get_from_data(models.kv.GetServicesCursor(self.storage_key))
+
+    def _set_data(self, obj):
+        return self._add(SetDataAction(obj))
+
+    def _get_from_data(self, obj):
+        return self._add(GetFromDataAction(obj))
+
+    def _add(self, action):
+        self.actions.append(action)
+        return self
+
+
 class AbstractKeyValueDatabase(AbstractDatabase):
     """Abstract class for key-value storage (Redis, Memcached)."""
     state_ttl = key_value_db_cfg.state_ttl
@@ -45,7 +129,16 @@ class AbstractKeyValueDatabase(AbstractDatabase):
     async def _delete(self, obj): ...
 
     @abstractmethod
-    async def execute_batch(self, *coros): ...
+    async def _execute_batch(self, batch):
+        """
+        Sends the actions of a batch to the store.
+
+        :return: The values read, in order.
+        """
+
+    def batch(self, state):
+        """Starts a batch of actions on the keys of `state`, see `KeyValueBatch`."""
+        return KeyValueBatch(self, state)
 
     async def set_state(self, state_value, state, expire = state_ttl):
         await self._set(models.kv.SetState(state.key, state_value, expire))
@@ -65,14 +158,14 @@ class AbstractKeyValueDatabase(AbstractDatabase):
     async def set_pwds_offset(self, offset, state, expire = data_ttl):
         await self._set_data(models.kv.SetPasswordsOffset(state.key, offset, expire))
 
-    async def set_services_offset(self, offset, state, expire = data_ttl):
-        await self._set_data(models.kv.SetServicesOffset(state.key, offset, expire))
+    async def set_password_id(self, password_id, state, expire = data_ttl):
+        await self._set_data(models.kv.SetPasswordId(state.key, password_id, expire))
 
-    async def set_cache_user_created(self, state, value = "1", expire = 86400):
-        await self._set(models.kv.SetCacheUserCreated(state.key, value, expire))
+    async def set_services_cursor(self, cursor, state, expire = data_ttl):
+        await self._set_data(models.kv.SetServicesCursor(state.key, cursor, expire))
 
     async def get_state(self, state):
-        await self._get(models.kv.GetState(state.key))
+        return await self._get(models.kv.GetState(state.key))
 
     async def get_message_id_to_delete(self, state):
         return await self._get_from_data(models.kv.GetMessageIdToDelete(state.key))
@@ -89,11 +182,23 @@ class AbstractKeyValueDatabase(AbstractDatabase):
     async def get_pwds_offset(self, state):
         return await self._get_from_data(models.kv.GetPasswordsOffset(state.key))
 
-    async def get_services_offset(self, state):
-        return await self._get_from_data(models.kv.GetServicesOffset(state.key))
+    async def get_password_id(self, state):
+        return await self._get_from_data(models.kv.GetPasswordId(state.key))
+
+    async def get_services_cursor(self, state):
+        return await self._get_from_data(models.kv.GetServicesCursor(state.key))
+
+    async def set_crypto_profile(self, user_id, version, profile, expire = 86400):
+        await self._set(models.kv.SetCryptoProfile(user_id, version, profile, expire))
+
+    async def get_crypto_profile(self, user_id, version):
+        return await self._get(models.kv.GetCryptoProfile(user_id, version))
 
-    async def get_cache_user_created(self, state):
-        return await self._get(models.kv.GetCacheUserCreated(state.key))
+    async def set_crypto_profile_version(self, user_id, version, expire = 86400):
+        await self._set(models.kv.SetCryptoProfileVersion(user_id, version, expire))
+
+    async def get_crypto_profile_version(self, user_id):
+        return await self._get(models.kv.GetCryptoProfileVersion(user_id))
 
     async def clear_state(self, state):
         await self._delete(models.kv.GetState(state.key))
@@ -110,101 +215,64 @@ class AbstractKeyValueDatabase(AbstractDatabase):
         current_data = await self._get_data(obj)
         return current_data.get(obj.key, None)
 
-    def _parse_coroutine(self, coro):
-        state, value, expire = self._parse_args(coro)
-        method, kv_cls = self._parse_names(coro)
-        coro.close()
-
-        Action = self._method_to_action_map.get(method)  # type: ignore
-        if value is None:
-            return Action(kv_cls(state.key))  # GetAction/GetFromDataAction/DeleteAction
-        else:
-            return Action(kv_cls(state.key, value, expire))  # SetAction/SetDataAction
-
-    @staticmethod
-    def _parse_args(coro):
-        args = inspect.getargvalues(coro.cr_frame)
-        state, value, expire = None, None, None
-        for k, v in args.locals.items():  # parsing arguments to find value for set actions
-            if k == "self":
-                continue
-            elif k == "state":
-                state = v
-            elif k == "expire":
-                expire = v
-            else:
-                value = v
-        return state, value, expire
-
-    @cached_property
-    def _method_to_action_map(self):
-        return {
-            self._set.__name__: SetAction,
-            self._set_data.__name__: SetDataAction,
-            self._get.__name__: GetAction,
-            self._get_from_data.__name__: GetFromDataAction,
-            self._delete.__name__: DeleteAction
-        }
-
-    def _parse_names(self, coro):
-        methods = self._method_to_action_map.keys()  # type: ignore
-        names = coro.cr_code.co_names
-        for i ,name in enumerate(names):
-            if name in methods:
-                # e.g await self._set(models.kv.SetState(state.key, state_value, expire))
-                # returns _set, SetState
-                return names[i], getattr(models.kv, names[i+3])
-        raise Exception(f"Unknown method in coroutine {coro}")
-
-    async def _handle_storage_data(self, data, actions, storage_key):
-        current_data = {}
-        idx = 0
-        for i, item in enumerate(data):
-            if item[0] != "{":
-                continue
-            idx = i
-            data.pop(idx)
-            current_data = json.loads(item)
-            break
-
-        storage_dicts = {}
-        for action in actions:
-            if action.action == SetDataAction.action:
-                action: SetDataAction
-                storage_dicts.update(action.data.dict())
-                data.insert(idx, "True")
-                idx += 1
-            elif action.action == GetFromDataAction.action:
-                action: GetFromDataAction
-                data.insert(idx, current_data.get(action.data.key, None))
-                idx += 1
-
-        if storage_dicts:
-            current_data.update(storage_dicts)
-            await self._set(models.kv.SetData(storage_key, json.dumps(current_data)))
-        return tuple(data)
+
+class UnitOfWork:
+    """Handle of a unit of work, see `AbstractRelationDatabase.unit_of_work`."""
+
+    async def run(self, *coros):
+        """
+        Awaits operations one after another on the unit's connection. Those after a failed one
+        are closed without running. Statements aren't pipelined: asyncpg and sqlite3 run one
+        query at a time per connection, the unit saves the checkout and transaction per call.
+
+        :return: Their results, in order.
+        """
+        results = []
+        pending = iter(coros)
+        try:
+            for coro in pending:
+                results.append(await coro)
+        finally:
+            for coro in pending:
+                coro.close()
+        return tuple(results)
 
 
 class AbstractRelationDatabase(AbstractDatabase):
     """Abstract class for relational databases."""
 
     @abstractmethod
-    async def create_user_if_not_exists(
-        self, user_id, user_name, full_name, state):
-        """Create a new user in the database."""
+    def unit_of_work(self, user_id):
+        """
+        Async context in which the operations on behalf of a user share one connection and
+        transaction, committed on exit or rolled back on an error. Operations must not run
+        concurrently within it, tasks it starts belong to it, and nested units join the outer one.
+        """
+
+    @abstractmethod
+    async def create_user_if_not_exists(self, user_id, user_name, full_name):
+        """Create a new user in the database, possibly deferred and batched with others."""
 
     @abstractmethod
-    async def get_services(self, user_id, offset, limit):
-        """Get all services for a user."""
+    async def get_services(self, user_id, cursor, backward, limit):
+        """
+        Get up to `limit + 1` (service, service_id) pairs of a user walking away from the
+        `cursor` service: from it in ascending name order, or before it in descending order
+        if `backward`. Cursor 0 starts from the first service.
+        """
 
     @abstractmethod
-    async def create_password(self, user_id, service, ciphertext):
-        """Create a new service for a user."""
+    async def create_password(self, user_id, service, ciphertext, fingerprint):
+        """Create a new password for a user and return its password_id."""
 
     @abstractmethod
     async def get_passwords(self, user_id, service, offset, limit):
         """Get all passwords of service for a user."""
 
+    @abstractmethod
+    async def get_password(self, user_id, password_id):
+        """Get a password of a user by its ID, None if it doesn't exist."""
+
     @abstractmethod
     async def get_rand_password(self, user_id):
         """Get a random passwords record for a user."""
@@ -222,7 +290,7 @@ class AbstractRelationDatabase(AbstractDatabase):
         """Delete a service for a user."""
 
     @abstractmethod
-    async def delete_password(self, user_id, service, ciphertext):
+    async def delete_password(self, user_id, password_id):
         """Delete a password for a user."""
 
     @abstractmethod
@@ -230,23 +298,63 @@ class AbstractRelationDatabase(AbstractDatabase):
         """Delete passwords for a user."""
 
     @abstractmethod
-    async def update_credentials(self, user_id, service, current_ciphertext, new_ciphertext):
+    async def update_credentials(self, user_id, password_id, ciphertext, fingerprint):
         """Updates login and/or password for record"""
 
     @abstractmethod
-    async def import_passwords(self, user_id, encrypted_records):
-        """Import passwords for a user."""
+    async def set_fingerprints(self, user_id, password_ids, fingerprints):
+        """Store the fingerprints of passwords stored before fingerprints existed."""
+
+    @abstractmethod
+    async def import_passwords(self, user_id, encrypted_batches):
+        """Import passwords for a user, skipping duplicates, and return the counts."""
+
+    @abstractmethod
+    def export_passwords(self, user_id, batch_size, unfingerprinted):
+        """Stream all passwords of a user, or only the unfingerprinted ones, in batches."""
+
+    @abstractmethod
+    async def inline_search_service(self, user_id, service, offset, limit):
+        """
+        Search services of a user by name, prefix matches first, then substring and fuzzy
+        matches. Returns up to `limit + 1` names starting at `offset`.
+        """
+
+    @abstractmethod
+    async def get_crypto_profile(self, user_id):
+        """
+        Get salt, key-check value and KDF parameters of a user.
+
+        :raise LookupError: If the user isn't registered.
+        """
+
+    @abstractmethod
+    async def set_key_check(self, user_id, key_check):
+        """Store the key-check value of a user."""
+
+    @abstractmethod
+    async def get_rekey_job(self, user_id):
+        """Get the unfinished re-key job of a user, if any."""
+
+    @abstractmethod
+    async def start_rekey(self, user_id, key_check, kdf_params):
+        """Create a re-key job for a user, or return the one that was interrupted."""
+
+    @abstractmethod
+    async def count_passwords(self, user_id, after_password_id):
+        """Count passwords of a user with IDs greater than `after_password_id`."""
 
     @abstractmethod
-    async def export_passwords(self, user_id):
-        """Import passwords for a user."""
+    async def get_rekey_batch(self, user_id, after_password_id, limit):
+        """Get the next batch of passwords to re-encrypt, in password_id order."""
 
     @abstractmethod
-    async def inline_search_service(self, user_id, service, limit):
-        """Search for passwords of service for a user."""
+    async def rekey_batch(self, user_id, encrypted_records, after_password_id):
+        """Store a re-encrypted batch and move the checkpoint, False if it moved meanwhile."""
 
     @abstractmethod
-    async def get_salt(self, user_id): ...
+    async def finish_rekey(self, user_id):
+        """Switch a user to the key-check value and KDF parameters of the finished job."""
 
     @abstractmethod
     async def _execute(self, query, *args):
@@ -1,13 +1,18 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Any, Union, Coroutine, overload, ClassVar
+from typing import (
+    Optional, Any, AsyncContextManager, AsyncIterable, AsyncIterator, Union, Coroutine,
+    overload, ClassVar
+)
 
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.base import BaseStorage, StorageKey
 
-from config import bot_cfg
-from models.actions import BaseAction, SetDataAction, GetFromDataAction
+from config import bot_cfg, relational_db_cfg
+from models.actions import BaseAction
 from models.kv.base import BaseKeyValueSet, BaseKeyValueGet
-from helpers.pwd_mgr_helper import EncryptedRecord
+from helpers.pwd_mgr_helper import (
+    CryptoProfile, EncryptedRecord, ImportResult, KdfParams, RekeyJob
+)
 
 
 class AbstractDatabase(ABC):
@@ -15,6 +20,47 @@ class AbstractDatabase(ABC):
     async def close(self) -> None: ...
 
 
+class KeyValueBatch[*Ts]:
+    db: AbstractKeyValueDatabase
+    storage_key: StorageKey
+    actions: list[BaseAction]
+
+    def __init__(self, db: AbstractKeyValueDatabase, state: FSMContext) -> None: ...
+    @property
+    def data_key(self) -> str: ...
+    async def execute(self) -> tuple[*Ts]: ...
+    def set_state(
+        self, state_value: str, expire: Optional[int] = ...
+    ) -> KeyValueBatch[*Ts]: ...
+    def get_state(self) -> KeyValueBatch[*Ts, Optional[str]]: ...
+    def clear_state(self) -> KeyValueBatch[*Ts]: ...
+    def set_message_id_to_delete(
+        self, msg_id: int, expire: Optional[int] = ...
+    ) -> KeyValueBatch[*Ts]: ...
+    def set_service(self, service_name: str, expire: Optional[int] = ...) -> KeyValueBatch[*Ts]: ...
+    def set_hash_type(self, hash_type: str, expire: Optional[int] = ...) -> KeyValueBatch[*Ts]: ...
+    def set_input_format_text(
+        self, text: str, expire: Optional[int] = ...
+    ) -> KeyValueBatch[*Ts]: ...
+    def set_pwds_offset(self, offset: int, expire: Optional[int] = ...) -> KeyValueBatch[*Ts]: ...
+    def set_password_id(
+        self, password_id: int, expire: Optional[int] = ...
+    ) -> KeyValueBatch[*Ts]: ...
+    def set_services_cursor(
+        self, cursor: int, expire: Optional[int] = ...
+    ) -> KeyValueBatch[*Ts]: ...
+    def get_message_id_to_delete(self) -> KeyValueBatch[*Ts, int]: ...
+    def get_service(self) -> KeyValueBatch[*Ts, str]: ...
+    def get_hash_type(self) -> KeyValueBatch[*Ts, str]: ...
+    def get_input_format_text(self) -> KeyValueBatch[*Ts, str]: ...
+    def get_pwds_offset(self) -> KeyValueBatch[*Ts, int]: ...
+    def get_password_id(self) -> KeyValueBatch[*Ts, int]: ...
+    def get_services_cursor(self) -> KeyValueBatch[*Ts, int]: ...
+    def _set_data(self, obj: BaseKeyValueSet) -> KeyValueBatch[*Ts]: ...
+    def _get_from_data(self, obj: BaseKeyValueGet) -> KeyValueBatch[*Ts, Any]: ...
+    def _add(self, action: BaseAction) -> KeyValueBatch[*Ts]: ...
+
+
 class AbstractKeyValueDatabase(AbstractDatabase):
     storage: BaseStorage
     state_ttl: ClassVar[Optional[int]]
@@ -26,49 +72,9 @@ class AbstractKeyValueDatabase(AbstractDatabase):
     async def _get(self, obj: BaseKeyValueGet) -> Optional[Any]: ...
     @abstractmethod
     async def _delete(self, obj: BaseKeyValueGet): ...
-    @overload
     @abstractmethod
-    async def execute_batch[T1](self, coro1: Coroutine[Any, Any, T1]) -> tuple[T1]: ...
-    @overload
-    async def execute_batch[T1, T2](
-            self, coro1: Coroutine[Any, Any, T1], coro2: Coroutine[Any, Any, T2]
-    ) -> tuple[T1, T2]: ...
-    @overload
-    async def execute_batch[T1, T2, T3](
-            self,
-            coro1: Coroutine[Any, Any, T1],
-            coro2: Coroutine[Any, Any, T2],
-            coro3: Coroutine[Any, Any, T3]
-    ) -> tuple[T1, T2, T3]: ...
-    @overload
-    async def execute_batch[T1, T2, T3, T4](
-            self,
-            coro1: Coroutine[Any, Any, T1],
-            coro2: Coroutine[Any, Any, T2],
-            coro3: Coroutine[Any, Any, T3],
-            coro4: Coroutine[Any, Any, T4]
-    ) -> tuple[T1, T2, T3, T4]: ...
-    @overload
-    async def execute_batch[T1, T2, T3, T4, T5](
-            self,
-            coro1: Coroutine[Any, Any, T1],
-            coro2: Coroutine[Any, Any, T2],
-            coro3: Coroutine[Any, Any, T3],
-            coro4: Coroutine[Any, Any, T4],
-            coro5: Coroutine[Any, Any, T5]
-    ) -> tuple[T1, T2, T3, T4, T5]: ...
-    @overload
-    async def execute_batch[T1, T2, T3, T4, T5, T6](
-            self,
-            coro1: Coroutine[Any, Any, T1],
-            coro2: Coroutine[Any, Any, T2],
-            coro3: Coroutine[Any, Any, T3],
-            coro4: Coroutine[Any, Any, T4],
-            coro5: Coroutine[Any, Any, T5],
-            coro6: Coroutine[Any, Any, T6]
-    ) -> tuple[T1, T2, T3, T4, T5, T6]: ...
-    @overload
-    async def execute_batch[T](self, *coros: Coroutine[Any, Any, T]) -> tuple[T]: ...
+    async def _execute_batch(self, batch: KeyValueBatch[*tuple[Any, ...]]) -> tuple[Any, ...]: ...
+    def batch(self, state: FSMContext) -> KeyValueBatch[*tuple[()]]: ...
     async def set_state(
         self, state_value: str, state: FSMContext, expire: Optional[int] = state_ttl
     ) -> None: ...
@@ -87,11 +93,11 @@ class AbstractKeyValueDatabase(AbstractDatabase):
     async def set_pwds_offset(
         self, offset: int, state: FSMContext, expire: Optional[int] = data_ttl
     ) -> None: ...
-    async def set_services_offset(
-        self, offset: int, state: FSMContext, expire: Optional[int] = data_ttl
+    async def set_password_id(
+        self, password_id: int, state: FSMContext, expire: Optional[int] = data_ttl
     ) -> None: ...
-    async def set_cache_user_created(
-        self, state: FSMContext, expire: Optional[int] = 86400
+    async def set_services_cursor(
+        self, cursor: int, state: FSMContext, expire: Optional[int] = data_ttl
     ) -> None: ...
     async def get_state(self, state: FSMContext) -> Optional[str]: ...
     async def get_message_id_to_delete(self, state: FSMContext) -> Union[int]: ...
@@ -99,44 +105,67 @@ class AbstractKeyValueDatabase(AbstractDatabase):
     async def get_hash_type(self, state: FSMContext) -> str: ...
     async def get_input_format_text(self, state: FSMContext) -> str: ...
     async def get_pwds_offset(self, state: FSMContext) -> int: ...
-    async def get_services_offset(self, state: FSMContext) -> int: ...
-    async def get_cache_user_created(self, state: FSMContext) -> Optional[str]: ...
+    async def get_password_id(self, state: FSMContext) -> int: ...
+    async def get_services_cursor(self, state: FSMContext) -> int: ...
+    async def set_crypto_profile(
+        self, user_id: int, version: Optional[str], profile: str, expire: Optional[int] = 86400
+    ) -> None: ...
+    async def get_crypto_profile(self, user_id: int, version: Optional[str]) -> Optional[bytes]: ...
+    async def set_crypto_profile_version(
+        self, user_id: int, version: str, expire: Optional[int] = 86400
+    ) -> None: ...
+    async def get_crypto_profile_version(self, user_id: int) -> Optional[str]: ...
     async def clear_state(self, state: FSMContext) -> None: ...
     @abstractmethod
     async def _get_data(self, obj: Union[BaseKeyValueSet, BaseKeyValueGet]) -> dict: ...
     async def _set_data(self, obj: BaseKeyValueSet) -> None: ...
     async def _get_from_data(self, obj: BaseKeyValueGet) -> Optional[Any]: ...
-    def _parse_coroutine(self, coro: Coroutine) -> BaseAction: ...
-    @staticmethod
-    def _parse_args(coro: Coroutine) -> tuple[FSMContext, Optional[str | int], Optional[int]]: ...
-    def _method_to_action_map(self) -> dict[str, type[BaseAction]]: ...
-    def _parse_names(
-        self, coro: Coroutine
-    ) -> tuple[str, type[Union[BaseKeyValueSet, BaseKeyValueGet]]]: ...
-    async def _handle_storage_data(
-        self,
-        data: list[Optional[str]],
-        actions: list[Union[SetDataAction, GetFromDataAction]],
-        storage_key: StorageKey
-    ) -> tuple[Any, ...]: ...
+
+
+class UnitOfWork:
+    @overload
+    async def run[T1](self, coro1: Coroutine[Any, Any, T1]) -> tuple[T1]: ...
+    @overload
+    async def run[T1, T2](
+            self, coro1: Coroutine[Any, Any, T1], coro2: Coroutine[Any, Any, T2]
+    ) -> tuple[T1, T2]: ...
+    @overload
+    async def run[T1, T2, T3](
+            self,
+            coro1: Coroutine[Any, Any, T1],
+            coro2: Coroutine[Any, Any, T2],
+            coro3: Coroutine[Any, Any, T3]
+    ) -> tuple[T1, T2, T3]: ...
+    @overload
+    async def run[T](self, *coros: Coroutine[Any, Any, T]) -> tuple[T, ...]: ...
 
 
 class AbstractRelationDatabase(AbstractDatabase):
+    @abstractmethod
+    def unit_of_work(self, user_id: int) -> AsyncContextManager[UnitOfWork]: ...
     @abstractmethod
     async def create_user_if_not_exists(
-        self, user_id: int, user_name: str, full_name: str, state: FSMContext
+        self, user_id: int, user_name: Optional[str], full_name: str
     ) -> None: ...
     @abstractmethod
     async def get_services(
-        self, user_id: int, offset: int, limit: int = bot_cfg.dynamic_buttons_limit
-    ) -> Optional[list[str]]: ...
+        self,
+        user_id: int,
+        cursor: int,
+        backward: bool = False,
+        limit: int = bot_cfg.dynamic_buttons_limit
+    ) -> list[tuple[str, int]]: ...
     @abstractmethod
-    async def create_password(self, user_id: int, service: str, ciphertext: str) -> None: ...
+    async def create_password(
+        self, user_id: int, service: str, ciphertext: bytes, fingerprint: bytes
+    ) -> int: ...
     @abstractmethod
     async def get_passwords(
         self, user_id: int, service: str, offset: int, limit: int = bot_cfg.dynamic_buttons_limit
     ) -> list[EncryptedRecord]: ...
     @abstractmethod
+    async def get_password(self, user_id: int, password_id: int) -> Optional[EncryptedRecord]: ...
+    @abstractmethod
     async def get_rand_password(self, user_id: int) -> Optional[EncryptedRecord]: ...
     @abstractmethod
     async def change_service(self, new_service: str, user_id: int, old_service: str) -> None: ...
@@ -145,25 +174,58 @@ class AbstractRelationDatabase(AbstractDatabase):
     @abstractmethod
     async def delete_service(self, user_id: int, service: str) -> None: ...
     @abstractmethod
-    async def delete_password(self, user_id: int, service: str, ciphertext: str) -> None: ...
+    async def delete_password(self, user_id: int, password_id: int) -> None: ...
     @abstractmethod
     async def delete_passwords(self, user_id: int) -> None: ...
     @abstractmethod
     async def update_credentials(
-        self, user_id: int, service: str, current_ciphertext: str, new_ciphertext: str
+        self, user_id: int, password_id: int, ciphertext: bytes, fingerprint: bytes
     ) -> None: ...
     @abstractmethod
-    async def import_passwords(
-        self, user_id: int, encrypted_records: list[EncryptedRecord]
+    async def set_fingerprints(
+        self, user_id: int, password_ids: list[int], fingerprints: list[bytes]
     ) -> None: ...
     @abstractmethod
-    async def export_passwords(self, user_id: int) -> list[EncryptedRecord]: ...
+    async def import_passwords(
+        self, user_id: int, encrypted_batches: AsyncIterable[list[EncryptedRecord]]
+    ) -> ImportResult: ...
+    @abstractmethod
+    def export_passwords(
+        self,
+        user_id: int,
+        batch_size: int = relational_db_cfg.export_batch_size,
+        unfingerprinted: bool = False
+    ) -> AsyncIterator[list[EncryptedRecord]]: ...
     @abstractmethod
     async def inline_search_service(
-        self, user_id: int, service: str, limit: int = bot_cfg.dynamic_buttons_limit
-    ) -> Optional[list[str]]: ...
+        self,
+        user_id: int,
+        service: str,
+        offset: int = 0,
+        limit: int = bot_cfg.dynamic_buttons_limit
+    ) -> list[str]: ...
+    @abstractmethod
+    async def get_crypto_profile(self, user_id: int) -> CryptoProfile: ...
+    @abstractmethod
+    async def set_key_check(self, user_id: int, key_check: str) -> None: ...
+    @abstractmethod
+    async def get_rekey_job(self, user_id: int) -> Optional[RekeyJob]: ...
+    @abstractmethod
+    async def start_rekey(
+        self, user_id: int, key_check: str, kdf_params: KdfParams
+    ) -> RekeyJob: ...
+    @abstractmethod
+    async def count_passwords(self, user_id: int, after_password_id: int = 0) -> int: ...
+    @abstractmethod
+    async def get_rekey_batch(
+        self, user_id: int, after_password_id: int, limit: int = relational_db_cfg.rekey_batch_size
+    ) -> list[EncryptedRecord]: ...
+    @abstractmethod
+    async def rekey_batch(
+        self, user_id: int, encrypted_records: list[EncryptedRecord], after_password_id: int
+    ) -> bool: ...
     @abstractmethod
-    async def get_salt(self, user_id: int) -> bytes: ...
+    async def finish_rekey(self, user_id: int) -> None: ...
     @abstractmethod
     async def _execute(self, query: str, *args) -> None: ...
     @abstractmethod
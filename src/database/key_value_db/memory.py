@@ -1,28 +1,156 @@
+import json
 import logging
-from typing import Optional, Any
+import time
+from typing import Optional, Any, Dict, Iterable, cast, override
 
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
 
+from config import key_value_db_cfg
 from database.base import AbstractKeyValueDatabase
+from models.actions import (
+    BaseAction, SetAction, GetAction, DeleteAction, BaseDataAction, SetDataAction
+)
 
 
 class MemoryStorageManager(AbstractKeyValueDatabase):
     """
-    Implementation of a key–value Memory store.
+    Implementation of a key–value Memory store, for single-process deployments. Values are
+    kept under the same keys as in Redis and the FSM storage shares them.
     """
 
     def __init__(self) -> None:
-        self.storage = MemoryStorage()
+        self._values: dict[str, tuple[Optional[float], str]] = {}
+        self.storage = _MemoryStorage(self, key_value_db_cfg.state_ttl, key_value_db_cfg.data_ttl)
 
+    @override
     async def connect(self) -> None:
         logging.info("Using MemoryStorage")
 
+    @override
     async def close(self) -> None:
-        await self.storage.close()
+        self._values.clear()
         logging.info("MemoryStorage has been closed")
 
-    async def _set(self, key: str, value: Any, expire: Optional[int] = None):
-        pass
+    @override
+    async def _execute_batch(self, batch):
+        current_data = json.loads(self.get_value(batch.data_key) or "{}")
+        values = []
+        for action in batch.actions:
+            if action.type == BaseDataAction.type:
+                continue
+            if action.action == GetAction.action:
+                values.append(self.get_value(action.data.key))
+                continue
+            if action.action == SetAction.action:
+                self.set_value(action.data.key, action.data.value, action.data.expire)
+            elif action.action == DeleteAction.action:
+                self._values.pop(action.data.key, None)
+            values.append(None)
+        results, changed = _batch_results(batch.actions, values, current_data)
+        if changed:
+            self.set_value(batch.data_key, json.dumps(current_data), self.data_ttl)
+        return results
+
+    @override
+    async def _set(self, obj):
+        self.set_value(obj.key, obj.value, obj.expire)
+
+    @override
+    async def _get(self, obj):
+        return self.get_value(obj.key)
+
+    @override
+    async def _delete(self, obj):
+        self._values.pop(obj.key, None)
+
+    @override
+    async def _get_data(self, obj):
+        current_data = self.get_value(obj.data_key)
+        if current_data is None:
+            return {}
+        return json.loads(current_data)
+
+    def set_value(self, key: str, value: Any, expire: Optional[int] = None) -> None:
+        expires_at = time.monotonic() + expire if expire else None
+        self._values[key] = (expires_at, str(value))
+
+    def get_value(self, key: str) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._values[key]
+            return None
+        return value
+
+
+class _MemoryStorage(BaseStorage):
+    """FSM storage over the values of a `MemoryStorageManager`, laid out like `RedisStorage`."""
+
+    def __init__(
+        self, manager: MemoryStorageManager, state_ttl: Optional[int], data_ttl: Optional[int]
+    ) -> None:
+        self.manager = manager
+        self.key_builder = DefaultKeyBuilder()
+        self.state_ttl = state_ttl
+        self.data_ttl = data_ttl
 
-    async def _get_from_data(self, key: str) -> Optional[Any]:
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key, "state")
+        if state is None:
+            self.manager._values.pop(storage_key, None)
+        else:
+            self.manager.set_value(
+                storage_key,
+                cast(str, state.state if isinstance(state, State) else state),
+                self.state_ttl
+            )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self.manager.get_value(self.key_builder.build(key, "state"))
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.key_builder.build(key, "data")
+        if not data:
+            self.manager._values.pop(storage_key, None)
+            return
+        self.manager.set_value(storage_key, json.dumps(data), self.data_ttl)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        value = self.manager.get_value(self.key_builder.build(key, "data"))
+        if value is None:
+            return {}
+        return cast(Dict[str, Any], json.loads(value))
+
+    async def close(self) -> None:
         pass
+
+
+def _batch_results(
+    actions: list[BaseAction], values: Iterable[Optional[str]], data: Dict[str, Any]
+) -> tuple[tuple[Any, ...], bool]:
+    """
+    Replays the actions of a batch in order.
+
+    :param values: Replies to its value actions, in order.
+    :param data: The state's data, updated in place by its data writes.
+    :return: The values read, in order, and whether the data was changed.
+    """
+    results = []
+    changed = False
+    values = iter(values)
+    for action in actions:
+        if action.type == BaseDataAction.type:
+            if action.action == SetDataAction.action:
+                data.update(action.data.dict())
+                changed = True
+            else:
+                results.append(data.get(action.data.key, None))
+        else:
+            value = next(values)
+            if action.action == GetAction.action:
+                results.append(value)
+    return tuple(results), changed
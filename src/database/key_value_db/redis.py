@@ -1,17 +1,35 @@
-import json
 import logging
-from typing import Optional, Any, Coroutine, Union, override
+from typing import Any, Callable, Dict, Optional, override
 
 from aiogram.fsm.storage.base import StorageKey
 from aiogram.fsm.storage.redis import RedisStorage
 from redis.asyncio import Redis, ConnectionPool
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
 
 from config import key_value_db_cfg
 from database.base import AbstractKeyValueDatabase
-from models.actions import (
-    SetDataAction, SetAction, GetFromDataAction, GetAction, DeleteAction, BaseDataAction,
-    BaseValueAction
-)
+from models.actions import SetAction, GetAction, DeleteAction, BaseDataAction, SetDataAction
+
+# Converts data that `RedisStorage` kept as a JSON string into a hash of JSON-encoded values,
+# keeping its TTL. Returns 1 if the key was converted.
+MIGRATE_DATA_SCRIPT = """
+if redis.call('TYPE', KEYS[1])['ok'] ~= 'string' then
+    return 0
+end
+local data = cjson.decode(redis.call('GET', KEYS[1]))
+local ttl = redis.call('PTTL', KEYS[1])
+redis.call('DEL', KEYS[1])
+if type(data) == 'table' then
+    for field, value in pairs(data) do
+        redis.call('HSET', KEYS[1], field, cjson.encode(value))
+    end
+    if ttl > 0 and redis.call('EXISTS', KEYS[1]) == 1 then
+        redis.call('PEXPIRE', KEYS[1], ttl)
+    end
+end
+return 1
+"""
 
 
 class RedisManager(AbstractKeyValueDatabase):
@@ -22,7 +40,7 @@ class RedisManager(AbstractKeyValueDatabase):
     def __init__(self) -> None:
         self.c = key_value_db_cfg
         self.redis = Redis(connection_pool=self._create_connection_pool(), decode_responses=True)
-        self.storage = RedisStorage(
+        self.storage = RedisHashStorage(
             redis=self.redis, state_ttl=self.c.state_ttl, data_ttl=self.c.data_ttl
         )
 
@@ -41,49 +59,54 @@ class RedisManager(AbstractKeyValueDatabase):
         logging.info("Disconnected from Redis")
 
     @override
-    async def execute_batch[T](self, *coroutines: Coroutine[Any, Any, T]) -> tuple[T, ...]:
-        data, commands, storage_key = await self._execute_pipeline(*coroutines)
-        if storage_key:
-            return await self._handle_storage_data(data, commands, storage_key)
-        return tuple(data)
-
-    async def _execute_pipeline(
-        self, *coroutines: Coroutine
-    ) -> tuple[list, list[Union[SetDataAction, GetFromDataAction]], Optional[StorageKey]]:
+    async def _execute_batch(self, batch):
+        """Sends all actions in one pipeline, the data ones as commands on the data hash."""
+        data_key = batch.data_key
+        data_actions = [action for action in batch.actions if action.type == BaseDataAction.type]
+
+        def queue_data_actions(pipe: Pipeline) -> None:
+            for action in data_actions:
+                if action.action == SetDataAction.action:
+                    self.storage.queue_update(pipe, data_key, action.data.dict())
+                else:
+                    pipe.hget(data_key, action.data.key)
+
         pipe = self.redis.pipeline()
-        storage_key: Optional[StorageKey] = None
-        actions = [self._parse_coroutine(coro) for coro in coroutines]
-
-        for action in actions:
-            if action.type == BaseDataAction.type:  # set/get data (getting storage_data)
-                if storage_key:
-                    continue
-                action: Union[SetDataAction, GetFromDataAction]
-                storage_key = action.data.storage_key
-                pipe = pipe.get(action.data.key_builder.build(storage_key, "data"))
-            elif action.type == BaseValueAction.type:
-                if action.action == SetAction.action:  # set
-                    action: SetAction
-                    pipe = pipe.set(action.data.key, action.data.value, action.data.expire)
-
-                elif action.action == GetAction.action:  # get
-                    action: GetAction
-                    pipe = pipe.get(action.data.key)
-
-                elif action.action == DeleteAction.action:  # delete
-                    action: DeleteAction
-                    pipe = pipe.delete(action.data.key)
-
-        data = await pipe.execute()
-        for idx, item in enumerate(data):
-            if isinstance(item, bytes):
-                item = item.decode()
-            elif isinstance(item, bool):
-                item = str(item)
-            data[idx] = item
-
-        actions = [action for action in actions if action.type == BaseDataAction.type]
-        return data, actions, storage_key
+        queue_data_actions(pipe)
+        data_commands = len(pipe)
+        for action in batch.actions:
+            if action.type == BaseDataAction.type:
+                continue
+            if action.action == SetAction.action:
+                pipe.set(action.data.key, action.data.value, action.data.expire)
+            elif action.action == GetAction.action:
+                pipe.get(action.data.key)
+            elif action.action == DeleteAction.action:
+                pipe.delete(action.data.key)
+
+        replies = await pipe.execute(raise_on_error=False)
+        data_replies, value_replies = replies[:data_commands], replies[data_commands:]
+        if any(_is_wrong_type(reply) for reply in data_replies):
+            data_replies = await self.storage.execute_on_data(data_key, queue_data_actions)
+        for reply in replies:
+            if isinstance(reply, Exception) and not _is_wrong_type(reply):
+                raise reply
+
+        results = []
+        data_replies, value_replies = iter(data_replies), iter(value_replies)
+        for action in batch.actions:
+            if action.type == BaseDataAction.type:
+                reply = next(data_replies)
+                if action.action == SetDataAction.action:
+                    if self.storage.data_ttl:
+                        next(data_replies)  # EXPIRE
+                else:
+                    results.append(None if reply is None else self.storage.json_loads(reply))
+            else:
+                reply = next(value_replies)
+                if action.action == GetAction.action:
+                    results.append(reply.decode() if isinstance(reply, bytes) else reply)
+        return tuple(results)
 
     @override
     async def _set(self, obj):
@@ -99,10 +122,18 @@ class RedisManager(AbstractKeyValueDatabase):
 
     @override
     async def _get_data(self, obj):
-        current_data = await self.redis.get(obj.data_key)
-        if current_data is None:
-            return {}
-        return json.loads(current_data)
+        return await self.storage.get_data(obj.storage_key)
+
+    @override
+    async def _set_data(self, obj):
+        data_key = obj.data_key
+        await self.storage.execute_on_data(
+            data_key, lambda pipe: self.storage.queue_update(pipe, data_key, obj.dict())
+        )
+
+    @override
+    async def _get_from_data(self, obj):
+        return await self.storage.get_value(obj.storage_key, obj.key)
 
     def _create_connection_pool(self) -> ConnectionPool:
         """
@@ -113,3 +144,102 @@ class RedisManager(AbstractKeyValueDatabase):
         if self.c.url:
             return ConnectionPool.from_url(url=self.c.url, max_connections=self.c.max_pool_size)
         return ConnectionPool(max_connections=self.c.max_pool_size)
+
+
+class RedisHashStorage(RedisStorage):
+    """
+    `RedisStorage` keeping the data of a state as a hash of JSON-encoded values, so fields are
+    read and written without a round trip for the rest of the data. The TTL of the data is
+    renewed on every write. Data still kept as a JSON string is converted on first use.
+    """
+
+    def __init__(self, redis: Redis, **kwargs: Any) -> None:
+        super().__init__(redis, **kwargs)
+        self._migrate_script = redis.register_script(MIGRATE_DATA_SCRIPT)
+
+    @override
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        data_key = self.key_builder.build(key, "data")
+        pipe = self.redis.pipeline()
+        pipe.delete(data_key)
+        if data:
+            self.queue_update(pipe, data_key, data)
+        await pipe.execute()
+
+    @override
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        data_key = self.key_builder.build(key, "data")
+        (fields,) = await self.execute_on_data(data_key, lambda pipe: pipe.hgetall(data_key))
+        return self._decode(fields)
+
+    @override
+    async def get_value(
+        self, storage_key: StorageKey, dict_key: str, default: Optional[Any] = None
+    ) -> Optional[Any]:
+        data_key = self.key_builder.build(storage_key, "data")
+        (value,) = await self.execute_on_data(
+            data_key, lambda pipe: pipe.hget(data_key, dict_key)
+        )
+        return default if value is None else self.json_loads(value)
+
+    @override
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        data_key = self.key_builder.build(key, "data")
+
+        def queue(pipe: Pipeline) -> None:
+            if data:
+                self.queue_update(pipe, data_key, data)
+            pipe.hgetall(data_key)
+        *_, fields = await self.execute_on_data(data_key, queue)
+        return self._decode(fields)
+
+    def queue_update(self, pipe: Pipeline, data_key: str, data: Dict[str, Any]) -> None:
+        """Queues writing the fields of `data`, followed by an EXPIRE if the data has a TTL."""
+        pipe.hset(data_key, mapping={
+            field: self.json_dumps(value) for field, value in data.items()
+        })
+        if self.data_ttl:
+            pipe.expire(data_key, self.data_ttl)
+
+    async def execute_on_data(
+        self, data_key: str, queue: Callable[[Pipeline], None]
+    ) -> list[Any]:
+        """
+        Executes the commands that `queue` adds to a pipeline, all on the data at `data_key`.
+        If the data is still a JSON string, it is converted and the commands are retried.
+
+        :return: The replies to the commands.
+        """
+        pipe = self.redis.pipeline()
+        queue(pipe)
+        try:
+            return await pipe.execute()
+        except ResponseError as e:
+            if not _is_wrong_type(e):
+                raise
+
+        await self.migrate_data([data_key])
+        pipe = self.redis.pipeline()
+        queue(pipe)
+        return await pipe.execute()
+
+    async def migrate_data(self, data_keys: list[str]) -> int:
+        """
+        Converts the data kept as JSON strings at `data_keys` to hashes.
+
+        :return: The number of keys converted.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for data_key in data_keys:
+            await self._migrate_script(keys=[data_key], client=pipe)
+        return sum(await pipe.execute())
+
+    def _decode(self, fields: Dict[Any, Any]) -> Dict[str, Any]:
+        return {
+            field.decode() if isinstance(field, bytes) else field: self.json_loads(value)
+            for field, value in fields.items()
+        }
+
+
+def _is_wrong_type(error: Any) -> bool:
+    return isinstance(error, ResponseError) and "WRONGTYPE" in str(error)
@@ -48,13 +48,14 @@ class DatabaseManager:
 
     @classmethod
     def _resolve_backend_types(cls, db_name: str) -> Type[DatabaseType]:
-        from database.relational_db import PostgresqlManager
+        from database.relational_db import PostgresqlManager, SqliteManager
         from database.key_value_db import RedisManager, MemoryStorageManager
 
         BACKEND_MAPPING = {
             "redis": RedisManager,
             "memory": MemoryStorageManager,
             "postgres": PostgresqlManager,
+            "sqlite": SqliteManager,
         }
         return BACKEND_MAPPING[db_name]
 
@@ -1,5 +1,7 @@
 from .postgresql import PostgresqlManager
+from .sqlite import SqliteManager
 
 __all__ = (
     "PostgresqlManager",
+    "SqliteManager",
 )
@@ -0,0 +1,127 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from asyncpg import Connection
+from asyncpg.exceptions import InvalidCachedStatementError
+from asyncpg.prepared_stmt import PreparedStatement
+
+from config import relational_db_cfg as c
+from utils import metrics
+from .queries import Query
+
+T = TypeVar("T")
+
+_duration = metrics.histogram(
+    "db_query_duration_seconds", "Time spent executing a query", ("query",)
+)
+_rows = metrics.counter("db_query_rows", "Rows returned or affected by queries", ("query",))
+_errors = metrics.counter("db_query_errors", "Failed queries", ("query", "error"))
+
+
+class InstrumentedConnection(Connection):
+    """
+    Connection that runs registered `Query` objects through prepared statements kept for its
+    lifetime, recording their latency, rows and errors and logging slow ones. Plain SQL strings,
+    e.g. DDL, are passed to asyncpg unchanged.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._statements: dict[str, PreparedStatement] = {}
+
+    async def execute(self, query, *args, timeout: Optional[float] = None) -> str:
+        if not isinstance(query, Query):
+            return await super().execute(query, *args, timeout=timeout)
+
+        async def execute(statement: Optional[PreparedStatement]) -> str:
+            if statement is None:
+                return await super(InstrumentedConnection, self).execute(
+                    query.sql, *args, timeout=timeout
+                )
+            await statement.fetch(*args, timeout=timeout)
+            return statement.get_statusmsg()
+        status = await self._run(query, execute)
+        _rows.labels(query.name).inc(_affected_rows(status))
+        return status
+
+    async def fetch(self, query, *args, timeout: Optional[float] = None, **kwargs) -> list:
+        if not isinstance(query, Query):
+            return await super().fetch(query, *args, timeout=timeout, **kwargs)
+
+        async def fetch(statement: Optional[PreparedStatement]) -> list:
+            if statement is None:
+                return await super(InstrumentedConnection, self).fetch(
+                    query.sql, *args, timeout=timeout, **kwargs
+                )
+            return await statement.fetch(*args, timeout=timeout)
+        records = await self._run(query, fetch)
+        _rows.labels(query.name).inc(len(records))
+        return records
+
+    async def fetchrow(self, query, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        if not isinstance(query, Query):
+            return await super().fetchrow(query, *args, timeout=timeout, **kwargs)
+
+        records = await self.fetch(query, *args, timeout=timeout, **kwargs)
+        return records[0] if records else None
+
+    async def fetchval(
+        self, query, *args, column: int = 0, timeout: Optional[float] = None
+    ) -> Any:
+        if not isinstance(query, Query):
+            return await super().fetchval(query, *args, column=column, timeout=timeout)
+
+        record = await self.fetchrow(query, *args, timeout=timeout)
+        return record[column] if record else None
+
+    async def _run(
+        self, query: Query, call: Callable[[Optional[PreparedStatement]], Awaitable[T]]
+    ) -> T:
+        started = time.perf_counter()
+        try:
+            try:
+                return await call(await self._prepared(query))
+            except InvalidCachedStatementError:
+                # The schema changed under the statement, it can only be re-prepared outside of
+                # a transaction, which is aborted otherwise
+                self._statements.pop(query.name, None)
+                if self.is_in_transaction():
+                    raise
+                return await call(await self._prepared(query))
+        except Exception as e:
+            _errors.labels(query.name, type(e).__name__).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _duration.labels(query.name).observe(elapsed)
+            if c.slow_query_threshold_ms and elapsed * 1000 >= c.slow_query_threshold_ms:
+                logging.warning(f"Slow query {query.name}: {elapsed * 1000:.1f} ms")
+
+    async def _prepared(self, query: Query) -> Optional[PreparedStatement]:
+        if not query.prepare:
+            return None
+        statement = self._statements.get(query.name)
+        if statement is None:
+            statement = await self.prepare(query.sql)
+            self._statements[query.name] = statement
+        return statement
+
+
+def connect_params() -> dict[str, Any]:
+    """Arguments of `asyncpg.connect` and `create_pool` for the primary, the URL if set."""
+    return dict(
+        dsn=c.url if c.url else None,
+        host=None if c.url else c.host,
+        port=None if c.url else c.port,
+        user=None if c.url else c.user,
+        password=None if c.url else c.password,
+        database=None if c.url else c.name,
+        connection_class=InstrumentedConnection
+    )
+
+
+def _affected_rows(status: str) -> int:
+    """Row count of a command status such as `INSERT 0 5` or `UPDATE 3`."""
+    count = status.rsplit(" ", 1)[-1]
+    return int(count) if count.isdigit() else 0
@@ -0,0 +1,188 @@
+"""
+Versioned schema migrations of `PostgresqlManager`.
+
+Migrations are applied in version order, each in its own transaction together with its row in
+`public.schema_version`, while holding an advisory lock, so only one instance migrates and the
+others wait for it. When the schema is current, a single SELECT is run and no DDL is issued.
+
+Append new migrations to `MIGRATIONS` with the next version, never edit applied ones.
+Statements that can't run in a transaction, e.g. `CREATE INDEX CONCURRENTLY`, go into
+a migration of their own with `transaction=False`; they should be idempotent, since the
+migration is recorded only after they succeeded.
+"""
+import logging
+from typing import NamedTuple
+
+from asyncpg import Connection
+from asyncpg.exceptions import UndefinedTableError
+
+from . import queries as q
+
+MIGRATION_LOCK_ID = 0x6D756C7469746F6F  # pg_advisory_lock key, b"multitoo"
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+    transaction: bool = True
+
+
+# Versions 1-7 predate the runner and are idempotent, they bring schemas created by the DDL
+# previously run on every start up to date.
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(1, "create_tables", """
+        CREATE TABLE IF NOT EXISTS public.users
+        (
+            user_id bigint NOT NULL PRIMARY KEY,
+            user_name TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            full_name TEXT NOT NULL,
+            salt TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS public.services
+        (
+            service_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES public.users(user_id) ON DELETE CASCADE,
+            name TEXT NOT NULL COLLATE "C",
+            password_count INT NOT NULL DEFAULT 0,
+            last_activity TIMESTAMP NOT NULL DEFAULT now(),
+            UNIQUE (user_id, name)
+        );
+
+        CREATE TABLE IF NOT EXISTS public.passwords
+        (
+            password_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES public.users(user_id) ON DELETE CASCADE,
+            service_id BIGINT NOT NULL
+                REFERENCES public.services(service_id) ON DELETE CASCADE,
+            ciphertext TEXT,
+            record BYTEA
+        );
+    """),
+    Migration(2, "key_check_and_kdf_params", """
+        ALTER TABLE public.users ADD COLUMN IF NOT EXISTS key_check TEXT;
+        ALTER TABLE public.users ADD COLUMN IF NOT EXISTS argon2_time_cost INT;
+        ALTER TABLE public.users ADD COLUMN IF NOT EXISTS argon2_memory_cost INT;
+        ALTER TABLE public.users ADD COLUMN IF NOT EXISTS argon2_parallelism INT;
+        -- Users created before the parameters were stored were derived with the argon2-cffi
+        -- defaults the config shipped with
+        UPDATE public.users SET argon2_time_cost = 3, argon2_memory_cost = 65536,
+        argon2_parallelism = 4
+        WHERE argon2_time_cost IS NULL;
+    """),
+    Migration(3, "binary_records", """
+        ALTER TABLE public.passwords ADD COLUMN IF NOT EXISTS record BYTEA;
+        ALTER TABLE public.passwords ALTER COLUMN ciphertext DROP NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_passwords_legacy_record
+        ON public.passwords (password_id) WHERE record IS NULL;
+    """),
+    # Service names used to be repeated in every password row
+    Migration(4, "services_table", """
+        ALTER TABLE public.passwords ADD COLUMN IF NOT EXISTS service_id BIGINT
+            REFERENCES public.services(service_id) ON DELETE CASCADE;
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = 'passwords'
+                AND column_name = 'service'
+            ) THEN
+                INSERT INTO public.services (user_id, name, password_count)
+                SELECT user_id, service, count(*) FROM public.passwords
+                GROUP BY user_id, service
+                ON CONFLICT (user_id, name) DO NOTHING;
+
+                UPDATE public.passwords p SET service_id = s.service_id
+                FROM public.services s WHERE s.user_id = p.user_id AND s.name = p.service;
+
+                ALTER TABLE public.passwords ALTER COLUMN service_id SET NOT NULL;
+                ALTER TABLE public.passwords DROP COLUMN service;
+            END IF;
+        END $$;
+
+        CREATE INDEX IF NOT EXISTS idx_passwords_service_id
+        ON public.passwords (service_id, password_id);
+        CREATE INDEX IF NOT EXISTS idx_passwords_user_id_password_id
+        ON public.passwords (user_id, password_id);
+    """),
+    # Keyed digest of the credentials for import deduplication, NULL until backfilled
+    Migration(5, "fingerprints", """
+        ALTER TABLE public.passwords ADD COLUMN IF NOT EXISTS fingerprint BYTEA;
+        CREATE INDEX IF NOT EXISTS idx_passwords_fingerprint
+        ON public.passwords (service_id, fingerprint);
+    """),
+    # Master Password changes in progress, the vault is re-encrypted up to and including
+    # last_password_id
+    Migration(6, "rekey_jobs", """
+        CREATE TABLE IF NOT EXISTS public.rekey_jobs
+        (
+            user_id BIGINT NOT NULL PRIMARY KEY
+                REFERENCES public.users(user_id) ON DELETE CASCADE,
+            key_check TEXT NOT NULL,
+            argon2_time_cost INT NOT NULL,
+            argon2_memory_cost INT NOT NULL,
+            argon2_parallelism INT NOT NULL,
+            last_password_id BIGINT NOT NULL DEFAULT 0,
+            started_at TIMESTAMP NOT NULL DEFAULT now(),
+            updated_at TIMESTAMP NOT NULL DEFAULT now()
+        );
+    """),
+    # Inline search matches substrings and typos of service names within a user
+    Migration(7, "trigram_search", """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE EXTENSION IF NOT EXISTS btree_gin;
+        CREATE INDEX IF NOT EXISTS idx_services_name_trgm
+        ON public.services USING gin (user_id, name gin_trgm_ops);
+    """),
+)
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def get_schema_version(con: Connection) -> int:
+    """
+    :return: Version of the last applied migration, 0 if none was.
+    """
+    try:
+        return await con.fetchval(q.GET_SCHEMA_VERSION) or 0
+    except UndefinedTableError:
+        return 0
+
+
+def get_pending(version: int) -> list[Migration]:
+    return [migration for migration in MIGRATIONS if migration.version > version]
+
+
+async def migrate(con: Connection) -> int:
+    """
+    Applies the pending migrations, waiting for another instance that is applying them.
+
+    :return: Number of migrations applied by this call.
+    """
+    version = await get_schema_version(con)
+    if version >= LATEST_VERSION:
+        if version > LATEST_VERSION:
+            logging.warning(f"Schema version {version} is newer than {LATEST_VERSION}")
+        return 0
+
+    await con.execute(q.LOCK_MIGRATIONS, MIGRATION_LOCK_ID)
+    try:
+        await con.execute(q.CREATE_SCHEMA_VERSION)
+        # Another instance may have migrated while this one waited for the lock
+        pending = get_pending(await get_schema_version(con))
+        for migration in pending:
+            logging.info(f"Applying migration {migration.version} {migration.name}")
+            if migration.transaction:
+                async with con.transaction():
+                    await con.execute(migration.sql)
+                    await con.execute(q.RECORD_MIGRATION, migration.version, migration.name)
+            else:
+                await con.execute(migration.sql)
+                await con.execute(q.RECORD_MIGRATION, migration.version, migration.name)
+    finally:
+        await con.execute(q.UNLOCK_MIGRATIONS, MIGRATION_LOCK_ID)
+
+    if pending:
+        logging.info(f"Migrated the schema to version {LATEST_VERSION}")
+    return len(pending)
@@ -1,14 +1,44 @@
 import asyncio
 import logging
 import os
-from typing import Optional, cast, Any
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterable, AsyncIterator, Optional, cast, Any
 
-from asyncpg import Pool, Connection, Record, create_pool
+from asyncpg import (
+    CannotConnectNowError, InterfaceError, Pool, PostgresConnectionError, Record, create_pool
+)
 
 from config import bot_cfg, relational_db_cfg as c
-from database import db
-from database.base import AbstractRelationDatabase
-from helpers.pwd_mgr_helper import EncryptedRecord
+from database.base import AbstractRelationDatabase, UnitOfWork
+from helpers.pwd_mgr_helper import (
+    CryptoProfile, EncryptedRecord, ImportResult, KdfParams, RekeyJob
+)
+from utils import LRUCache, metrics
+from . import queries as q
+from .connection import InstrumentedConnection, connect_params
+from .migrations import LATEST_VERSION, get_schema_version, migrate
+from .queries import Query
+from .profile_cache import CryptoProfileCache
+from .registrations import MSG_ERROR_NOT_REGISTERED, Registration, RegistrationBuffer
+
+LEGACY_RECORDS_BATCH_SIZE = 1000
+
+_acquire_wait = metrics.histogram(
+    "db_pool_acquire_wait_seconds", "Time spent waiting for a pooled connection", ("pool",)
+)
+_replica_failures = metrics.counter(
+    "db_replica_failures", "Replica checkouts that failed and fell back to the primary"
+)
+# Connection of the unit of work the current task runs in
+_unit_of_work: ContextVar[Optional[InstrumentedConnection]] = ContextVar(
+    "unit_of_work", default=None
+)
+# Connection failures after which a replica is skipped for `replica_retry_after` seconds
+_REPLICA_ERRORS = (
+    OSError, asyncio.TimeoutError, InterfaceError, PostgresConnectionError, CannotConnectNowError
+)
 
 
 class PostgresqlManager(AbstractRelationDatabase):
@@ -16,206 +46,456 @@ class PostgresqlManager(AbstractRelationDatabase):
     Implementation of a relational database manager for PostgreSQL.
     """
     _pool: Pool = cast(Pool, None)
+    _registrations: RegistrationBuffer = cast(RegistrationBuffer, None)
+    _migration_task: Optional[asyncio.Task] = None
+    _replicas: list[Pool]
+    _replicas_down_until: dict[int, float]
+    _next_replica: int
+
+    def __init__(self) -> None:
+        self._profiles = CryptoProfileCache(
+            c.profile_cache_size, c.profile_cache_local_ttl, c.profile_cache_ttl
+        )
+        # Users who wrote recently, their reads stay on the primary until replicas caught up
+        self._recent_writers: LRUCache[int, bool] = LRUCache(
+            c.replica_recent_writers_size, c.replica_read_after_write
+        )
 
     async def connect(self) -> None:
         """
         Connect to PostgreSQL using DSN if available, otherwise using individual parameters.
+        Replica pools connect lazily, so a replica being down doesn't prevent the start.
         """
         if self._pool is None:
             self._pool = await create_pool(
-                dsn=c.url if c.url else None,
-                host=None if c.url else c.host,
-                port=None if c.url else c.port,
-                user=None if c.url else c.user,
-                password=None if c.url else c.password,
-                database=None if c.url else c.name,
+                **connect_params(),
                 min_size=c.min_pool_size,
                 max_size=c.max_pool_size,
                 max_queries=c.max_queries
             )
             logging.info(f"Connected to PostgreSQL via {'URL' if c.url else 'host/port'}")
+            self._replicas_down_until = {}
+            self._next_replica = 0
+            self._replicas = [
+                await create_pool(
+                    dsn=url,
+                    min_size=0,
+                    max_size=c.max_pool_size,
+                    max_queries=c.max_queries,
+                    connection_class=InstrumentedConnection
+                )
+                for url in c.replica_urls
+            ]
+            if self._replicas:
+                logging.info(f"Routing reads to {len(self._replicas)} PostgreSQL replicas")
             await self._init_db()
+            self._registrations = RegistrationBuffer(
+                self._create_users,
+                interval=c.registration_flush_interval_ms / 1000,
+                batch_size=c.registration_batch_size,
+                max_queued=c.registration_queue_size,
+                seen_size=c.registration_seen_size,
+                seen_ttl=c.registration_seen_ttl
+            )
+            self._registrations.start()
+            self._migration_task = asyncio.create_task(self._migrate_legacy_records())
 
     async def close(self) -> None:
-        await self._pool.close()
+        if self._migration_task is not None:
+            self._migration_task.cancel()
+            try:
+                await self._migration_task
+            except asyncio.CancelledError:
+                pass
+        await self._registrations.close()
+        await asyncio.gather(self._pool.close(), *(pool.close() for pool in self._replicas))
         logging.info("Disconnected from PostgreSQL")
 
-    async def create_user_if_not_exists(self, user_id, user_name, full_name, state):
-        if await db.key_value.get_cache_user_created(state):
+    @asynccontextmanager
+    async def unit_of_work(self, user_id):
+        if _unit_of_work.get() is not None:
+            yield UnitOfWork()
             return
 
-        execute = self._execute(
-            """
-            INSERT INTO public.users (user_id, user_name, full_name, salt)
-            VALUES ($1, $2, $3, $4)
-            ON CONFLICT (user_id) DO NOTHING
-            """,
-            user_id, user_name, full_name, os.urandom(16).hex()
-        )
-        set_cache = db.key_value.set_cache_user_created(state)
-        await asyncio.gather(execute, set_cache)
+        async with self._acquire(writer=user_id) as con:
+            async with con.transaction():
+                token = _unit_of_work.set(con)
+                try:
+                    yield UnitOfWork()
+                finally:
+                    _unit_of_work.reset(token)
 
-    async def get_services(self, user_id, offset, limit = bot_cfg.dynamic_buttons_limit):
+    async def create_user_if_not_exists(self, user_id, user_name, full_name):
+        await self._registrations.add(user_id, user_name, full_name)
+
+    async def get_services(
+        self, user_id, cursor, backward = False, limit = bot_cfg.dynamic_buttons_limit
+    ):
         records = await self._fetch_all(
-            """
-            SELECT service FROM(SELECT DISTINCT ON (service) service, password_id 
-                FROM public.passwords WHERE user_id = $1 ORDER BY service, password_id DESC)
-            ORDER BY password_id DESC
-            OFFSET $2 LIMIT $3
-            """,
-            user_id, offset * limit, limit + 1
+            q.GET_SERVICES_BACKWARD if backward else q.GET_SERVICES,
+            user_id, cursor, limit + 1,
+            reader=user_id
         )
-        return [record.get("service") for record in records]
+        return [tuple(record) for record in records]
 
-    async def create_password(self, user_id, service, ciphertext):
-        await self._execute(
-            "INSERT INTO public.passwords (user_id, service, ciphertext) VALUES ($1, $2, $3)",
-            user_id, service, ciphertext
-        )
+    async def create_password(self, user_id, service, ciphertext, fingerprint):
+        async with self._acquire(writer=user_id) as con:
+            async with con.transaction():
+                service_id = await con.fetchval(q.UPSERT_SERVICE, user_id, service)
+                return await con.fetchval(
+                    q.INSERT_PASSWORD,
+                    user_id, service_id, ciphertext, fingerprint
+                )
 
     async def get_passwords(self, user_id, service, offset, limit = bot_cfg.dynamic_buttons_limit):
         records = await self._fetch_all(
-            """SELECT service, ciphertext FROM public.passwords 
-               WHERE user_id = $1 AND service = $2 OFFSET $3 LIMIT $4""",
-            user_id, service, offset * limit, limit + 1
+            q.GET_PASSWORDS,
+            user_id, service, offset * limit, limit + 1,
+            reader=user_id
         )
-        return [EncryptedRecord(
-            service=record.get("service"),
-            ciphertext=record.get('ciphertext')
-        ) for record in records]
+        return list(map(EncryptedRecord._make, records))
+
+    async def get_password(self, user_id, password_id):
+        record = await self._fetch_row(q.GET_PASSWORD, user_id, password_id, reader=user_id)
+        return EncryptedRecord._make(record) if record else None
 
     async def get_rand_password(self, user_id):
-        record = await self._fetch_row(
-            "SELECT service, ciphertext FROM public.passwords WHERE user_id = $1",
-            user_id
-        )
-        return EncryptedRecord(
-            service=record.get("service"),
-            ciphertext=record.get('ciphertext')
-        ) if record else None
+        record = await self._fetch_row(q.GET_RAND_PASSWORD, user_id, reader=user_id)
+        return EncryptedRecord._make(record) if record else None
 
     async def change_service(self, new_service, user_id, old_service):
-        await self._execute(
-            "UPDATE public.passwords SET service = $1 WHERE user_id = $2 AND service = $3",
-            new_service, user_id, old_service
-        )
+        async with self._acquire(writer=user_id) as con:
+            async with con.transaction():
+                records = await con.fetch(q.LOCK_SERVICES, user_id, old_service, new_service)
+                service_ids = {record.get("name"): record.get("service_id") for record in records}
+                old_id, new_id = service_ids.get(old_service), service_ids.get(new_service)
+                if old_id is None or old_id == new_id:
+                    return
+                if new_id is None:
+                    await con.execute(q.RENAME_SERVICE, old_id, new_service)
+                    return
+
+                # Renaming to an existing service merges both
+                await con.execute(q.MOVE_PASSWORDS, old_id, new_id)
+                await con.execute(q.MERGE_SERVICE_COUNT, old_id, new_id)
+                await con.execute(q.DELETE_SERVICE_BY_ID, old_id)
 
     async def delete_services(self, user_id):
-        await self._execute(
-            "DELETE FROM public.passwords WHERE user_id = $1",
-            user_id
-        )
+        await self._execute(q.DELETE_SERVICES, user_id, writer=user_id)
 
     async def delete_service(self, user_id, service):
-        await self._execute(
-            "DELETE FROM public.passwords WHERE user_id = $1 AND service = $2",
-            user_id, service
-        )
+        await self._execute(q.DELETE_SERVICE, user_id, service, writer=user_id)
 
-    async def delete_password(self, user_id, service, ciphertext):
-        await self._execute(
-            """DELETE FROM public.passwords
-               WHERE user_id = $1 AND service = $2 AND ciphertext = $3""",
-            user_id, service, ciphertext
-        )
+    async def delete_password(self, user_id, password_id):
+        async with self._acquire(writer=user_id) as con:
+            async with con.transaction():
+                service_id = await con.fetchval(q.DELETE_PASSWORD, user_id, password_id)
+                if service_id is None:
+                    return
+                await con.execute(q.DECREMENT_SERVICE_COUNT, service_id)
+                await con.execute(q.DELETE_EMPTY_SERVICE, service_id)
 
     async def delete_passwords(self, user_id):
+        await self._execute(q.DELETE_SERVICES, user_id, writer=user_id)
+
+    async def update_credentials(self, user_id, password_id, ciphertext, fingerprint):
         await self._execute(
-            "DELETE FROM public.passwords WHERE user_id = $1",
-            user_id
+            q.UPDATE_CREDENTIALS, user_id, password_id, ciphertext, fingerprint, writer=user_id
         )
 
-    async def update_credentials(self, user_id, service, current_ciphertext, new_ciphertext):
+    async def set_fingerprints(self, user_id, password_ids, fingerprints):
         await self._execute(
-            """UPDATE public.passwords SET ciphertext = $3
-               WHERE service = $1 AND ciphertext = $2""",
-            service, current_ciphertext, new_ciphertext
+            q.SET_FINGERPRINTS, user_id, password_ids, fingerprints, writer=user_id
         )
 
-    async def import_passwords(self, user_id, encrypted_records):
-        values = [
-            (user_id, r.service, r.ciphertext)
-            for r in encrypted_records
-        ]
+    async def import_passwords(self, user_id, encrypted_batches):
+        async with self._acquire(writer=user_id) as con:
+            async with con.transaction():
+                # Serializes imports of the same user, so they can't both miss a duplicate
+                await con.execute(q.LOCK_USER, user_id)
+                return await self._copy_passwords(con, user_id, encrypted_batches)
 
-        query = """
-        INSERT INTO public.passwords (user_id, service, ciphertext)
-        SELECT * FROM unnest($1::int[], $2::text[], $3::text[])
-        """
+    async def export_passwords(
+        self, user_id, batch_size = c.export_batch_size, unfingerprinted = False
+    ):
+        async with self._acquire(reader=user_id) as con:
+            # Server-side cursors only live inside a transaction
+            async with con.transaction(readonly=True):
+                query = (
+                    q.EXPORT_UNFINGERPRINTED_PASSWORDS if unfingerprinted else q.EXPORT_PASSWORDS
+                )
+                # Cursors aren't instrumented, asyncpg prepares them through its own cache
+                cursor = await con.cursor(query.sql, user_id)
+                while records := await cursor.fetch(batch_size):
+                    yield list(map(EncryptedRecord._make, records))
 
-        await self._execute(
-            query,
-            [v[0] for v in values],  # user_id
-            [v[1] for v in values],  # service
-            [v[2] for v in values]  # ciphertext
+    async def inline_search_service(
+        self, user_id, service, offset = 0, limit = bot_cfg.dynamic_buttons_limit
+    ):
+        records = await self._fetch_all(
+            q.SEARCH_SERVICES,
+            user_id, q.escape_like(service), service, offset, limit + 1,
+            reader=user_id
         )
+        return [record.get("name") for record in records]
 
-    async def export_passwords(self, user_id):
-        records = await self._fetch_all(
-            "SELECT service, ciphertext FROM public.passwords WHERE user_id = $1",
-            user_id
+    async def get_crypto_profile(self, user_id):
+        return await self._profiles.get(user_id, lambda: self._load_crypto_profile(user_id))
+
+    async def _load_crypto_profile(self, user_id: int) -> CryptoProfile:
+        # Always from the primary: a lagging replica could return a profile another instance
+        # just changed, and it would be cached for every instance
+        await self._registrations.wait(user_id)
+        record = await self._fetch_row(q.GET_CRYPTO_PROFILE, user_id)
+        if record is None:
+            raise LookupError(MSG_ERROR_NOT_REGISTERED)
+        return CryptoProfile(
+            salt=record.get("salt").encode("utf-8"),
+            key_check=record.get("key_check"),
+            kdf_params=KdfParams(
+                time_cost=record.get("argon2_time_cost"),
+                memory_cost=record.get("argon2_memory_cost"),
+                parallelism=record.get("argon2_parallelism"),
+            ),
+            rekey_pending=record.get("rekey_pending")
         )
-        return [EncryptedRecord(
-            service=record.get("service"),
-            ciphertext=record.get("ciphertext")
-        ) for record in records]
 
-    async def inline_search_service(self, user_id, service, limit = bot_cfg.dynamic_buttons_limit):
-        records = await self._fetch_all(
-            """SELECT DISTINCT service FROM public.passwords
-               WHERE user_id = $1 AND service LIKE $2 LIMIT $3""",
-            user_id, f"%{service}%", limit
+    async def set_key_check(self, user_id, key_check):
+        await self._execute(q.SET_KEY_CHECK, user_id, key_check, writer=user_id)
+        await self._profiles.invalidate(user_id)
+
+    async def get_rekey_job(self, user_id):
+        record = await self._fetch_row(q.GET_REKEY_JOB, user_id)
+        return _rekey_job(record) if record else None
+
+    async def start_rekey(self, user_id, key_check, kdf_params):
+        record = await self._fetch_row(
+            q.START_REKEY, user_id, key_check, *kdf_params, writer=user_id
+        )
+        await self._profiles.invalidate(user_id)
+        return _rekey_job(record)
+
+    async def count_passwords(self, user_id, after_password_id = 0):
+        return await self._fetch_value(q.COUNT_PASSWORDS, user_id, after_password_id)
+
+    async def get_rekey_batch(self, user_id, after_password_id, limit = c.rekey_batch_size):
+        records = await self._fetch_all(q.GET_REKEY_BATCH, user_id, after_password_id, limit)
+        return list(map(EncryptedRecord._make, records))
+
+    async def rekey_batch(self, user_id, encrypted_records, after_password_id):
+        async with self._acquire(writer=user_id) as con:
+            async with con.transaction():
+                status = await con.execute(
+                    q.MOVE_REKEY_CHECKPOINT,
+                    user_id, after_password_id, encrypted_records[-1].password_id
+                )
+                if status == "UPDATE 0":
+                    return False
+                await con.execute(
+                    q.REKEY_PASSWORDS,
+                    user_id,
+                    [r.password_id for r in encrypted_records],
+                    [r.ciphertext for r in encrypted_records],
+                    [r.fingerprint for r in encrypted_records]
+                )
+                return True
+
+    async def finish_rekey(self, user_id):
+        async with self._acquire(writer=user_id) as con:
+            async with con.transaction():
+                await con.execute(q.FINISH_REKEY, user_id)
+                await con.execute(q.DELETE_REKEY_JOB, user_id)
+        await self._profiles.invalidate(user_id)
+
+    @staticmethod
+    async def _copy_passwords(
+        con: InstrumentedConnection,
+        user_id: int,
+        encrypted_batches: AsyncIterable[list[EncryptedRecord]]
+    ) -> ImportResult:
+        """
+        Streams passwords into a staging table with COPY, then merges the ones whose service
+        doesn't hold the same credentials yet. Must run inside a transaction.
+        """
+        await con.execute(q.CREATE_IMPORT_STAGING)
+        status = await con.copy_records_to_table(
+            "import_staging",
+            records=_staging_rows(encrypted_batches),
+            columns=("service", "record", "fingerprint")
         )
-        return [record.get("service") for record in records]
+        staged = int(status.split()[-1])
+        status = await con.execute(q.MERGE_IMPORT_STAGING, user_id)
+        inserted = int(status.split()[-1])
+        return ImportResult(inserted=inserted, skipped=staged - inserted)
 
-    async def get_salt(self, user_id):
-        salt: str = await self._fetch_value(
-            "SELECT salt FROM public.users WHERE user_id = $1",
-            user_id
+    async def _create_users(self, registrations: list[Registration]) -> None:
+        """Writes a batch of new users, each with a fresh salt and the configured KDF."""
+        user_ids = [registration.user_id for registration in registrations]
+        await self._execute(
+            q.CREATE_USERS,
+            user_ids,
+            [registration.user_name for registration in registrations],
+            [registration.full_name for registration in registrations],
+            [os.urandom(16).hex() for _ in registrations],
+            *KdfParams.current()
         )
-        return salt.encode("utf-8")
+        # Keep their first reads on the primary, replicas may not have the rows yet
+        for user_id in user_ids:
+            self._recent_writers.set(user_id, True)
+
+    @asynccontextmanager
+    async def _acquire(
+        self, reader: Optional[int] = None, writer: Optional[int] = None
+    ) -> AsyncIterator[InstrumentedConnection]:
+        """
+        Checks out a connection of the primary, or of a replica for read-only work on behalf of
+        the `reader` user. `writer` keeps that user's reads on the primary for a while.
+        A user whose registration is still buffered is written first. Within a unit of work,
+        its connection is used for both.
+        """
+        con = _unit_of_work.get()
+        if con is not None:
+            yield con
+            return
+
+        user_id = writer if writer is not None else reader
+        if user_id is not None:
+            await self._registrations.wait(user_id)
+
+        started = time.perf_counter()
+        if reader is not None and self._recent_writers.get(reader) is None:
+            replica = await self._acquire_replica()
+            if replica is not None:
+                index, con = replica
+                _acquire_wait.labels("replica").observe(time.perf_counter() - started)
+                try:
+                    yield con
+                except _REPLICA_ERRORS as e:
+                    self._replica_failed(index, e)
+                    raise
+                finally:
+                    await self._replicas[index].release(con)
+                return
 
-    async def _execute(self, query, *args) -> None:
         async with self._pool.acquire() as con:
-            con: Connection
+            _acquire_wait.labels("primary").observe(time.perf_counter() - started)
+            try:
+                yield con
+            finally:
+                if writer is not None:
+                    self._recent_writers.set(writer, True)
+
+    async def _acquire_replica(self) -> Optional[tuple[int, InstrumentedConnection]]:
+        """Round-robins over healthy replicas, None if there is none to read from."""
+        for _ in range(len(self._replicas)):
+            index = self._next_replica % len(self._replicas)
+            self._next_replica += 1
+            if self._replicas_down_until.get(index, 0) > time.monotonic():
+                continue
+            try:
+                return index, await self._replicas[index].acquire(
+                    timeout=c.replica_acquire_timeout
+                )
+            except _REPLICA_ERRORS as e:
+                self._replica_failed(index, e)
+        return None
+
+    def _replica_failed(self, index: int, error: BaseException) -> None:
+        self._replicas_down_until[index] = time.monotonic() + c.replica_retry_after
+        _replica_failures.inc()
+        logging.warning(f"PostgreSQL replica {index} is unavailable: {error!r}")
+
+    async def _execute(
+        self, query: Query | str, *args, writer: Optional[int] = None
+    ) -> None:
+        async with self._acquire(writer=writer) as con:
             await con.execute(query, *args)
 
-    async def _fetch_row(self, query, *args) -> Optional[Record]:
-        async with self._pool.acquire() as con:
-            con: Connection
+    async def _fetch_row(
+        self, query: Query | str, *args, reader: Optional[int] = None, writer: Optional[int] = None
+    ) -> Optional[Record]:
+        try:
+            async with self._acquire(reader, writer) as con:
+                return await con.fetchrow(query, *args)
+        except _REPLICA_ERRORS:
+            if reader is None or not self._replicas:
+                raise
+        # The replica failed mid-query, it is skipped now
+        async with self._acquire() as con:
             return await con.fetchrow(query, *args)
 
-    async def _fetch_value(self, query, *args) -> Any:
-        async with self._pool.acquire() as con:
-            con: Connection
+    async def _fetch_value(self, query: Query | str, *args) -> Any:
+        async with self._acquire() as con:
             return await con.fetchval(query, *args)
 
-    async def _fetch_all(self, query, *args) -> list[Record]:
-        async with self._pool.acquire() as con:
-            con: Connection
+    async def _fetch_all(
+        self, query: Query | str, *args, reader: Optional[int] = None
+    ) -> list[Record]:
+        try:
+            async with self._acquire(reader) as con:
+                return await con.fetch(query, *args)
+        except _REPLICA_ERRORS:
+            if reader is None or not self._replicas:
+                raise
+        # The replica failed mid-query, it is skipped now
+        async with self._acquire() as con:
             return await con.fetch(query, *args)
 
     async def _init_db(self) -> None:
-        await self._execute(
-            '''
-            CREATE TABLE IF NOT EXISTS public.users
-            (
-                user_id bigint NOT NULL PRIMARY KEY,
-                user_name TEXT,
-                created_at TIMESTAMP NOT NULL DEFAULT now(),
-                full_name TEXT NOT NULL,
-                salt TEXT NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS public.passwords
-            (
-                password_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
-                user_id BIGINT NOT NULL REFERENCES public.users(user_id) ON DELETE CASCADE,
-                service TEXT NOT NULL COLLATE "C",
-                ciphertext TEXT NOT NULL
-            );
-
-            CREATE INDEX IF NOT EXISTS idx_passwords_user_id_service
-            ON public.passwords (user_id, service)
-            '''
-        )
+        """
+        Brings the schema up to date, or only checks it is when migrations run ahead of deploys.
+
+        :raise RuntimeError: If the schema is behind and `migrate_on_connect` is disabled.
+        """
+        async with self._pool.acquire() as con:
+            if c.migrate_on_connect:
+                await migrate(con)
+                return
+            version = await get_schema_version(con)
+        if version < LATEST_VERSION:
+            raise RuntimeError(
+                f"Schema version {version} is behind {LATEST_VERSION}, "
+                "run python -m tools.migrate"
+            )
+
+    async def _migrate_legacy_records(self) -> None:
+        """
+        Converts base64 TEXT ciphertexts to the binary record column in small batches,
+        so the table stays available while the migration runs. A failed run is logged and
+        retried on the next start.
+        """
+        converted = 0
+        try:
+            while True:
+                status = await self._fetch_value(
+                    q.MIGRATE_LEGACY_RECORDS, LEGACY_RECORDS_BATCH_SIZE
+                )
+                if not status:
+                    break
+                converted += status
+                await asyncio.sleep(0)
+        except Exception as e:
+            logging.error(f"Failed to convert legacy password records: {e}")
+
+        if converted:
+            logging.info(f"Converted {converted} legacy password records to binary format")
+
+
+async def _staging_rows(
+    encrypted_batches: AsyncIterable[list[EncryptedRecord]]
+) -> AsyncIterator[tuple[str, bytes, bytes]]:
+    async for batch in encrypted_batches:
+        for record in batch:
+            yield record.service, record.ciphertext, record.fingerprint
+
+
+def _rekey_job(record: Record) -> RekeyJob:
+    return RekeyJob(
+        key_check=record.get("key_check"),
+        kdf_params=KdfParams(
+            time_cost=record.get("argon2_time_cost"),
+            memory_cost=record.get("argon2_memory_cost"),
+            parallelism=record.get("argon2_parallelism"),
+        ),
+        last_password_id=record.get("last_password_id")
+    )
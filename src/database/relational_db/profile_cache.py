@@ -0,0 +1,50 @@
+import os
+from typing import Awaitable, Callable, Optional
+
+from database import db
+from helpers.pwd_mgr_helper import CryptoProfile
+from utils import LRUCache
+
+
+class CryptoProfileCache:
+    """
+    Crypto profiles cached in-process in front of the key-value store, which every instance
+    shares. Invalidating a profile gives it a new version in the key-value store. Both tiers
+    only serve a profile stored under the current version, so a change made by any instance is
+    seen by the others on their next read.
+    """
+
+    def __init__(self, size: int, local_ttl: float, ttl: int) -> None:
+        self.ttl = ttl
+        self._local: LRUCache[int, tuple[Optional[str], CryptoProfile]] = LRUCache(
+            size, local_ttl
+        )
+
+    async def get(
+        self, user_id: int, load: Callable[[], Awaitable[CryptoProfile]]
+    ) -> CryptoProfile:
+        """
+        Returns the cached profile of the user, or the one `load` reads from the database.
+        """
+        # Read first: a profile loaded after a concurrent invalidation is then stored under the
+        # old version and never served
+        version = await db.key_value.get_crypto_profile_version(user_id)
+        entry = self._local.get(user_id)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        cached = await db.key_value.get_crypto_profile(user_id, version)
+        if cached is not None:
+            profile = CryptoProfile.from_json(cached)
+        else:
+            profile = await load()
+            await db.key_value.set_crypto_profile(user_id, version, profile.to_json(), self.ttl)
+        self._local.set(user_id, (version, profile))
+        return profile
+
+    async def invalidate(self, user_id: int) -> None:
+        self._local.pop(user_id)
+        # Outlives the profiles stored under the previous version, they are never served again
+        await db.key_value.set_crypto_profile_version(
+            user_id, os.urandom(8).hex(), self.ttl * 2
+        )
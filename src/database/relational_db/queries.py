@@ -0,0 +1,275 @@
+"""
+Named queries of `PostgresqlManager`. Each is registered once at import and prepared once per
+connection by `InstrumentedConnection`; its name labels the query metrics.
+"""
+from typing import NamedTuple
+
+
+class Query(NamedTuple):
+    """
+    A registered SQL statement. DDL and statements on temporary tables are not kept prepared,
+    the latter since the tables are recreated by every transaction.
+    """
+    name: str
+    sql: str
+    prepare: bool = True
+
+
+_registry: dict[str, Query] = {}
+
+
+def query(name: str, sql: str, prepare: bool = True) -> Query:
+    """
+    Registers a named query.
+
+    :raise ValueError: If the name is already taken.
+    """
+    if name in _registry:
+        raise ValueError(f"Query {name} is already registered")
+    _registry[name] = Query(name, sql, prepare)
+    return _registry[name]
+
+
+def get_queries() -> tuple[Query, ...]:
+    return tuple(_registry.values())
+
+
+def escape_like(text: str) -> str:
+    """Escapes the LIKE wildcards, so the text is matched literally."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# Versioned binary record. Rows not migrated yet keep base64 TEXT in `ciphertext` and are read
+# as the legacy format version 0.
+RECORD = r"""COALESCE(
+    record, '\x00'::bytea || decode(translate(ciphertext, '-_', '+/'), 'base64')
+)"""
+ENCRYPTED_RECORD = f"s.name AS service, {RECORD} AS ciphertext, p.password_id, p.fingerprint"
+REKEY_JOB = "key_check, argon2_time_cost, argon2_memory_cost, argon2_parallelism, last_password_id"
+
+CREATE_SCHEMA_VERSION = query("create_schema_version", """
+    CREATE TABLE IF NOT EXISTS public.schema_version
+    (
+        version INT NOT NULL PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+""", prepare=False)
+GET_SCHEMA_VERSION = query(
+    "get_schema_version", "SELECT max(version) FROM public.schema_version"
+)
+RECORD_MIGRATION = query(
+    "record_migration", "INSERT INTO public.schema_version (version, name) VALUES ($1, $2)"
+)
+LOCK_MIGRATIONS = query("lock_migrations", "SELECT pg_advisory_lock($1)")
+UNLOCK_MIGRATIONS = query("unlock_migrations", "SELECT pg_advisory_unlock($1)")
+
+CREATE_USERS = query("create_users", """
+    INSERT INTO public.users (
+        user_id, user_name, full_name, salt,
+        argon2_time_cost, argon2_memory_cost, argon2_parallelism
+    )
+    SELECT t.user_id, t.user_name, t.full_name, t.salt, $5, $6, $7
+    FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[])
+        AS t(user_id, user_name, full_name, salt)
+    ON CONFLICT (user_id) DO NOTHING
+""")
+LOCK_USER = query("lock_user", "SELECT 1 FROM public.users WHERE user_id = $1 FOR UPDATE")
+GET_CRYPTO_PROFILE = query("get_crypto_profile", """
+    SELECT salt, key_check, argon2_time_cost, argon2_memory_cost, argon2_parallelism,
+    EXISTS (SELECT 1 FROM public.rekey_jobs j WHERE j.user_id = u.user_id) AS rekey_pending
+    FROM public.users u WHERE user_id = $1
+""")
+SET_KEY_CHECK = query(
+    "set_key_check", "UPDATE public.users SET key_check = $2 WHERE user_id = $1"
+)
+
+_SERVICES_PAGE = """
+    SELECT name, service_id FROM public.services
+    WHERE user_id = $1 AND name {start} COALESCE(
+        (SELECT name FROM public.services WHERE user_id = $1 AND service_id = $2), ''
+    )
+    ORDER BY name {order} LIMIT $3
+"""
+GET_SERVICES = query("get_services", _SERVICES_PAGE.format(start=">=", order="ASC"))
+GET_SERVICES_BACKWARD = query(
+    "get_services_backward", _SERVICES_PAGE.format(start="<", order="DESC")
+)
+UPSERT_SERVICE = query("upsert_service", """
+    INSERT INTO public.services (user_id, name, password_count)
+    VALUES ($1, $2, 1)
+    ON CONFLICT (user_id, name) DO UPDATE
+    SET password_count = services.password_count + 1, last_activity = now()
+    RETURNING service_id
+""")
+LOCK_SERVICES = query("lock_services", """
+    SELECT service_id, name FROM public.services
+    WHERE user_id = $1 AND name IN ($2, $3) FOR UPDATE
+""")
+RENAME_SERVICE = query("rename_service", """
+    UPDATE public.services SET name = $2, last_activity = now() WHERE service_id = $1
+""")
+MOVE_PASSWORDS = query(
+    "move_passwords", "UPDATE public.passwords SET service_id = $2 WHERE service_id = $1"
+)
+MERGE_SERVICE_COUNT = query("merge_service_count", """
+    UPDATE public.services SET last_activity = now(),
+    password_count = password_count + (
+        SELECT password_count FROM public.services WHERE service_id = $1
+    )
+    WHERE service_id = $2
+""")
+DELETE_SERVICE_BY_ID = query(
+    "delete_service_by_id", "DELETE FROM public.services WHERE service_id = $1"
+)
+DELETE_SERVICES = query("delete_services", "DELETE FROM public.services WHERE user_id = $1")
+DELETE_SERVICE = query(
+    "delete_service", "DELETE FROM public.services WHERE user_id = $1 AND name = $2"
+)
+DECREMENT_SERVICE_COUNT = query("decrement_service_count", """
+    UPDATE public.services SET password_count = password_count - 1, last_activity = now()
+    WHERE service_id = $1
+""")
+DELETE_EMPTY_SERVICE = query(
+    "delete_empty_service",
+    "DELETE FROM public.services WHERE service_id = $1 AND password_count <= 0"
+)
+# Prefix matches first, then substring matches, then fuzzy ones, each by similarity to the
+# text. $2 is the text escaped for LIKE, $3 the text as typed.
+SEARCH_SERVICES = query("search_services", """
+    SELECT name FROM public.services
+    WHERE user_id = $1 AND (name ILIKE '%' || $2 || '%' OR $3 <% name)
+    ORDER BY
+        CASE
+            WHEN name ILIKE $2 || '%' THEN 0
+            WHEN name ILIKE '%' || $2 || '%' THEN 1
+            ELSE 2
+        END,
+        word_similarity($3, name) DESC, name
+    OFFSET $4 LIMIT $5
+""")
+
+INSERT_PASSWORD = query("insert_password", """
+    INSERT INTO public.passwords (user_id, service_id, record, fingerprint)
+    VALUES ($1, $2, $3, $4) RETURNING password_id
+""")
+GET_PASSWORDS = query("get_passwords", f"""
+    SELECT {ENCRYPTED_RECORD}
+    FROM public.services s JOIN public.passwords p USING (service_id)
+    WHERE s.user_id = $1 AND s.name = $2
+    ORDER BY p.password_id OFFSET $3 LIMIT $4
+""")
+GET_PASSWORD = query("get_password", f"""
+    SELECT {ENCRYPTED_RECORD}
+    FROM public.passwords p JOIN public.services s USING (service_id)
+    WHERE p.password_id = $2 AND p.user_id = $1
+""")
+GET_RAND_PASSWORD = query("get_rand_password", f"""
+    SELECT {ENCRYPTED_RECORD}
+    FROM public.passwords p JOIN public.services s USING (service_id)
+    WHERE p.user_id = $1 LIMIT 1
+""")
+DELETE_PASSWORD = query("delete_password", """
+    DELETE FROM public.passwords WHERE password_id = $2 AND user_id = $1 RETURNING service_id
+""")
+UPDATE_CREDENTIALS = query("update_credentials", """
+    WITH updated AS (
+        UPDATE public.passwords SET record = $3, ciphertext = NULL, fingerprint = $4
+        WHERE password_id = $2 AND user_id = $1
+        RETURNING service_id
+    )
+    UPDATE public.services SET last_activity = now()
+    WHERE service_id IN (SELECT service_id FROM updated)
+""")
+SET_FINGERPRINTS = query("set_fingerprints", """
+    UPDATE public.passwords p SET fingerprint = t.fingerprint
+    FROM unnest($2::bigint[], $3::bytea[]) AS t(password_id, fingerprint)
+    WHERE p.password_id = t.password_id AND p.user_id = $1
+""")
+EXPORT_PASSWORDS = query("export_passwords", f"""
+    SELECT {ENCRYPTED_RECORD}
+    FROM public.passwords p JOIN public.services s USING (service_id)
+    WHERE p.user_id = $1
+""")
+EXPORT_UNFINGERPRINTED_PASSWORDS = query("export_unfingerprinted_passwords", f"""
+    SELECT {ENCRYPTED_RECORD}
+    FROM public.passwords p JOIN public.services s USING (service_id)
+    WHERE p.user_id = $1 AND p.fingerprint IS NULL
+""")
+COUNT_PASSWORDS = query("count_passwords", """
+    SELECT count(*) FROM public.passwords WHERE user_id = $1 AND password_id > $2
+""")
+MIGRATE_LEGACY_RECORDS = query("migrate_legacy_records", f"""
+    WITH batch AS (
+        SELECT password_id FROM public.passwords WHERE record IS NULL
+        LIMIT $1 FOR UPDATE SKIP LOCKED
+    ), updated AS (
+        UPDATE public.passwords p SET record = {RECORD}, ciphertext = NULL
+        FROM batch WHERE p.password_id = batch.password_id
+        RETURNING 1
+    )
+    SELECT count(*) FROM updated
+""")
+
+CREATE_IMPORT_STAGING = query("create_import_staging", """
+    CREATE TEMPORARY TABLE import_staging (
+        service TEXT COLLATE "C", record BYTEA, fingerprint BYTEA
+    ) ON COMMIT DROP
+""", prepare=False)
+MERGE_IMPORT_STAGING = query("merge_import_staging", """
+    WITH input AS (
+        SELECT DISTINCT ON (service, fingerprint) service, record, fingerprint
+        FROM import_staging st
+        WHERE NOT EXISTS (
+            SELECT 1 FROM public.services s JOIN public.passwords p USING (service_id)
+            WHERE s.user_id = $1 AND s.name = st.service AND p.fingerprint = st.fingerprint
+        )
+    ), upserted AS (
+        INSERT INTO public.services (user_id, name, password_count)
+        SELECT $1, service, count(*) FROM input GROUP BY service
+        ON CONFLICT (user_id, name) DO UPDATE
+        SET password_count = services.password_count + EXCLUDED.password_count,
+            last_activity = now()
+        RETURNING service_id, name
+    )
+    INSERT INTO public.passwords (user_id, service_id, record, fingerprint)
+    SELECT $1, upserted.service_id, input.record, input.fingerprint
+    FROM input JOIN upserted ON upserted.name = input.service
+""", prepare=False)
+
+GET_REKEY_JOB = query(
+    "get_rekey_job", f"SELECT {REKEY_JOB} FROM public.rekey_jobs WHERE user_id = $1"
+)
+START_REKEY = query("start_rekey", f"""
+    INSERT INTO public.rekey_jobs (user_id, key_check, argon2_time_cost,
+        argon2_memory_cost, argon2_parallelism)
+    VALUES ($1, $2, $3, $4, $5)
+    -- A no-op update, so the row of an interrupted job is returned
+    ON CONFLICT (user_id) DO UPDATE SET user_id = EXCLUDED.user_id
+    RETURNING {REKEY_JOB}
+""")
+GET_REKEY_BATCH = query("get_rekey_batch", f"""
+    SELECT {ENCRYPTED_RECORD}
+    FROM public.passwords p JOIN public.services s USING (service_id)
+    WHERE p.user_id = $1 AND p.password_id > $2
+    ORDER BY p.password_id LIMIT $3
+""")
+# Moves the checkpoint only if no one else did since the batch was read
+MOVE_REKEY_CHECKPOINT = query("move_rekey_checkpoint", """
+    UPDATE public.rekey_jobs SET last_password_id = $3, updated_at = now()
+    WHERE user_id = $1 AND last_password_id = $2
+""")
+REKEY_PASSWORDS = query("rekey_passwords", """
+    UPDATE public.passwords p
+    SET record = t.record, ciphertext = NULL, fingerprint = t.fingerprint
+    FROM unnest($2::bigint[], $3::bytea[], $4::bytea[]) AS t(password_id, record, fingerprint)
+    WHERE p.password_id = t.password_id AND p.user_id = $1
+""")
+FINISH_REKEY = query("finish_rekey", """
+    UPDATE public.users u SET key_check = j.key_check,
+    argon2_time_cost = j.argon2_time_cost,
+    argon2_memory_cost = j.argon2_memory_cost,
+    argon2_parallelism = j.argon2_parallelism
+    FROM public.rekey_jobs j WHERE j.user_id = u.user_id AND u.user_id = $1
+""")
+DELETE_REKEY_JOB = query("delete_rekey_job", "DELETE FROM public.rekey_jobs WHERE user_id = $1")
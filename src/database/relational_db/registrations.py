@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from utils import LRUCache, metrics
+
+MSG_ERROR_NOT_REGISTERED = "You are not registered yet, send /start"
+
+_batch_size = metrics.histogram(
+    "db_registration_batch_size", "Users written per registration flush",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+_lag = metrics.histogram(
+    "db_registration_lag_seconds", "Time from /start until the user row was written"
+)
+_queued = metrics.gauge("db_registration_queue", "Registrations waiting to be written")
+_flush_errors = metrics.counter("db_registration_flush_errors", "Failed registration flushes")
+
+
+class Registration(NamedTuple):
+    user_id: int
+    user_name: Optional[str]
+    full_name: str
+    queued_at: float
+
+
+class RegistrationBuffer:
+    """
+    Write-behind buffer of new users. Registrations are collected and written by `write` in
+    one statement every `interval` seconds, or as soon as `batch_size` of them are queued.
+    At `max_queued`, adding waits for a flush, so a burst can't grow the queue unbounded.
+
+    Users registered by this process are remembered for `seen_ttl` seconds and not queued again.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[list[Registration]], Awaitable[None]],
+        interval: float,
+        batch_size: int,
+        max_queued: int,
+        seen_size: int,
+        seen_ttl: float
+    ) -> None:
+        self._write = write
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_queued = max_queued
+        self._queued: dict[int, Registration] = {}
+        self._in_flight: dict[int, Registration] = {}
+        self._seen: LRUCache[int, bool] = LRUCache(seen_size, seen_ttl)
+        self._lock = asyncio.Lock()
+        self._has_queued = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stops the periodic flush and writes what is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logging.error(f"Lost {len(self._queued)} registrations: {e!r}")
+
+    async def add(self, user_id: int, user_name: Optional[str], full_name: str) -> None:
+        if self._seen.get(user_id) or user_id in self._queued or user_id in self._in_flight:
+            return
+        while len(self._queued) >= self.max_queued:
+            await self.flush()
+
+        self._queued[user_id] = Registration(user_id, user_name, full_name, time.monotonic())
+        _queued.set(len(self._queued))
+        self._has_queued.set()
+        if len(self._queued) >= self.batch_size:
+            self._full.set()
+
+    async def wait(self, user_id: int) -> None:
+        """Writes the user now if they are still queued, so their row can be used."""
+        if user_id in self._queued or user_id in self._in_flight:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Writes all queued users. Users of a failed write are queued again.
+
+        :raise Exception: The error of the write.
+        """
+        async with self._lock:
+            if not self._queued:
+                return
+            self._in_flight, self._queued = self._queued, {}
+            self._has_queued.clear()
+            self._full.clear()
+            _queued.set(0)
+            batch = list(self._in_flight.values())
+            try:
+                await self._write(batch)
+                for registration in batch:
+                    self._seen.set(registration.user_id, True)
+            except Exception:
+                _flush_errors.inc()
+                self._queued = {**self._in_flight, **self._queued}
+                _queued.set(len(self._queued))
+                self._has_queued.set()
+                raise
+            finally:
+                self._in_flight = {}
+
+        flushed_at = time.monotonic()
+        _batch_size.observe(len(batch))
+        for registration in batch:
+            _lag.observe(flushed_at - registration.queued_at)
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_queued.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Failed to write {len(self._queued)} registrations: {e!r}")
+                await asyncio.sleep(self.interval)
@@ -0,0 +1,480 @@
+import asyncio
+import itertools
+import logging
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Callable, Optional, cast
+
+from config import bot_cfg, relational_db_cfg as c
+from database.base import AbstractRelationDatabase, UnitOfWork
+from helpers.pwd_mgr_helper import (
+    CryptoProfile, EncryptedRecord, ImportResult, KdfParams, RekeyJob
+)
+from . import sqlite_queries as q
+from .queries import escape_like
+from .profile_cache import CryptoProfileCache
+from .registrations import MSG_ERROR_NOT_REGISTERED, Registration, RegistrationBuffer
+
+BUSY_TIMEOUT = 30  # seconds a statement waits for a lock held by another process
+FUZZY_THRESHOLD = 0.6  # as pg_trgm.word_similarity_threshold
+
+_WORDS = re.compile(r"[^\W_]+")
+# Whether the current task runs in a unit of work, whose transaction is open on the writer
+_in_unit_of_work: ContextVar[bool] = ContextVar("in_unit_of_work", default=False)
+
+
+class SqliteManager(AbstractRelationDatabase):
+    """
+    Implementation of a relational database manager for SQLite, for single-node deployments.
+
+    The database is in WAL mode, so reads don't block the writes. Writes run one at a time in
+    a transaction on the only writer connection, reads on a pool of read-only connections, each
+    in a thread so the event loop isn't blocked. One process should use a database file.
+    A unit of work holds the writer for its whole transaction, its reads go to the writer too.
+    """
+    _writer: sqlite3.Connection = cast(sqlite3.Connection, None)
+    _registrations: RegistrationBuffer = cast(RegistrationBuffer, None)
+    _import_ids = itertools.count()
+
+    def __init__(self, path: str = c.sqlite_path) -> None:
+        self.path = path
+        self._profiles = CryptoProfileCache(
+            c.profile_cache_size, c.profile_cache_local_ttl, c.profile_cache_ttl
+        )
+
+    async def connect(self) -> None:
+        if self._writer is not None:
+            return
+
+        self._writer_executor = ThreadPoolExecutor(1, thread_name_prefix="sqlite-writer")
+        self._write_lock = asyncio.Lock()
+        self._reader_executor = ThreadPoolExecutor(
+            c.sqlite_read_connections, thread_name_prefix="sqlite-reader"
+        )
+        loop = asyncio.get_running_loop()
+        self._writer = await loop.run_in_executor(
+            self._writer_executor, _connect, self.path, False
+        )
+        await self._init_db()
+
+        self._readers: asyncio.Queue[sqlite3.Connection] = asyncio.Queue()
+        for _ in range(c.sqlite_read_connections):
+            self._readers.put_nowait(
+                await loop.run_in_executor(self._reader_executor, _connect, self.path, True)
+            )
+        logging.info(f"Connected to SQLite database {self.path}")
+
+        self._registrations = RegistrationBuffer(
+            self._create_users,
+            interval=c.registration_flush_interval_ms / 1000,
+            batch_size=c.registration_batch_size,
+            max_queued=c.registration_queue_size,
+            seen_size=c.registration_seen_size,
+            seen_ttl=c.registration_seen_ttl
+        )
+        self._registrations.start()
+
+    async def close(self) -> None:
+        await self._registrations.close()
+        loop = asyncio.get_running_loop()
+        while not self._readers.empty():
+            await loop.run_in_executor(self._reader_executor, self._readers.get_nowait().close)
+        await loop.run_in_executor(self._writer_executor, self._writer.close)
+        self._reader_executor.shutdown()
+        self._writer_executor.shutdown()
+        logging.info("Disconnected from SQLite")
+
+    @asynccontextmanager
+    async def unit_of_work(self, user_id):
+        if _in_unit_of_work.get():
+            yield UnitOfWork()
+            return
+
+        await self._registrations.wait(user_id)
+        loop = asyncio.get_running_loop()
+        async with self._write_lock:
+            await loop.run_in_executor(
+                self._writer_executor, self._writer.execute, "BEGIN IMMEDIATE"
+            )
+            token = _in_unit_of_work.set(True)
+            try:
+                yield UnitOfWork()
+            except BaseException:
+                await loop.run_in_executor(self._writer_executor, self._writer.execute, "ROLLBACK")
+                raise
+            finally:
+                _in_unit_of_work.reset(token)
+            await loop.run_in_executor(self._writer_executor, self._writer.execute, "COMMIT")
+
+    async def create_user_if_not_exists(self, user_id, user_name, full_name):
+        await self._registrations.add(user_id, user_name, full_name)
+
+    async def get_services(
+        self, user_id, cursor, backward = False, limit = bot_cfg.dynamic_buttons_limit
+    ):
+        records = await self._fetch_all(
+            q.GET_SERVICES_BACKWARD if backward else q.GET_SERVICES,
+            user_id, cursor, limit + 1,
+            user_id=user_id
+        )
+        return [tuple(record) for record in records]
+
+    async def create_password(self, user_id, service, ciphertext, fingerprint):
+        def create(con: sqlite3.Connection) -> int:
+            service_id = con.execute(q.UPSERT_SERVICE, (user_id, service)).fetchone()[0]
+            return con.execute(
+                q.INSERT_PASSWORD, (user_id, service_id, ciphertext, fingerprint)
+            ).fetchone()[0]
+        return await self._write(create, user_id=user_id)
+
+    async def get_passwords(self, user_id, service, offset, limit = bot_cfg.dynamic_buttons_limit):
+        records = await self._fetch_all(
+            q.GET_PASSWORDS,
+            user_id, service, offset * limit, limit + 1,
+            user_id=user_id
+        )
+        return list(map(EncryptedRecord._make, records))
+
+    async def get_password(self, user_id, password_id):
+        record = await self._fetch_row(q.GET_PASSWORD, user_id, password_id, user_id=user_id)
+        return EncryptedRecord._make(record) if record else None
+
+    async def get_rand_password(self, user_id):
+        record = await self._fetch_row(q.GET_RAND_PASSWORD, user_id, user_id=user_id)
+        return EncryptedRecord._make(record) if record else None
+
+    async def change_service(self, new_service, user_id, old_service):
+        def change(con: sqlite3.Connection) -> None:
+            records = con.execute(q.GET_SERVICE_IDS, (user_id, old_service, new_service))
+            service_ids = {record["name"]: record["service_id"] for record in records}
+            old_id, new_id = service_ids.get(old_service), service_ids.get(new_service)
+            if old_id is None or old_id == new_id:
+                return
+            if new_id is None:
+                con.execute(q.RENAME_SERVICE, (old_id, new_service))
+                return
+
+            # Renaming to an existing service merges both
+            con.execute(q.MOVE_PASSWORDS, (old_id, new_id))
+            con.execute(q.MERGE_SERVICE_COUNT, (old_id, new_id))
+            con.execute(q.DELETE_SERVICE_BY_ID, (old_id,))
+        await self._write(change, user_id=user_id)
+
+    async def delete_services(self, user_id):
+        await self._execute(q.DELETE_SERVICES, user_id, user_id=user_id)
+
+    async def delete_service(self, user_id, service):
+        await self._execute(q.DELETE_SERVICE, user_id, service, user_id=user_id)
+
+    async def delete_password(self, user_id, password_id):
+        def delete(con: sqlite3.Connection) -> None:
+            record = con.execute(q.DELETE_PASSWORD, (user_id, password_id)).fetchone()
+            if record is None:
+                return
+            con.execute(q.DECREMENT_SERVICE_COUNT, (record["service_id"],))
+            con.execute(q.DELETE_EMPTY_SERVICE, (record["service_id"],))
+        await self._write(delete, user_id=user_id)
+
+    async def delete_passwords(self, user_id):
+        await self._execute(q.DELETE_SERVICES, user_id, user_id=user_id)
+
+    async def update_credentials(self, user_id, password_id, ciphertext, fingerprint):
+        def update(con: sqlite3.Connection) -> None:
+            record = con.execute(
+                q.UPDATE_CREDENTIALS, (user_id, password_id, ciphertext, fingerprint)
+            ).fetchone()
+            if record is not None:
+                con.execute(q.TOUCH_SERVICE, (record["service_id"],))
+        await self._write(update, user_id=user_id)
+
+    async def set_fingerprints(self, user_id, password_ids, fingerprints):
+        await self._write(
+            lambda con: con.executemany(
+                q.SET_FINGERPRINT,
+                ((user_id, password_id, fingerprint)
+                 for password_id, fingerprint in zip(password_ids, fingerprints))
+            ),
+            user_id=user_id
+        )
+
+    async def import_passwords(self, user_id, encrypted_batches):
+        """
+        Stages the batches one write transaction each, so other writes can interleave with
+        the encryption, then merges them in one.
+        """
+        table = f"import_staging_{next(self._import_ids)}"
+        await self._write(lambda con: con.execute(q.CREATE_IMPORT_STAGING.format(table=table)))
+        try:
+            staged = 0
+            async for batch in encrypted_batches:
+                await self._write(
+                    lambda con: con.executemany(
+                        q.INSERT_IMPORT_STAGING.format(table=table),
+                        [(r.service, r.ciphertext, r.fingerprint) for r in batch]
+                    ),
+                    user_id=user_id
+                )
+                staged += len(batch)
+
+            def merge(con: sqlite3.Connection) -> int:
+                con.execute(q.DELETE_STAGED_DUPLICATES.format(table=table), (user_id,))
+                con.execute(q.UPSERT_STAGED_SERVICES.format(table=table), (user_id,))
+                return con.execute(
+                    q.INSERT_STAGED_PASSWORDS.format(table=table), (user_id,)
+                ).rowcount
+            inserted = await self._write(merge)
+        finally:
+            await self._write(lambda con: con.execute(q.DROP_IMPORT_STAGING.format(table=table)))
+        return ImportResult(inserted=inserted, skipped=staged - inserted)
+
+    async def export_passwords(
+        self, user_id, batch_size = c.export_batch_size, unfingerprinted = False
+    ):
+        query = q.EXPORT_UNFINGERPRINTED_PASSWORDS if unfingerprinted else q.EXPORT_PASSWORDS
+        after_password_id = 0
+        while records := await self._fetch_all(
+            query, user_id, after_password_id, batch_size, user_id=user_id
+        ):
+            batch = list(map(EncryptedRecord._make, records))
+            after_password_id = batch[-1].password_id
+            yield batch
+
+    async def inline_search_service(
+        self, user_id, service, offset = 0, limit = bot_cfg.dynamic_buttons_limit
+    ):
+        records = await self._fetch_all(
+            q.SEARCH_SERVICES,
+            user_id, escape_like(service), service, offset, limit + 1, FUZZY_THRESHOLD,
+            user_id=user_id
+        )
+        return [record["name"] for record in records]
+
+    async def get_crypto_profile(self, user_id):
+        return await self._profiles.get(user_id, lambda: self._load_crypto_profile(user_id))
+
+    async def _load_crypto_profile(self, user_id: int) -> CryptoProfile:
+        record = await self._fetch_row(q.GET_CRYPTO_PROFILE, user_id, user_id=user_id)
+        if record is None:
+            raise LookupError(MSG_ERROR_NOT_REGISTERED)
+        return CryptoProfile(
+            salt=record["salt"].encode("utf-8"),
+            key_check=record["key_check"],
+            kdf_params=KdfParams(
+                time_cost=record["argon2_time_cost"],
+                memory_cost=record["argon2_memory_cost"],
+                parallelism=record["argon2_parallelism"],
+            ),
+            rekey_pending=bool(record["rekey_pending"])
+        )
+
+    async def set_key_check(self, user_id, key_check):
+        await self._execute(q.SET_KEY_CHECK, user_id, key_check, user_id=user_id)
+        await self._profiles.invalidate(user_id)
+
+    async def get_rekey_job(self, user_id):
+        record = await self._fetch_row(q.GET_REKEY_JOB, user_id, user_id=user_id)
+        return _rekey_job(record) if record else None
+
+    async def start_rekey(self, user_id, key_check, kdf_params):
+        record = await self._write(
+            lambda con: con.execute(q.START_REKEY, (user_id, key_check, *kdf_params)).fetchone(),
+            user_id=user_id
+        )
+        await self._profiles.invalidate(user_id)
+        return _rekey_job(record)
+
+    async def count_passwords(self, user_id, after_password_id = 0):
+        return await self._fetch_value(q.COUNT_PASSWORDS, user_id, after_password_id)
+
+    async def get_rekey_batch(self, user_id, after_password_id, limit = c.rekey_batch_size):
+        records = await self._fetch_all(q.GET_REKEY_BATCH, user_id, after_password_id, limit)
+        return list(map(EncryptedRecord._make, records))
+
+    async def rekey_batch(self, user_id, encrypted_records, after_password_id):
+        def rekey(con: sqlite3.Connection) -> bool:
+            cursor = con.execute(
+                q.MOVE_REKEY_CHECKPOINT,
+                (user_id, after_password_id, encrypted_records[-1].password_id)
+            )
+            if cursor.rowcount == 0:
+                return False
+            con.executemany(
+                q.REKEY_PASSWORD,
+                ((user_id, r.password_id, r.ciphertext, r.fingerprint) for r in encrypted_records)
+            )
+            return True
+        return await self._write(rekey, user_id=user_id)
+
+    async def finish_rekey(self, user_id):
+        def finish(con: sqlite3.Connection) -> None:
+            con.execute(q.FINISH_REKEY, (user_id,))
+            con.execute(q.DELETE_REKEY_JOB, (user_id,))
+        await self._write(finish, user_id=user_id)
+        await self._profiles.invalidate(user_id)
+
+    async def _create_users(self, registrations: list[Registration]) -> None:
+        """Writes a batch of new users, each with a fresh salt and the configured KDF."""
+        kdf_params = KdfParams.current()
+        await self._write(lambda con: con.executemany(q.CREATE_USER, (
+            (r.user_id, r.user_name, r.full_name, os.urandom(16).hex(), *kdf_params)
+            for r in registrations
+        )))
+
+    async def _write[T](
+        self, call: Callable[[sqlite3.Connection], T], user_id: Optional[int] = None
+    ) -> T:
+        """
+        Runs `call` with the writer connection in a transaction, or in a savepoint of the
+        current unit of work. A user whose registration is still buffered is written first.
+        """
+        loop = asyncio.get_running_loop()
+        if _in_unit_of_work.get():
+            return await loop.run_in_executor(
+                self._writer_executor, _in_transaction, self._writer, call, True
+            )
+
+        if user_id is not None:
+            await self._registrations.wait(user_id)
+        async with self._write_lock:
+            return await loop.run_in_executor(
+                self._writer_executor, _in_transaction, self._writer, call
+            )
+
+    async def _read[T](
+        self, call: Callable[[sqlite3.Connection], T], user_id: Optional[int] = None
+    ) -> T:
+        """
+        Runs `call` with a pooled read-only connection, or with the writer connection in a unit
+        of work, so it sees the unit's writes.
+        """
+        loop = asyncio.get_running_loop()
+        if _in_unit_of_work.get():
+            return await loop.run_in_executor(self._writer_executor, call, self._writer)
+
+        if user_id is not None:
+            await self._registrations.wait(user_id)
+        con = await self._readers.get()
+        try:
+            return await loop.run_in_executor(self._reader_executor, call, con)
+        finally:
+            self._readers.put_nowait(con)
+
+    async def _execute(self, query: str, *args, user_id: Optional[int] = None) -> None:
+        await self._write(lambda con: con.execute(query, args), user_id=user_id)
+
+    async def _fetch_row(
+        self, query: str, *args, user_id: Optional[int] = None
+    ) -> Optional[sqlite3.Row]:
+        return await self._read(lambda con: con.execute(query, args).fetchone(), user_id=user_id)
+
+    async def _fetch_value(self, query: str, *args) -> Any:
+        record = await self._fetch_row(query, *args)
+        return record[0] if record else None
+
+    async def _fetch_all(
+        self, query: str, *args, user_id: Optional[int] = None
+    ) -> list[sqlite3.Row]:
+        return await self._read(lambda con: con.execute(query, args).fetchall(), user_id=user_id)
+
+    async def _init_db(self) -> None:
+        """Applies the migrations that are newer than the database's user_version."""
+        def apply(con: sqlite3.Connection, version: int, sql: str) -> None:
+            for statement in _split_statements(sql):
+                con.execute(statement)
+            # user_version is transactional, it's committed together with the statements
+            con.execute(f"PRAGMA user_version = {version}")
+
+        def migrate(con: sqlite3.Connection) -> int:
+            version = con.execute("PRAGMA user_version").fetchone()[0]
+            for version, sql in enumerate(q.MIGRATIONS[version:], start=version + 1):
+                logging.info(f"Applying SQLite migration {version}")
+                _in_transaction(con, lambda con: apply(con, version, sql))
+            return version
+
+        loop = asyncio.get_running_loop()
+        version = await loop.run_in_executor(self._writer_executor, migrate, self._writer)
+        logging.info(f"SQLite schema version {version}")
+
+
+def _connect(path: str, readonly: bool) -> sqlite3.Connection:
+    con = sqlite3.connect(
+        path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False
+    )
+    con.row_factory = sqlite3.Row
+    con.create_function("word_similarity", 2, _word_similarity, deterministic=True)
+    con.execute("PRAGMA foreign_keys = ON")
+    if readonly:
+        con.execute("PRAGMA query_only = ON")
+    else:
+        con.execute("PRAGMA journal_mode = WAL")
+        # Durable at checkpoints rather than every commit, which is safe in WAL mode
+        con.execute("PRAGMA synchronous = NORMAL")
+    return con
+
+
+def _in_transaction[T](
+    con: sqlite3.Connection, call: Callable[[sqlite3.Connection], T], nested: bool = False
+) -> T:
+    """Runs `call` in a transaction, or in a savepoint of the open one if `nested`."""
+    con.execute("SAVEPOINT nested" if nested else "BEGIN IMMEDIATE")
+    try:
+        result = call(con)
+    except BaseException:
+        if nested:
+            con.execute("ROLLBACK TO nested")
+            con.execute("RELEASE nested")
+        else:
+            con.execute("ROLLBACK")
+        raise
+    con.execute("RELEASE nested" if nested else "COMMIT")
+    return result
+
+
+def _split_statements(script: str) -> list[str]:
+    """
+    Splits a script into statements for `execute`, which, unlike `executescript`, doesn't
+    commit the open transaction and leaves it to be rolled back when a statement fails.
+    """
+    statements, statement = [], ""
+    for part in script.split(";"):
+        statement += part + ";"
+        if sqlite3.complete_statement(statement):
+            if statement.strip(" \n;"):
+                statements.append(statement.strip())
+            statement = ""
+    return statements
+
+
+@lru_cache(maxsize=65536)
+def _trigrams(text: str) -> frozenset[str]:
+    """Trigrams of the words of a text, padded like pg_trgm does."""
+    trigrams = set()
+    for word in _WORDS.findall(text.lower()):
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(trigrams)
+
+
+def _word_similarity(text: str, name: str) -> float:
+    """Share of the trigrams of `text` found in `name`, an approximation of pg_trgm's."""
+    text_trigrams = _trigrams(text)
+    if not text_trigrams:
+        return 0.0
+    return len(text_trigrams & _trigrams(name)) / len(text_trigrams)
+
+
+def _rekey_job(record: sqlite3.Row) -> RekeyJob:
+    return RekeyJob(
+        key_check=record["key_check"],
+        kdf_params=KdfParams(
+            time_cost=record["argon2_time_cost"],
+            memory_cost=record["argon2_memory_cost"],
+            parallelism=record["argon2_parallelism"],
+        ),
+        last_password_id=record["last_password_id"]
+    )
@@ -0,0 +1,232 @@
+"""
+Statements of `SqliteManager`, the counterparts of `queries`. sqlite3 keeps them prepared in
+its per-connection statement cache. Parameters are numbered like their PostgreSQL versions.
+"""
+
+# The schema, PRAGMA user_version holds the number of applied migrations. Append new ones,
+# never edit applied ones.
+MIGRATIONS: tuple[str, ...] = (
+    """
+    CREATE TABLE users
+    (
+        user_id INTEGER NOT NULL PRIMARY KEY,
+        user_name TEXT,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        full_name TEXT NOT NULL,
+        salt TEXT NOT NULL,
+        key_check TEXT,
+        argon2_time_cost INTEGER,
+        argon2_memory_cost INTEGER,
+        argon2_parallelism INTEGER
+    );
+
+    -- The default BINARY collation orders names like COLLATE "C" in PostgreSQL
+    CREATE TABLE services
+    (
+        service_id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+        name TEXT NOT NULL,
+        password_count INTEGER NOT NULL DEFAULT 0,
+        last_activity TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, name)
+    );
+
+    -- AUTOINCREMENT never reuses IDs, re-keying relies on new passwords getting greater ones
+    CREATE TABLE passwords
+    (
+        password_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+        service_id INTEGER NOT NULL REFERENCES services(service_id) ON DELETE CASCADE,
+        record BLOB NOT NULL,
+        fingerprint BLOB
+    );
+    CREATE INDEX idx_passwords_service_id ON passwords (service_id, password_id);
+    CREATE INDEX idx_passwords_user_id_password_id ON passwords (user_id, password_id);
+    CREATE INDEX idx_passwords_fingerprint ON passwords (service_id, fingerprint);
+
+    CREATE TABLE rekey_jobs
+    (
+        user_id INTEGER NOT NULL PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+        key_check TEXT NOT NULL,
+        argon2_time_cost INTEGER NOT NULL,
+        argon2_memory_cost INTEGER NOT NULL,
+        argon2_parallelism INTEGER NOT NULL,
+        last_password_id INTEGER NOT NULL DEFAULT 0,
+        started_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+)
+
+ENCRYPTED_RECORD = "s.name AS service, p.record AS ciphertext, p.password_id, p.fingerprint"
+REKEY_JOB = "key_check, argon2_time_cost, argon2_memory_cost, argon2_parallelism, last_password_id"
+
+CREATE_USER = """
+    INSERT INTO users (
+        user_id, user_name, full_name, salt,
+        argon2_time_cost, argon2_memory_cost, argon2_parallelism
+    )
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7)
+    ON CONFLICT (user_id) DO NOTHING
+"""
+GET_CRYPTO_PROFILE = """
+    SELECT salt, key_check, argon2_time_cost, argon2_memory_cost, argon2_parallelism,
+    EXISTS (SELECT 1 FROM rekey_jobs j WHERE j.user_id = u.user_id) AS rekey_pending
+    FROM users u WHERE user_id = ?1
+"""
+SET_KEY_CHECK = "UPDATE users SET key_check = ?2 WHERE user_id = ?1"
+
+_SERVICES_PAGE = """
+    SELECT name, service_id FROM services
+    WHERE user_id = ?1 AND name {start} COALESCE(
+        (SELECT name FROM services WHERE user_id = ?1 AND service_id = ?2), ''
+    )
+    ORDER BY name {order} LIMIT ?3
+"""
+GET_SERVICES = _SERVICES_PAGE.format(start=">=", order="ASC")
+GET_SERVICES_BACKWARD = _SERVICES_PAGE.format(start="<", order="DESC")
+UPSERT_SERVICE = """
+    INSERT INTO services (user_id, name, password_count)
+    VALUES (?1, ?2, 1)
+    ON CONFLICT (user_id, name) DO UPDATE
+    SET password_count = password_count + 1, last_activity = CURRENT_TIMESTAMP
+    RETURNING service_id
+"""
+GET_SERVICE_IDS = """
+    SELECT name, service_id FROM services WHERE user_id = ?1 AND name IN (?2, ?3)
+"""
+RENAME_SERVICE = """
+    UPDATE services SET name = ?2, last_activity = CURRENT_TIMESTAMP WHERE service_id = ?1
+"""
+MOVE_PASSWORDS = "UPDATE passwords SET service_id = ?2 WHERE service_id = ?1"
+MERGE_SERVICE_COUNT = """
+    UPDATE services SET last_activity = CURRENT_TIMESTAMP,
+    password_count = password_count + (
+        SELECT password_count FROM services WHERE service_id = ?1
+    )
+    WHERE service_id = ?2
+"""
+DELETE_SERVICE_BY_ID = "DELETE FROM services WHERE service_id = ?1"
+DELETE_SERVICES = "DELETE FROM services WHERE user_id = ?1"
+DELETE_SERVICE = "DELETE FROM services WHERE user_id = ?1 AND name = ?2"
+DECREMENT_SERVICE_COUNT = """
+    UPDATE services SET password_count = password_count - 1, last_activity = CURRENT_TIMESTAMP
+    WHERE service_id = ?1
+"""
+DELETE_EMPTY_SERVICE = "DELETE FROM services WHERE service_id = ?1 AND password_count <= 0"
+TOUCH_SERVICE = "UPDATE services SET last_activity = CURRENT_TIMESTAMP WHERE service_id = ?1"
+# Ranked like its PostgreSQL version, word_similarity() is registered on every connection.
+# LIKE is case-insensitive for ASCII letters only.
+SEARCH_SERVICES = r"""
+    SELECT name FROM services
+    WHERE user_id = ?1 AND (
+        name LIKE '%' || ?2 || '%' ESCAPE '\' OR word_similarity(?3, name) >= ?6
+    )
+    ORDER BY
+        CASE
+            WHEN name LIKE ?2 || '%' ESCAPE '\' THEN 0
+            WHEN name LIKE '%' || ?2 || '%' ESCAPE '\' THEN 1
+            ELSE 2
+        END,
+        word_similarity(?3, name) DESC, name
+    LIMIT ?5 OFFSET ?4
+"""
+
+INSERT_PASSWORD = """
+    INSERT INTO passwords (user_id, service_id, record, fingerprint)
+    VALUES (?1, ?2, ?3, ?4) RETURNING password_id
+"""
+GET_PASSWORDS = f"""
+    SELECT {ENCRYPTED_RECORD}
+    FROM services s JOIN passwords p USING (service_id)
+    WHERE s.user_id = ?1 AND s.name = ?2
+    ORDER BY p.password_id LIMIT ?4 OFFSET ?3
+"""
+GET_PASSWORD = f"""
+    SELECT {ENCRYPTED_RECORD}
+    FROM passwords p JOIN services s USING (service_id)
+    WHERE p.password_id = ?2 AND p.user_id = ?1
+"""
+GET_RAND_PASSWORD = f"""
+    SELECT {ENCRYPTED_RECORD}
+    FROM passwords p JOIN services s USING (service_id)
+    WHERE p.user_id = ?1 LIMIT 1
+"""
+DELETE_PASSWORD = """
+    DELETE FROM passwords WHERE password_id = ?2 AND user_id = ?1 RETURNING service_id
+"""
+UPDATE_CREDENTIALS = """
+    UPDATE passwords SET record = ?3, fingerprint = ?4
+    WHERE password_id = ?2 AND user_id = ?1
+    RETURNING service_id
+"""
+SET_FINGERPRINT = "UPDATE passwords SET fingerprint = ?3 WHERE password_id = ?2 AND user_id = ?1"
+# Keyset pages, so a long export doesn't hold a read transaction between batches
+_EXPORT_PAGE = f"""
+    SELECT {ENCRYPTED_RECORD}
+    FROM passwords p JOIN services s USING (service_id)
+    WHERE p.user_id = ?1 AND p.password_id > ?2 {{condition}}
+    ORDER BY p.password_id LIMIT ?3
+"""
+EXPORT_PASSWORDS = _EXPORT_PAGE.format(condition="")
+EXPORT_UNFINGERPRINTED_PASSWORDS = _EXPORT_PAGE.format(condition="AND p.fingerprint IS NULL")
+COUNT_PASSWORDS = "SELECT count(*) FROM passwords WHERE user_id = ?1 AND password_id > ?2"
+
+# Imports stage rows in a temporary table of the writer connection, named after the import
+CREATE_IMPORT_STAGING = """
+    CREATE TEMPORARY TABLE {table} (service TEXT, record BLOB, fingerprint BLOB)
+"""
+INSERT_IMPORT_STAGING = "INSERT INTO {table} (service, record, fingerprint) VALUES (?1, ?2, ?3)"
+DELETE_STAGED_DUPLICATES = """
+    DELETE FROM {table} AS st
+    WHERE st.rowid NOT IN (SELECT min(rowid) FROM {table} GROUP BY service, fingerprint)
+    OR EXISTS (
+        SELECT 1 FROM services s JOIN passwords p USING (service_id)
+        WHERE s.user_id = ?1 AND s.name = st.service AND p.fingerprint = st.fingerprint
+    )
+"""
+UPSERT_STAGED_SERVICES = """
+    INSERT INTO services (user_id, name, password_count)
+    SELECT ?1, service, count(*) FROM {table} WHERE true GROUP BY service
+    ON CONFLICT (user_id, name) DO UPDATE
+    SET password_count = password_count + excluded.password_count,
+        last_activity = CURRENT_TIMESTAMP
+"""
+INSERT_STAGED_PASSWORDS = """
+    INSERT INTO passwords (user_id, service_id, record, fingerprint)
+    SELECT ?1, s.service_id, st.record, st.fingerprint
+    FROM {table} st JOIN services s ON s.user_id = ?1 AND s.name = st.service
+    ORDER BY st.rowid
+"""
+DROP_IMPORT_STAGING = "DROP TABLE {table}"
+
+GET_REKEY_JOB = f"SELECT {REKEY_JOB} FROM rekey_jobs WHERE user_id = ?1"
+START_REKEY = f"""
+    INSERT INTO rekey_jobs (user_id, key_check, argon2_time_cost,
+        argon2_memory_cost, argon2_parallelism)
+    VALUES (?1, ?2, ?3, ?4, ?5)
+    -- A no-op update, so the row of an interrupted job is returned
+    ON CONFLICT (user_id) DO UPDATE SET user_id = excluded.user_id
+    RETURNING {REKEY_JOB}
+"""
+GET_REKEY_BATCH = f"""
+    SELECT {ENCRYPTED_RECORD}
+    FROM passwords p JOIN services s USING (service_id)
+    WHERE p.user_id = ?1 AND p.password_id > ?2
+    ORDER BY p.password_id LIMIT ?3
+"""
+MOVE_REKEY_CHECKPOINT = """
+    UPDATE rekey_jobs SET last_password_id = ?3, updated_at = CURRENT_TIMESTAMP
+    WHERE user_id = ?1 AND last_password_id = ?2
+"""
+REKEY_PASSWORD = """
+    UPDATE passwords SET record = ?3, fingerprint = ?4 WHERE password_id = ?2 AND user_id = ?1
+"""
+FINISH_REKEY = """
+    UPDATE users SET (key_check, argon2_time_cost, argon2_memory_cost, argon2_parallelism) = (
+        SELECT key_check, argon2_time_cost, argon2_memory_cost, argon2_parallelism
+        FROM rekey_jobs WHERE user_id = ?1
+    )
+    WHERE user_id = ?1 AND EXISTS (SELECT 1 FROM rekey_jobs WHERE user_id = ?1)
+"""
+DELETE_REKEY_JOB = "DELETE FROM rekey_jobs WHERE user_id = ?1"
@@ -34,12 +34,13 @@ async def handle_hash_selection(
     hash_type = callback_data.hash_type
     new_state = get_state_by_hash_type(hash_type)
 
-    coroutines = [
-        db.key_value.set_hash_type(hash_type, state),
-        db.key_value.set_state(new_state.state, state),
-        db.key_value.set_message_id_to_delete(callback_query.message.message_id, state)
-    ]
-    await db.key_value.execute_batch(*coroutines)
+    await (
+        db.key_value.batch(state)
+        .set_hash_type(hash_type)
+        .set_state(new_state.state)
+        .set_message_id_to_delete(callback_query.message.message_id)
+        .execute()
+    )
 
     return await callback_query.message.edit_text(
         text=HASH_SELECTION_TEXT,
@@ -16,11 +16,12 @@ fsm_router = Router(name=__name__)
 
 @fsm_router.message(StateFilter(HashMenuStates), F.document)
 async def process_check_hash(message: Message, state: FSMContext) -> Message:
-    coroutines = [
-        db.key_value.get_message_id_to_delete(state),
-        db.key_value.clear_state(state)
-    ]
-    message_id, _ = db.key_value.execute_batch(*coroutines)
+    (message_id,) = await (
+        db.key_value.batch(state)
+        .get_message_id_to_delete()
+        .clear_state()
+        .execute()
+    )
 
     await delete_fsm_message(message_id, message)
 
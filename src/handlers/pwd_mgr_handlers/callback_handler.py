@@ -7,10 +7,10 @@ from aiogram.types import CallbackQuery, Message
 
 import keyboards.inline
 from database import db
+import helpers.pwd_mgr_helper as helper
 import helpers.pwd_mgr_helper.texts as texts
 from models.callback_data import PasswordManagerCallbackData as PwdMgrCb
 from models.states import PasswordManagerStates
-from utils import escape_markdown_v2
 
 callback_router = Router(name=__name__)
 
@@ -29,20 +29,20 @@ async def enter(query: CallbackQuery) -> Message:
 async def enter_services(
     query: CallbackQuery, state: FSMContext, callback_data: PwdMgrCb.EnterServices
 ) -> Message:
-    services_offset = callback_data.services_offset
-
-    services, _ = await asyncio.gather(
-        db.relational.get_services(query.from_user.id, services_offset),
-        db.key_value.execute_batch(
-            db.key_value.set_services_offset(services_offset, state),
-            db.key_value.clear_state(state)
-        )
+    services_page = await helper.get_services_page(
+        query.from_user.id, callback_data.services_cursor, callback_data.backward
+    )
+    await (
+        db.key_value.batch(state)
+        .set_services_cursor(services_page.cursor)
+        .clear_state()
+        .execute()
     )
 
-    if services:
+    if services_page.services:
         return await query.message.edit_text(
-            text=texts.gen_services_text(services_offset),
-            reply_markup=keyboards.inline.pwd_mgr_services_ikm(services, services_offset),
+            text=texts.SERVICES_TEXT,
+            reply_markup=keyboards.inline.pwd_mgr_services_ikm(services_page),
         )
     else:
         return await query.message.edit_text(
@@ -57,22 +57,24 @@ async def create_service(
 ) -> Message:
     record, _ = await asyncio.gather(
         db.relational.get_rand_password(query.from_user.id),
-        db.key_value.execute_batch(
-            db.key_value.set_message_id_to_delete(query.message.message_id, state),
-            db.key_value.set_input_format_text(texts.CREATE_SERVICE_TEXT, state),
-            db.key_value.set_state(PasswordManagerStates.CreateService.state, state)
+        (
+            db.key_value.batch(state)
+            .set_message_id_to_delete(query.message.message_id)
+            .set_input_format_text(texts.CREATE_SERVICE_TEXT)
+            .set_state(PasswordManagerStates.CreateService.state)
+            .execute()
         )
     )
 
     if record:
         return await query.message.edit_text(
             text=texts.CREATE_SERVICE_TEXT,
-            reply_markup=keyboards.inline.return_to_services_ikm(callback_data.services_offset)
+            reply_markup=keyboards.inline.return_to_services_ikm(callback_data.services_cursor)
         )
     else:
         return await query.message.edit_text(
             text=texts.WARNING + texts.CREATE_SERVICE_TEXT,
-            reply_markup=keyboards.inline.return_to_services_ikm(callback_data.services_offset)
+            reply_markup=keyboards.inline.return_to_services_ikm(callback_data.services_cursor)
         )
 
 
@@ -80,15 +82,17 @@ async def create_service(
 async def delete_services(
     query: CallbackQuery, state: FSMContext, callback_data: PwdMgrCb.DeleteServices
 ) -> Message:
-    await db.key_value.execute_batch(
-        db.key_value.set_message_id_to_delete(query.message.message_id, state),
-        db.key_value.set_input_format_text(texts.DELETE_SERVICES_TEXT, state),
-        db.key_value.set_state(PasswordManagerStates.DeleteService.state, state)
+    await (
+        db.key_value.batch(state)
+        .set_message_id_to_delete(query.message.message_id)
+        .set_input_format_text(texts.DELETE_SERVICES_TEXT)
+        .set_state(PasswordManagerStates.DeleteService.state)
+        .execute()
     )
 
     return await query.message.edit_text(
         text=texts.DELETE_SERVICES_TEXT,
-        reply_markup=keyboards.inline.return_to_services_ikm(callback_data.services_offset)
+        reply_markup=keyboards.inline.return_to_services_ikm(callback_data.services_cursor)
     )
 
 
@@ -96,28 +100,29 @@ async def delete_services(
 async def enter_service(
     query: CallbackQuery, callback_data: PwdMgrCb.EnterService, state: FSMContext
 ) -> Optional[Message]:
-    coroutines = [
-        db.key_value.set_service(callback_data.service, state),
-        db.key_value.set_pwds_offset(callback_data.pwds_offset, state),
-        db.key_value.set_input_format_text(texts.ASK_MASTER_PASSWORD_TEXT, state),
-        db.key_value.set_state(PasswordManagerStates.EnterService.state, state)
-    ]
+    batch = (
+        db.key_value.batch(state)
+        .set_service(callback_data.service)
+        .set_pwds_offset(callback_data.pwds_offset)
+        .set_input_format_text(texts.ASK_MASTER_PASSWORD_TEXT)
+        .set_state(PasswordManagerStates.EnterService.state)
+    )
     if query.message:
-        coroutines.append(db.key_value.set_message_id_to_delete(query.message.message_id, state))
-    await db.key_value.execute_batch(*coroutines)
+        batch.set_message_id_to_delete(query.message.message_id)
+    await batch.execute()
 
     #  Default Callback
     if query.message:
         return await query.message.edit_text(
             text=texts.ASK_MASTER_PASSWORD_TEXT,
-            reply_markup=keyboards.inline.return_to_services_ikm(callback_data.services_offset)
+            reply_markup=keyboards.inline.return_to_services_ikm(callback_data.services_cursor)
         )
 
     #  Callback from inline_query (Message can't be deleted)
     await query.bot.send_message(
         chat_id=query.from_user.id,
         text=texts.ASK_MASTER_PASSWORD_TEXT,
-        reply_markup=keyboards.inline.return_to_services_ikm(callback_data.services_offset)
+        reply_markup=keyboards.inline.return_to_services_ikm(callback_data.services_cursor)
     )
 
 
@@ -125,17 +130,19 @@ async def enter_service(
 async def create_password(
     query: CallbackQuery, callback_data: PwdMgrCb.CreatePassword, state: FSMContext
 ) -> Message:
-    await db.key_value.execute_batch(
-        db.key_value.set_service(callback_data.service, state),
-        db.key_value.set_message_id_to_delete(query.message.message_id, state),
-        db.key_value.set_input_format_text(texts.CREATE_PASSWORD_TEXT, state),
-        db.key_value.set_state(PasswordManagerStates.CreatePassword.state, state)
+    await (
+        db.key_value.batch(state)
+        .set_service(callback_data.service)
+        .set_message_id_to_delete(query.message.message_id)
+        .set_input_format_text(texts.CREATE_PASSWORD_TEXT)
+        .set_state(PasswordManagerStates.CreatePassword.state)
+        .execute()
     )
 
     return await query.message.edit_text(
         text=texts.CREATE_PASSWORD_TEXT,
         reply_markup=keyboards.inline.return_to_passwords_ikm(
-            callback_data.service, callback_data.services_offset, callback_data.pwds_offset
+            callback_data.service, callback_data.services_cursor, callback_data.pwds_offset
         )
     )
 
@@ -144,20 +151,22 @@ async def create_password(
 async def enter_password(
     query: CallbackQuery, callback_data: PwdMgrCb.EnterPassword, state: FSMContext
 ) -> Message:
-    login = escape_markdown_v2(callback_data.login)
-    password = escape_markdown_v2(callback_data.password)
-
-    service, services_offset, pwds_offset = await db.key_value.execute_batch(
-        db.key_value.get_service(state),
-        db.key_value.get_services_offset(state),
-        db.key_value.get_pwds_offset(state)
+    service, services_cursor, pwds_offset = await (
+        db.key_value.batch(state)
+        .get_service()
+        .get_services_cursor()
+        .get_pwds_offset()
+        .set_password_id(callback_data.password_id)
+        .set_message_id_to_delete(query.message.message_id)
+        .set_input_format_text(texts.ASK_MASTER_PASSWORD_TEXT)
+        .set_state(PasswordManagerStates.EnterPassword.state)
+        .execute()
     )
 
     return await query.message.edit_text(
-        text=texts.gen_credentials(service, login, password),
-        parse_mode="MarkdownV2",
-        reply_markup=keyboards.inline.pwd_mgr_password_ikm(
-            service, login, password, pwds_offset, services_offset
+        text=texts.ASK_MASTER_PASSWORD_TEXT,
+        reply_markup=keyboards.inline.return_to_passwords_ikm(
+            service, services_cursor, pwds_offset
         )
     )
 
@@ -166,18 +175,20 @@ async def enter_password(
 async def change_service(
     query: CallbackQuery, state: FSMContext, callback_data: PwdMgrCb.ChangeService
 ) -> Message:
-    await db.key_value.execute_batch(
-        db.key_value.set_service(callback_data.service, state),
-        db.key_value.set_message_id_to_delete(query.message.message_id, state),
-        db.key_value.set_input_format_text(texts.CHANGE_SERVICE_TEXT, state),
-        db.key_value.set_state(PasswordManagerStates.ChangeService.state, state),
-        db.key_value.set_pwds_offset(callback_data.pwds_offset, state)
+    await (
+        db.key_value.batch(state)
+        .set_service(callback_data.service)
+        .set_message_id_to_delete(query.message.message_id)
+        .set_input_format_text(texts.CHANGE_SERVICE_TEXT)
+        .set_state(PasswordManagerStates.ChangeService.state)
+        .set_pwds_offset(callback_data.pwds_offset)
+        .execute()
     )
 
     return await query.message.edit_text(
         text=texts.CHANGE_SERVICE_TEXT,
         reply_markup=keyboards.inline.return_to_passwords_ikm(
-            callback_data.service, callback_data.services_offset, callback_data.pwds_offset
+            callback_data.service, callback_data.services_cursor, callback_data.pwds_offset
         )
     )
 
@@ -186,17 +197,19 @@ async def change_service(
 async def delete_service(
     query: CallbackQuery, state: FSMContext, callback_data: PwdMgrCb.DeleteService
 ) -> Message:
-    await db.key_value.execute_batch(
-        db.key_value.set_message_id_to_delete(query.message.message_id, state),
-        db.key_value.set_service(callback_data.service, state),
-        db.key_value.set_input_format_text(texts.DELETE_SERVICE_TEXT, state),
-        db.key_value.set_state(PasswordManagerStates.DeleteService.state, state)
+    await (
+        db.key_value.batch(state)
+        .set_message_id_to_delete(query.message.message_id)
+        .set_service(callback_data.service)
+        .set_input_format_text(texts.DELETE_SERVICE_TEXT)
+        .set_state(PasswordManagerStates.DeleteService.state)
+        .execute()
     )
 
     return await query.message.edit_text(
         text=texts.DELETE_SERVICE_TEXT,
         reply_markup=keyboards.inline.return_to_passwords_ikm(
-            callback_data.service, callback_data.services_offset, callback_data.pwds_offset
+            callback_data.service, callback_data.services_cursor, callback_data.pwds_offset
         )
     )
 
@@ -205,21 +218,18 @@ async def delete_service(
 async def delete_password(
     query: CallbackQuery, state: FSMContext, callback_data: PwdMgrCb.DeletePassword
 ) -> Message:
-    login, password = callback_data.login, callback_data.password  # No need to escape MarkdownV2
-
-    service, _, _, _ = await db.key_value.execute_batch(
-        db.key_value.get_service(state),
-        db.key_value.set_state(PasswordManagerStates.DeletePassword.state, state),
-        db.key_value.set_message_id_to_delete(query.message.message_id, state),
-        db.key_value.set_input_format_text(texts.DELETE_PASSWORD_TEXT, state)
+    await (
+        db.key_value.batch(state)
+        .set_password_id(callback_data.password_id)
+        .set_state(PasswordManagerStates.DeletePassword.state)
+        .set_message_id_to_delete(query.message.message_id)
+        .set_input_format_text(texts.DELETE_PASSWORD_TEXT)
+        .execute()
     )
 
-    credentials = texts.gen_credentials(service, login, password)
-    text = escape_markdown_v2(texts.DELETE_PASSWORD_TEXT)
     return await query.message.edit_text(
-        text=credentials + text,
-        reply_markup=keyboards.inline.return_to_password_ikm(login, password),
-        parse_mode="MarkdownV2"
+        text=texts.DELETE_PASSWORD_TEXT,
+        reply_markup=keyboards.inline.return_to_password_ikm(callback_data.password_id)
     )
 
 
@@ -227,30 +237,29 @@ async def delete_password(
 async def update_credentials(
     query: CallbackQuery, state: FSMContext, callback_data: PwdMgrCb.UpdateCredentials
 ) -> Message:
-    login, password = callback_data.login, callback_data.password  # No need to escape MarkdownV2
-
-    service, _, _, _ = await db.key_value.execute_batch(
-        db.key_value.get_service(state),
-        db.key_value.set_state(PasswordManagerStates.UpdateCredentials.state, state),
-        db.key_value.set_message_id_to_delete(query.message.message_id, state),
-        db.key_value.set_input_format_text(texts.UPDATE_CREDENTIALS_TEXT, state)
+    await (
+        db.key_value.batch(state)
+        .set_password_id(callback_data.password_id)
+        .set_state(PasswordManagerStates.UpdateCredentials.state)
+        .set_message_id_to_delete(query.message.message_id)
+        .set_input_format_text(texts.UPDATE_CREDENTIALS_TEXT)
+        .execute()
     )
 
-    credentials = texts.gen_credentials(service, login, password)
-    text = escape_markdown_v2(texts.UPDATE_CREDENTIALS_TEXT)
     return await query.message.edit_text(
-        text=credentials + "\n\n" + text,
-        reply_markup=keyboards.inline.return_to_password_ikm(login, password),
-        parse_mode="MarkdownV2"
+        text=texts.UPDATE_CREDENTIALS_TEXT,
+        reply_markup=keyboards.inline.return_to_password_ikm(callback_data.password_id)
     )
 
 
 @callback_router.callback_query(PwdMgrCb.ImportFromFile.filter())
 async def import_from_file(query: CallbackQuery, state: FSMContext) -> Message:
-    await db.key_value.execute_batch(
-        db.key_value.set_state(PasswordManagerStates.ImportFromFile.state, state),
-        db.key_value.set_message_id_to_delete(query.message.message_id, state),
-        db.key_value.set_input_format_text(texts.IMPORT_FROM_FILE_TEXT, state)
+    await (
+        db.key_value.batch(state)
+        .set_state(PasswordManagerStates.ImportFromFile.state)
+        .set_message_id_to_delete(query.message.message_id)
+        .set_input_format_text(texts.IMPORT_FROM_FILE_TEXT)
+        .execute()
     )
 
     return await query.message.edit_text(
@@ -261,10 +270,12 @@ async def import_from_file(query: CallbackQuery, state: FSMContext) -> Message:
 
 @callback_router.callback_query(PwdMgrCb.ExportToFile.filter())
 async def export_to_file(query: CallbackQuery, state: FSMContext) -> Message:
-    await db.key_value.execute_batch(
-        db.key_value.set_state(PasswordManagerStates.ExportToFile.state, state),
-        db.key_value.set_message_id_to_delete(query.message.message_id, state),
-        db.key_value.set_input_format_text(texts.ASK_MASTER_PASSWORD_TEXT, state)
+    await (
+        db.key_value.batch(state)
+        .set_state(PasswordManagerStates.ExportToFile.state)
+        .set_message_id_to_delete(query.message.message_id)
+        .set_input_format_text(texts.ASK_MASTER_PASSWORD_TEXT)
+        .execute()
     )
 
     return await query.message.edit_text(
@@ -275,10 +286,12 @@ async def export_to_file(query: CallbackQuery, state: FSMContext) -> Message:
 
 @callback_router.callback_query(PwdMgrCb.ChangeMasterPassword.filter())
 async def change_master_password(query: CallbackQuery, state: FSMContext) -> Message:
-    await db.key_value.execute_batch(
-        db.key_value.set_state(PasswordManagerStates.ChangeMasterPassword.state, state),
-        db.key_value.set_message_id_to_delete(query.message.message_id, state),
-        db.key_value.set_input_format_text(texts.CHANGE_MASTER_PASSWORD_TEXT, state)
+    await (
+        db.key_value.batch(state)
+        .set_state(PasswordManagerStates.ChangeMasterPassword.state)
+        .set_message_id_to_delete(query.message.message_id)
+        .set_input_format_text(texts.CHANGE_MASTER_PASSWORD_TEXT)
+        .execute()
     )
 
     return await query.message.edit_text(
@@ -1,5 +1,4 @@
-import asyncio
-from typing import Union
+from typing import Optional, Union
 
 from aiogram import Router, F
 from aiogram.filters import StateFilter
@@ -12,6 +11,7 @@ import helpers.pwd_mgr_helper as helper
 import helpers.pwd_mgr_helper.texts as texts
 from helpers.pwd_mgr_helper import DecryptedRecord, EncryptedRecord
 from models.states import PasswordManagerStates
+from utils import escape_markdown_v2
 
 fsm_router = Router(name=__name__)
 
@@ -24,15 +24,16 @@ async def create_service(message: Message, state: FSMContext) -> Message:
         user_input = helper.split_user_input(user_input=message.text, maxsplit=4)
         master_password, service, login, password = user_input
         helper.has_valid_input_length(login, password)
-        derived_key = await helper.validate_master_password(master_password, message.from_user.id)
-        await helper.validate_derived_key(message.from_user.id, derived_key)
+        derived_key = await helper.unlock_vault(master_password, message.from_user.id)
     except Exception as e:
         return await helper.resend_user_input_request(state, message, str(e), current_state)
 
+    decrypted_record = await helper.create_password_record(
+        DecryptedRecord(service=service, login=login, password=password),
+        message.from_user.id,
+        derived_key
+    )
     await db.key_value.set_service(service, state)
-
-    decrypted_record = DecryptedRecord(service=service, login=login, password=password)
-    await helper.create_password_record(decrypted_record, message.from_user.id, derived_key)
     return await message.answer(
         text=texts.gen_passwords_text(service, pwds_offset=0),
         parse_mode="Markdown",
@@ -40,7 +41,7 @@ async def create_service(message: Message, state: FSMContext) -> Message:
             decrypted_records=[decrypted_record],
             service=service,
             pwd_offset=0,
-            services_offset=await db.key_value.get_services_offset(state)
+            services_cursor=await db.key_value.get_services_cursor(state)
         )
     )
 
@@ -53,8 +54,7 @@ async def create_password(message: Message, state: FSMContext) -> Message:
         user_input = helper.split_user_input(user_input=message.text, maxsplit=3)
         master_password, login, password = user_input
         helper.has_valid_input_length(login, password)
-        derived_key = await helper.validate_master_password(master_password, message.from_user.id)
-        await helper.validate_derived_key(message.from_user.id, derived_key)
+        derived_key = await helper.unlock_vault(master_password, message.from_user.id)
     except Exception as e:
         return await helper.resend_user_input_request(state, message, str(e), current_state)
 
@@ -64,14 +64,14 @@ async def create_password(message: Message, state: FSMContext) -> Message:
         user_id=message.from_user.id,
         derived_key=derived_key
     )
-    decrypted_records, pwds_offset, services_offset = await helper.show_service_logins(
+    decrypted_records, pwds_offset, services_cursor = await helper.show_service_logins(
         message, state, derived_key, service
     )
     return await message.answer(
         text=texts.gen_passwords_text(service, pwds_offset),
         parse_mode="Markdown",
         reply_markup = keyboards.inline.pwd_mgr_passwords_ikm(
-            decrypted_records, service, pwds_offset, services_offset
+            decrypted_records, service, pwds_offset, services_cursor
         )
     )
 
@@ -81,50 +81,43 @@ async def delete_password(message: Message, state: FSMContext) -> Message:
     current_state = await helper.handle_message_deletion(state, message)
 
     try:
-        user_input = helper.split_user_input(user_input=message.text, maxsplit=3)
-        master_password, login, password = user_input
-        derived_key = await helper.validate_master_password(master_password, message.from_user.id)
-        await helper.validate_derived_key(message.from_user.id, derived_key)
+        master_password = helper.split_user_input(user_input=message.text, maxsplit=1)[0]
+        derived_key = await helper.unlock_vault(master_password, message.from_user.id)
     except Exception as e:
         return await helper.resend_user_input_request(state, message, str(e), current_state)
 
-    service, pwds_offset, services_offset = await db.key_value.execute_batch(
-        db.key_value.get_service(state),
-        db.key_value.get_pwds_offset(state),
-        db.key_value.get_services_offset(state)
-    )
-    encrypted_records = await db.relational.get_passwords(
-        user_id=message.from_user.id,
-        service=service,
-        offset=pwds_offset
+    service, password_id, pwds_offset, services_cursor = await (
+        db.key_value.batch(state)
+        .get_service()
+        .get_password_id()
+        .get_pwds_offset()
+        .get_services_cursor()
+        .execute()
     )
+    # Only the statements run in the unit, it holds a connection and the transaction open
+    async with db.relational.unit_of_work(message.from_user.id) as uow:
+        _, encrypted_records = await uow.run(
+            db.relational.delete_password(message.from_user.id, password_id),
+            db.relational.get_passwords(message.from_user.id, service, offset=pwds_offset)
+        )
+        if not encrypted_records:
+            services_page = await helper.get_services_page(message.from_user.id)
 
-    decrypted_records = await DecryptedRecord.decrypt(
-        encrypted_records=encrypted_records, derived_key=derived_key
-    )
-    for i, decrypted_record in enumerate(decrypted_records):
-        if decrypted_record.login == login and decrypted_record.password == password:
-            encrypted_record = encrypted_records[i]
-            await db.relational.delete_password(
-                message.from_user.id, service, encrypted_record.ciphertext
-            )
-            decrypted_records.pop(i)
-            break
+    decrypted_records = await DecryptedRecord.decrypt(encrypted_records, derived_key)
 
     if decrypted_records:
         return await message.answer(
             text=texts.PASSWORD_DELETED_TEXT + texts.gen_passwords_text(service, pwds_offset),
             parse_mode="Markdown",
             reply_markup=keyboards.inline.pwd_mgr_passwords_ikm(
-                decrypted_records, service, pwds_offset, services_offset
+                decrypted_records, service, pwds_offset, services_cursor
             )
         )
     else:
-        services = await db.relational.get_services(message.from_user.id, offset=0)
-        if services:
+        if services_page.services:
             return await message.answer(
-                text=texts.PASSWORD_DELETED_TEXT + texts.gen_services_text(services_offset=0),
-                reply_markup=keyboards.inline.pwd_mgr_services_ikm(services, services_offset=0)
+                text=texts.PASSWORD_DELETED_TEXT + texts.SERVICES_TEXT,
+                reply_markup=keyboards.inline.pwd_mgr_services_ikm(services_page)
             )
         else:
             return await message.answer(
@@ -138,48 +131,38 @@ async def update_credentials(message: Message, state: FSMContext) -> Message:
     current_state = await helper.handle_message_deletion(state, message)
 
     try:
-        user_input = helper.split_user_input(user_input=message.text, maxsplit=5)
-        master_password, login, password, new_login, new_password = user_input
-        derived_key = await helper.validate_master_password(master_password, message.from_user.id)
-        await helper.validate_derived_key(message.from_user.id, derived_key)
+        user_input = helper.split_user_input(user_input=message.text, maxsplit=3)
+        master_password, new_login, new_password = user_input
+        helper.has_valid_input_length(new_login, new_password)
+        derived_key = await helper.unlock_vault(master_password, message.from_user.id)
     except Exception as e:
         return await helper.resend_user_input_request(state, message, str(e), current_state)
 
-    service, pwds_offset, services_offset = await db.key_value.execute_batch(
-        db.key_value.get_service(state),
-        db.key_value.get_pwds_offset(state),
-        db.key_value.get_services_offset(state)
+    service, password_id, pwds_offset, services_cursor = await (
+        db.key_value.batch(state)
+        .get_service()
+        .get_password_id()
+        .get_pwds_offset()
+        .get_services_cursor()
+        .execute()
+    )
+    new_pwd_record = await EncryptedRecord.encrypt(
+        DecryptedRecord(service=service, login=new_login, password=new_password), derived_key
     )
-    encrypted_records = await db.relational.get_passwords(
+    await db.relational.update_credentials(
         user_id=message.from_user.id,
-        service=service,
-        offset=pwds_offset
+        password_id=password_id,
+        ciphertext=new_pwd_record.ciphertext,
+        fingerprint=new_pwd_record.fingerprint
     )
 
-    decrypted_records = await DecryptedRecord.decrypt(encrypted_records, derived_key)
-    for i, decrypted_record in enumerate(decrypted_records):
-        if decrypted_record.login == login and decrypted_record.password == password:
-            new_pwd_record = await EncryptedRecord.encrypt(
-                [DecryptedRecord(
-                    service=service,
-                    login=new_login,
-                    password=new_password
-                )],
-                derived_key
-            )
-            await db.relational.update_credentials(
-                user_id=message.from_user.id,
-                service=service,
-                current_ciphertext=encrypted_records[i].ciphertext,
-                new_ciphertext=new_pwd_record[0].ciphertext
-            )
-            break
-
-    return await message.edit_text(
-        text=texts.gen_credentials(service, new_login, new_password),
+    return await message.answer(
+        text=texts.gen_credentials(
+            service, escape_markdown_v2(new_login), escape_markdown_v2(new_password)
+        ),
         parse_mode="MarkdownV2",
         reply_markup=keyboards.inline.pwd_mgr_password_ikm(
-            service, new_login, new_password, pwds_offset, services_offset
+            service, password_id, pwds_offset, services_cursor
         )
     )
 
@@ -190,20 +173,58 @@ async def service_enter(message: Message, state: FSMContext) -> Message:
 
     try:
         master_password = helper.split_user_input(user_input=message.text, maxsplit=1)[0]
-        derived_key = await helper.validate_master_password(master_password, message.from_user.id)
-        await helper.validate_derived_key(message.from_user.id, derived_key)
+        derived_key = await helper.unlock_vault(master_password, message.from_user.id)
     except Exception as e:
         return await helper.resend_user_input_request(state, message, str(e), current_state)
 
     service = await db.key_value.get_service(state)
-    decrypted_records, pwds_offset, services_offset = await helper.show_service_logins(
+    decrypted_records, pwds_offset, services_cursor = await helper.show_service_logins(
         message, state, derived_key, service
     )
     return await message.answer(
         text=texts.gen_passwords_text(service, pwds_offset),
         parse_mode="Markdown",
         reply_markup=keyboards.inline.pwd_mgr_passwords_ikm(
-            decrypted_records, service, pwds_offset, services_offset
+            decrypted_records, service, pwds_offset, services_cursor
+        )
+    )
+
+
+@fsm_router.message(StateFilter(PasswordManagerStates.EnterPassword), F.text)
+async def password_enter(message: Message, state: FSMContext) -> Message:
+    current_state = await helper.handle_message_deletion(state, message)
+
+    try:
+        master_password = helper.split_user_input(user_input=message.text, maxsplit=1)[0]
+        derived_key = await helper.unlock_vault(master_password, message.from_user.id)
+    except Exception as e:
+        return await helper.resend_user_input_request(state, message, str(e), current_state)
+
+    service, password_id, pwds_offset, services_cursor = await (
+        db.key_value.batch(state)
+        .get_service()
+        .get_password_id()
+        .get_pwds_offset()
+        .get_services_cursor()
+        .execute()
+    )
+    try:
+        record = await helper.get_password_record(message.from_user.id, password_id, derived_key)
+    except LookupError as e:
+        return await message.answer(
+            text=str(e),
+            reply_markup=keyboards.inline.return_to_passwords_ikm(
+                service, services_cursor, pwds_offset
+            )
+        )
+
+    return await message.answer(
+        text=texts.gen_credentials(
+            service, escape_markdown_v2(record.login), escape_markdown_v2(record.password)
+        ),
+        parse_mode="MarkdownV2",
+        reply_markup=keyboards.inline.pwd_mgr_password_ikm(
+            service, password_id, pwds_offset, services_cursor
         )
     )
 
@@ -214,31 +235,33 @@ async def change_service(message: Message, state: FSMContext) -> Message:
 
     try:
         master_password, new_service = helper.split_user_input(user_input=message.text, maxsplit=2)
-        derived_key = await helper.validate_master_password(master_password, message.from_user.id)
-        await helper.validate_derived_key(message.from_user.id, derived_key)
+        derived_key = await helper.unlock_vault(master_password, message.from_user.id)
     except Exception as e:
         return await helper.resend_user_input_request(state, message, str(e), current_state)
 
-    old_service, services_offset, pwds_offset = await db.key_value.execute_batch(
-        db.key_value.get_service(state),
-        db.key_value.get_services_offset(state),
-        db.key_value.get_pwds_offset(state)
-    )
-    await db.relational.change_service(
-        new_service=new_service,
-        user_id=message.from_user.id,
-        old_service=old_service
+    old_service, services_cursor, pwds_offset = await (
+        db.key_value.batch(state)
+        .get_service()
+        .get_services_cursor()
+        .get_pwds_offset()
+        .execute()
     )
+    async with db.relational.unit_of_work(message.from_user.id) as uow:
+        _, encrypted_records = await uow.run(
+            db.relational.change_service(
+                new_service=new_service,
+                user_id=message.from_user.id,
+                old_service=old_service
+            ),
+            db.relational.get_passwords(message.from_user.id, new_service, offset=0)
+        )
 
-    decrypted_records = await DecryptedRecord.decrypt(
-        await db.relational.get_passwords(message.from_user.id, new_service, offset=0),
-        derived_key
-    )
+    decrypted_records = await DecryptedRecord.decrypt(encrypted_records, derived_key)
     return await message.answer(
         text=texts.gen_passwords_text(new_service, pwds_offset),
         parse_mode="Markdown",
         reply_markup=keyboards.inline.pwd_mgr_passwords_ikm(
-            decrypted_records, new_service, pwds_offset, services_offset
+            decrypted_records, new_service, pwds_offset, services_cursor
         )
     )
 
@@ -249,7 +272,7 @@ async def delete_services(message: Message, state: FSMContext) -> Message:
 
     try:
         master_password = helper.split_user_input(user_input=message.text, maxsplit=1)[0]
-        await helper.validate_master_password(master_password, message.from_user.id)
+        await helper.unlock_vault(master_password, message.from_user.id)
     except Exception as e:
         return await helper.resend_user_input_request(state, message, str(e), current_state)
 
@@ -266,22 +289,20 @@ async def delete_service(message: Message, state: FSMContext) -> Message:
 
     try:
         master_password = helper.split_user_input(user_input=message.text, maxsplit=1)[0]
-        await helper.validate_master_password(master_password, message.from_user.id)
+        await helper.unlock_vault(master_password, message.from_user.id)
     except Exception as e:
         return await helper.resend_user_input_request(state, message, str(e), current_state)
 
     service = await db.key_value.get_service(state)
 
-    coroutines = [
-        db.relational.get_services(message.from_user.id, offset=0),
-        db.relational.delete_service(message.from_user.id, service)
-    ]
-    services, _ = await asyncio.gather(*coroutines)
+    async with db.relational.unit_of_work(message.from_user.id):
+        await db.relational.delete_service(message.from_user.id, service)
+        services_page = await helper.get_services_page(message.from_user.id)
 
-    if services:
+    if services_page.services:
         return await message.answer(
-            text=texts.SERVICE_DELETED_TEXT + texts.gen_services_text(services_offset=0),
-            reply_markup=keyboards.inline.pwd_mgr_services_ikm(services, services_offset=0)
+            text=texts.SERVICE_DELETED_TEXT + texts.SERVICES_TEXT,
+            reply_markup=keyboards.inline.pwd_mgr_services_ikm(services_page)
         )
     else:
         return await message.answer(
@@ -296,13 +317,12 @@ async def import_from_file(message: Message, state: FSMContext) -> Message:
 
     try:
         master_password = helper.split_user_input(user_input=message.caption, maxsplit=1)[0]
-        derived_key = await helper.validate_master_password(master_password, message.from_user.id)
-        await helper.validate_derived_key(message.from_user.id, derived_key)
+        derived_key = await helper.unlock_vault(master_password, message.from_user.id)
     except Exception as e:
         return await helper.resend_user_input_request(state, message, str(e), current_state)
 
     try:
-        await helper.process_importing_from_file(message=message, derived_key=derived_key)
+        result = await helper.process_importing_from_file(message=message, derived_key=derived_key)
     except Exception as e:
         record = await db.relational.get_rand_password(message.from_user.id)
         return await message.answer(
@@ -310,10 +330,10 @@ async def import_from_file(message: Message, state: FSMContext) -> Message:
             reply_markup=keyboards.inline.pwd_mgr_menu_ikm(record)
         )
 
-    services = await db.relational.get_services(message.from_user.id, offset=0)
+    services_page = await helper.get_services_page(message.from_user.id)
     return await message.answer(
-        text=texts.IMPORT_FROM_FILE_FSM + texts.gen_services_text(services_offset=0),
-        reply_markup=keyboards.inline.pwd_mgr_services_ikm(services, services_offset=0)
+        text=texts.gen_import_text(result.inserted, result.skipped) + texts.SERVICES_TEXT,
+        reply_markup=keyboards.inline.pwd_mgr_services_ikm(services_page)
     )
 
 
@@ -325,18 +345,20 @@ async def export_to_file(
 
     try:
         master_password = helper.split_user_input(user_input=message.caption, maxsplit=1)[0]
-        derived_key = await helper.validate_master_password(master_password, message.from_user.id)
-        await helper.validate_derived_key(message.from_user.id, derived_key)
+        derived_key = await helper.unlock_vault(master_password, message.from_user.id)
     except Exception as e:
         return await helper.resend_user_input_request(state, message, str(e), current_state)
 
     document = await helper.process_exporting_to_file(
         derived_key=derived_key, user_id=message.from_user.id
     )
-    document_message = await message.answer_document(
-        document=document,
-        caption=texts.EXPORT_TO_FILE_TEXT,
-    )
+    try:
+        document_message = await message.answer_document(
+            document=document,
+            caption=texts.EXPORT_TO_FILE_TEXT,
+        )
+    finally:
+        document.close()
     record = await db.relational.get_rand_password(message.from_user.id)
     message = await message.answer(
         text=texts.ENTER_TEXT,
@@ -349,22 +371,27 @@ async def export_to_file(
 async def change_master_password(message: Message, state: FSMContext) -> Message:
     current_state = await helper.handle_message_deletion(state, message)
 
+    progress_message: Optional[Message] = None
+
+    async def report_progress(percent: int) -> None:
+        nonlocal progress_message
+        text = texts.gen_rekey_progress_text(percent)
+        if progress_message is None:
+            progress_message = await message.answer(text=text)
+        else:
+            await progress_message.edit_text(text=text)
+
     try:
         user_input = helper.split_user_input(user_input=message.text, maxsplit=2)
         old_master_password, new_master_password = user_input
-        old_key = await helper.validate_master_password(old_master_password, message.from_user.id)
-        await helper.validate_derived_key(message.from_user.id, old_key)
-        new_key = await helper.validate_master_password(new_master_password, message.from_user.id)
+        await helper.change_master_password(
+            message.from_user.id, old_master_password, new_master_password, report_progress
+        )
     except Exception as e:
         return await helper.resend_user_input_request(state, message, str(e), current_state)
 
-    encrypted_records = await db.relational.export_passwords(message.from_user.id)
-    decrypted_records = await DecryptedRecord.decrypt(encrypted_records, old_key)
-    encrypted_records = await EncryptedRecord.encrypt(decrypted_records, new_key)
-    await db.relational.delete_passwords(message.from_user.id)
-    await db.relational.import_passwords(message.from_user.id, encrypted_records)
-
+    record = await db.relational.get_rand_password(message.from_user.id)
     return await message.answer(
         text=texts.ENTER_TEXT,
-        reply_markup=keyboards.inline.pwd_mgr_menu_ikm(encrypted_records[0])
+        reply_markup=keyboards.inline.pwd_mgr_menu_ikm(record)
     )
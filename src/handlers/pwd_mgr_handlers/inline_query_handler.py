@@ -1,6 +1,7 @@
 from aiogram import Router, F
 from aiogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 
+from config import bot_cfg
 from database import db
 from keyboards.buttons.pwd_mgr import inline_query_search_service
 import keyboards.inline
@@ -17,8 +18,11 @@ async def search(inline_query: InlineQuery):
         print(search_text)
         return
 
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    limit = bot_cfg.dynamic_buttons_limit
     services = await db.relational.inline_search_service(
-        user_id=inline_query.from_user.id, service=search_text)
+        user_id=inline_query.from_user.id, service=search_text, offset=offset, limit=limit)
+    next_offset = str(offset + limit) if len(services) > limit else ""
     articles = [
         InlineQueryResultArticle(
             id=service,
@@ -26,7 +30,7 @@ async def search(inline_query: InlineQuery):
             input_message_content=InputTextMessageContent(
                 message_text=f"🔎 {add_protocol(service)}"),
             reply_markup=keyboards.inline.pwd_mgr_inline_search_ikm(service)
-        ) for service in services
+        ) for service in services[:limit]
     ]
 
-    await inline_query.answer(articles, is_personal=True)
+    await inline_query.answer(articles, is_personal=True, next_offset=next_offset)
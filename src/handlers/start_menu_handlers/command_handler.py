@@ -1,8 +1,5 @@
-import asyncio
-
 from aiogram import Router
 from aiogram.filters import Command, CommandStart
-from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 from aiogram.utils.markdown import text
 
@@ -13,13 +10,12 @@ command_router = Router(name=__name__)
 
 
 @command_router.message(CommandStart())
-async def cmd_start(message: Message, state: FSMContext) -> Message:
-    asyncio.create_task(db.relational.create_user_if_not_exists(
+async def cmd_start(message: Message) -> Message:
+    await db.relational.create_user_if_not_exists(
         user_id=message.from_user.id,
         user_name=message.from_user.username,
-        full_name=message.from_user.full_name,
-        state=state
-    ))
+        full_name=message.from_user.full_name
+    )
     return await message.answer(
         text="Hello! I'm your friendly bot. How can I assist you today?",
         reply_markup=keyboards.inline.start_menu_ikm
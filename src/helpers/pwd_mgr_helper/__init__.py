@@ -1,37 +1,81 @@
 from .pwd_mgr_crypto import (
     gen_nonce,
     gen_salt,
+    gen_key_check,
+    gen_fingerprint,
+    gen_fingerprint_key,
     derive_key,
+    CryptoProfile,
+    CsvRecord,
+    ImportResult,
+    RekeyJob,
+    KdfParams,
     DecryptedRecord,
     EncryptedRecord
 )
+from .bulk_crypto import bulk_crypto, BulkCryptoEngine
+from .kdf_executor import kdf_executor, KdfBusyError
+from .key_cache import key_cache
 from .pwd_mgr_fsm import (
     create_password_record,
     validate_master_password,
     show_service_logins,
+    get_password_record,
+    get_services_page,
+    ServicesPage,
     has_valid_input_length,
     split_user_input,
     resend_user_input_request,
     process_exporting_to_file,
     process_importing_from_file,
+    backfill_fingerprints,
+    parse_csv_records,
+    write_csv_rows,
+    write_csv_export,
     handle_message_deletion,
+    unlock_vault,
+    rekey_vault,
+    change_master_password,
     validate_derived_key
 )
 
 __all__ = (
+    'backfill_fingerprints',
+    'BulkCryptoEngine',
+    'change_master_password',
+    'CryptoProfile',
+    'CsvRecord',
     'DecryptedRecord',
     'EncryptedRecord',
+    'bulk_crypto',
     'create_password_record',
     'derive_key',
+    'gen_fingerprint',
+    'gen_fingerprint_key',
+    'gen_key_check',
     'gen_nonce',
     'gen_salt',
+    'get_password_record',
+    'get_services_page',
     'handle_message_deletion',
+    'kdf_executor',
+    'KdfBusyError',
     'has_valid_input_length',
+    'ImportResult',
+    'KdfParams',
+    'key_cache',
+    'parse_csv_records',
     'process_exporting_to_file',
     'process_importing_from_file',
+    'RekeyJob',
+    'rekey_vault',
     'resend_user_input_request',
+    'ServicesPage',
     'show_service_logins',
     'split_user_input',
+    'unlock_vault',
     'validate_master_password',
-    'validate_derived_key'
+    'validate_derived_key',
+    'write_csv_export',
+    'write_csv_rows'
 )
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Optional, Union
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from config import crypto_cfg
+from .pwd_mgr_crypto import DecryptedRecord, EncryptedRecord
+
+_worker = threading.local()
+
+
+def _worker_aesgcm(derived_key: bytes) -> AESGCM:
+    """Reuses one AESGCM context per worker for consecutive chunks of the same key."""
+    if getattr(_worker, "key", None) != derived_key:
+        _worker.key = derived_key
+        _worker.aesgcm = AESGCM(derived_key)
+    return _worker.aesgcm
+
+
+def _encrypt_chunk(records: list[DecryptedRecord], derived_key: bytes) -> list[EncryptedRecord]:
+    return EncryptedRecord._encrypt(records, derived_key, _worker_aesgcm(derived_key))
+
+
+def _decrypt_chunk(records: list[EncryptedRecord], derived_key: bytes) -> list[DecryptedRecord]:
+    return DecryptedRecord._decrypt(records, derived_key, _worker_aesgcm(derived_key))
+
+
+async def _chunks[T](
+    records: Union[Iterable[T], AsyncIterable[T]], chunk_size: int
+) -> AsyncIterator[list[T]]:
+    chunk = []
+    if isinstance(records, AsyncIterable):
+        async for record in records:
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    else:
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+class BulkCryptoEngine:
+    """
+    Encrypts and decrypts whole vaults in chunks spread across a worker pool.
+
+    Results are yielded chunk by chunk in input order, with at most two chunks per worker in
+    flight, so the event loop stays responsive and memory is bounded by the window. Workers are
+    threads unless `processes` is set: per-record work is dominated by Python code that holds
+    the GIL, so only processes scale across cores, at the cost of copying the key into them.
+    """
+
+    def __init__(self, workers: int, chunk_size: int, processes: bool = False) -> None:
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.processes = processes
+        self._executor: Optional[Executor] = None
+
+    def encrypt(
+        self,
+        decrypted_records: Union[Iterable[DecryptedRecord], AsyncIterable[DecryptedRecord]],
+        derived_key: bytes
+    ) -> AsyncIterator[list[EncryptedRecord]]:
+        return self._map(_encrypt_chunk, decrypted_records, derived_key)
+
+    def decrypt(
+        self,
+        encrypted_records: Union[Iterable[EncryptedRecord], AsyncIterable[EncryptedRecord]],
+        derived_key: bytes
+    ) -> AsyncIterator[list[DecryptedRecord]]:
+        return self._map(_decrypt_chunk, encrypted_records, derived_key)
+
+    async def decrypt_records(
+        self,
+        encrypted_records: Union[Iterable[EncryptedRecord], AsyncIterable[EncryptedRecord]],
+        derived_key: bytes
+    ) -> AsyncIterator[DecryptedRecord]:
+        """Same as `decrypt`, flattened to single records, e.g. to feed `encrypt`."""
+        async for chunk in self.decrypt(encrypted_records, derived_key):
+            for record in chunk:
+                yield record
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _map[T, R](
+        self,
+        func: Callable[[list[T], bytes], list[R]],
+        records: Union[Iterable[T], AsyncIterable[T]],
+        derived_key: bytes
+    ) -> AsyncIterator[list[R]]:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        pending: deque[asyncio.Future[list[R]]] = deque()
+        try:
+            async for chunk in _chunks(records, self.chunk_size):
+                pending.append(loop.run_in_executor(executor, func, chunk, derived_key))
+                if len(pending) >= self.workers * 2:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.processes:
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="bulk-crypto"
+                )
+        return self._executor
+
+
+bulk_crypto: BulkCryptoEngine = BulkCryptoEngine(
+    workers=crypto_cfg.bulk_crypto_workers,
+    chunk_size=crypto_cfg.bulk_crypto_chunk_size,
+    processes=crypto_cfg.bulk_crypto_processes,
+)
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Any
+
+from config import crypto_cfg
+from utils import metrics
+
+MSG_ERROR_SERVER_BUSY = "Server is busy, please try again in a few seconds"
+
+_queue_depth = metrics.gauge("kdf_queue_depth", "Key derivations waiting for memory budget")
+_memory_in_use = metrics.gauge("kdf_memory_in_use_kib", "Memory reserved by running derivations")
+_queue_wait = metrics.histogram("kdf_queue_wait_seconds", "Time spent waiting for admission")
+_duration = metrics.histogram("kdf_duration_seconds", "Time spent deriving a key")
+_rejected = metrics.counter("kdf_rejected", "Derivations rejected as server busy")
+
+
+class KdfBusyError(Exception):
+    """Raised when a key derivation can't be admitted within the queue limits."""
+
+
+class KdfExecutor:
+    """
+    Runs Argon2 on a dedicated thread pool with memory-budget admission control.
+
+    Every derivation reserves its memory cost (KiB) before it starts, so the sum of running
+    derivations never exceeds the budget. Callers beyond the budget wait in a bounded queue and
+    give up with `KdfBusyError` when the queue is full or the wait exceeds the timeout. Only
+    callers that have to wait count against the queue, so a `max_queue` of 0 disables waiting.
+    """
+
+    def __init__(
+        self, memory_budget: int, memory_cost: int, max_queue: int, queue_timeout: float
+    ) -> None:
+        self.memory_budget = memory_budget
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_workers = max(1, memory_budget // memory_cost)
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="kdf")
+        self._memory_in_use = 0
+        self._waiting = 0
+        self._released = asyncio.Condition()
+
+    async def run(self, memory_cost: int, func: Callable[..., Any], *args) -> Any:
+        """
+        Runs `func(*args)` on the pool once `memory_cost` KiB of budget are available.
+
+        :raise KdfBusyError: If the queue is full or the wait times out.
+        """
+        memory_cost = min(memory_cost, self.memory_budget)
+        await self._acquire(memory_cost)
+        started = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            _duration.observe(time.monotonic() - started)
+            await self._release(memory_cost)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _acquire(self, memory_cost: int) -> None:
+        # Admitted right away if it fits and nobody is ahead in the queue
+        if not self._waiting and self._memory_in_use + memory_cost <= self.memory_budget:
+            self._reserve(memory_cost)
+            _queue_wait.observe(0)
+            return
+
+        if self._waiting >= self.max_queue:
+            _rejected.inc()
+            logging.warning("KDF queue is full, rejecting derivation")
+            raise KdfBusyError(MSG_ERROR_SERVER_BUSY)
+
+        self._waiting += 1
+        _queue_depth.inc()
+        started = time.monotonic()
+        try:
+            async with self._released:
+                await asyncio.wait_for(
+                    self._released.wait_for(
+                        lambda: self._memory_in_use + memory_cost <= self.memory_budget
+                    ),
+                    timeout=self.queue_timeout
+                )
+                self._reserve(memory_cost)
+        except TimeoutError:
+            _rejected.inc()
+            logging.warning(f"KDF admission timed out after {self.queue_timeout}s")
+            raise KdfBusyError(MSG_ERROR_SERVER_BUSY)
+        finally:
+            self._waiting -= 1
+            _queue_depth.dec()
+            _queue_wait.observe(time.monotonic() - started)
+
+    def _reserve(self, memory_cost: int) -> None:
+        self._memory_in_use += memory_cost
+        _memory_in_use.set(self._memory_in_use)
+
+    async def _release(self, memory_cost: int) -> None:
+        async with self._released:
+            self._memory_in_use -= memory_cost
+            _memory_in_use.set(self._memory_in_use)
+            self._released.notify_all()
+
+
+kdf_executor: KdfExecutor = KdfExecutor(
+    memory_budget=crypto_cfg.kdf_memory_budget,
+    memory_cost=crypto_cfg.argon2_memory_cost,
+    max_queue=crypto_cfg.kdf_max_queue,
+    queue_timeout=crypto_cfg.kdf_queue_timeout,
+)
@@ -0,0 +1,130 @@
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import crypto_cfg
+from .pwd_mgr_crypto import gen_key_check
+
+
+class _CachedKey:
+    __slots__ = ("key", "password_mac", "created_at", "last_used_at")
+
+    def __init__(self, key: bytes, password_mac: bytes, now: float) -> None:
+        self.key = bytearray(key)
+        self.password_mac = password_mac
+        self.created_at = now
+        self.last_used_at = now
+
+    def zeroize(self) -> None:
+        self.key[:] = bytes(len(self.key))
+
+
+class DerivedKeyCache:
+    """
+    Bounded in-process cache of derived keys for unlock sessions.
+
+    Entries are keyed by (user_id, salt) and are only returned for the master password they were
+    derived from and while they match the user's key-check value, so a key changed by another
+    instance is never served. The password itself is never stored, only its MAC under a
+    per-process secret.
+    Entries expire after an idle and an absolute TTL, the least recently used entry is evicted
+    when the cache is full, and evicted keys are overwritten with zeros.
+    """
+
+    def __init__(
+        self, enabled: bool, max_entries: int, idle_ttl: int, absolute_ttl: int
+    ) -> None:
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.absolute_ttl = absolute_ttl
+        self._secret = os.urandom(32)
+        self._entries: OrderedDict[tuple[int, bytes], _CachedKey] = OrderedDict()
+
+    def get(
+        self, user_id: int, salt: bytes, master_password: str, key_check: Optional[str]
+    ) -> Optional[bytes]:
+        """
+        Returns the cached key if the session is alive, the master password matches and the key
+        still matches `key_check`. A key that doesn't is evicted.
+
+        :return: A copy of the derived key or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        cache_key = (user_id, salt)
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            return None
+
+        now = time.monotonic()
+        if self._is_expired(entry, now):
+            self._evict(cache_key)
+            return None
+        if not hmac.compare_digest(entry.password_mac, self._mac(master_password)):
+            return None
+        if key_check is None or not hmac.compare_digest(gen_key_check(entry.key), key_check):
+            self._evict(cache_key)
+            return None
+
+        entry.last_used_at = now
+        self._entries.move_to_end(cache_key)
+        return bytes(entry.key)
+
+    def put(self, user_id: int, salt: bytes, master_password: str, derived_key: bytes) -> None:
+        """Stores a key that has just been derived and validated."""
+        if not self.enabled:
+            return
+
+        cache_key = (user_id, salt)
+        if cache_key in self._entries:
+            self._evict(cache_key)
+
+        now = time.monotonic()
+        self._purge_expired(now)
+        while len(self._entries) >= self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+        self._entries[cache_key] = _CachedKey(derived_key, self._mac(master_password), now)
+
+    def invalidate(self, user_id: int) -> None:
+        """Ends every unlock session of the user, e.g. after the master password changed."""
+        for cache_key in [cache_key for cache_key in self._entries if cache_key[0] == user_id]:
+            self._evict(cache_key)
+
+    def clear(self) -> None:
+        for cache_key in list(self._entries):
+            self._evict(cache_key)
+
+    def _mac(self, master_password: str) -> bytes:
+        return hmac.new(self._secret, master_password.encode(), hashlib.sha256).digest()
+
+    def _is_expired(self, entry: _CachedKey, now: float) -> bool:
+        return (
+            now - entry.last_used_at > self.idle_ttl
+            or now - entry.created_at > self.absolute_ttl
+        )
+
+    def _purge_expired(self, now: float) -> None:
+        expired = [
+            cache_key for cache_key, entry in self._entries.items()
+            if self._is_expired(entry, now)
+        ]
+        for cache_key in expired:
+            self._evict(cache_key)
+
+    def _evict(self, cache_key: tuple[int, bytes]) -> None:
+        entry = self._entries.pop(cache_key)
+        entry.zeroize()
+
+
+key_cache: DerivedKeyCache = DerivedKeyCache(
+    enabled=crypto_cfg.key_cache_enabled,
+    max_entries=crypto_cfg.key_cache_max_entries,
+    idle_ttl=crypto_cfg.key_cache_idle_ttl,
+    absolute_ttl=crypto_cfg.key_cache_absolute_ttl,
+)
@@ -1,18 +1,29 @@
 from __future__ import annotations
 
 import asyncio
-import base64
+import hashlib
+import hmac
 import json
 import os
-from typing import Iterable, overload
+import struct
+from typing import Iterable, NamedTuple, Optional, overload
 
 import argon2.low_level
 from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
-from config import crypto_cfg
+from config import bot_cfg, crypto_cfg
 from utils import add_protocol, strip_protocol
+from .kdf_executor import kdf_executor
+
+# Record layout: <format version: 1 byte><nonce><AES-GCM ciphertext>
+RECORD_FORMAT_JSON = 0  # legacy: JSON {"login", "password"} plaintext, stored as base64 TEXT
+RECORD_FORMAT_BINARY = 1  # <u16 login length><login><u16 password length><password>
+_LENGTH_PREFIX = struct.Struct(">H")
+
+_SINGLE_FLIGHT_SECRET = os.urandom(32)
+_in_flight: dict[bytes, asyncio.Task[bytes]] = {}
 
 
 def gen_salt() -> bytes:
@@ -23,36 +34,147 @@ def gen_nonce() -> bytes:
     return os.urandom(crypto_cfg.random_nonce_length)
 
 
-async def derive_key(master_password: str, salt: bytes) -> bytes:
+class KdfParams(NamedTuple):
+    """
+    Argon2 cost parameters a key was derived with.
+    """
+    time_cost: int
+    memory_cost: int
+    parallelism: int
+
+    @classmethod
+    def current(cls) -> KdfParams:
+        """Parameters configured for newly derived keys."""
+        return cls(
+            time_cost=crypto_cfg.argon2_time_cost,
+            memory_cost=crypto_cfg.argon2_memory_cost,
+            parallelism=crypto_cfg.argon2_parallelism,
+        )
+
+
+class CryptoProfile(NamedTuple):
+    """
+    Per-user inputs for deriving and validating the key.
+    """
+    salt: bytes
+    key_check: Optional[str]
+    kdf_params: KdfParams
+    rekey_pending: bool = False  # the vault is partially re-encrypted under a new key
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "salt": self.salt.decode("utf-8"),
+            "key_check": self.key_check,
+            "kdf_params": self.kdf_params,
+            "rekey_pending": self.rekey_pending,
+        })
+
+    @classmethod
+    def from_json(cls, data: str | bytes) -> CryptoProfile:
+        data = json.loads(data)
+        return cls(
+            salt=data["salt"].encode("utf-8"),
+            key_check=data["key_check"],
+            kdf_params=KdfParams(*data["kdf_params"]),
+            rekey_pending=data.get("rekey_pending", False),
+        )
+
+
+class RekeyJob(NamedTuple):
+    """
+    A Master Password change in progress. Passwords up to `last_password_id` are already
+    encrypted under the new key, which `key_check` and `kdf_params` belong to.
+    """
+    key_check: str
+    kdf_params: KdfParams
+    last_password_id: int
+
+
+async def derive_key(
+    master_password: str, salt: bytes, kdf_params: Optional[KdfParams] = None
+) -> bytes:
     """
     Derive a 256-bit encryption key from a master password using Argon2.
 
     :param master_password: The user-provided master password.
     :param salt: Salt for key derivation.
+    :param kdf_params: Argon2 parameters of the user, the configured ones by default.
     :return: A securely derived 256-bit key.
+    :raise KdfBusyError: If the KDF executor can't admit the derivation in time.
+    """
+    kdf_params = kdf_params or KdfParams.current()
+    flight_key = _single_flight_key(master_password, salt, kdf_params)
+    task = _in_flight.get(flight_key)
+    if task is None:
+        task = asyncio.create_task(kdf_executor.run(
+            kdf_params.memory_cost, _derive_key, master_password, salt, kdf_params
+        ))
+        _in_flight[flight_key] = task
+        task.add_done_callback(lambda t: _finish_flight(flight_key, t))
+    # Shielded, so a cancelled caller doesn't cancel the derivation for the others
+    return await asyncio.shield(task)
+
+
+def gen_key_check(derived_key: bytes) -> str:
+    """
+    Derives the per-user verifier stored next to the salt to validate keys without decryption.
+    """
+    return hmac.new(derived_key, b"key-check", hashlib.sha256).hexdigest()
+
+
+def gen_fingerprint_key(derived_key: bytes) -> bytes:
+    """
+    Derives the subkey credentials are fingerprinted with, independent of the encryption key.
     """
-    return await asyncio.to_thread(_derive_key, master_password, salt)
+    return hmac.new(derived_key, b"fingerprint", hashlib.sha256).digest()
 
 
-def _derive_key(master_password: str, salt: bytes) -> bytes:
+def gen_fingerprint(fingerprint_key: bytes, login: str, password: str) -> bytes:
+    """
+    Deterministic keyed digest of a login and password, used to detect duplicates within a
+    service without decrypting the stored records.
+    """
+    return hmac.new(fingerprint_key, _pack_credentials(login, password), hashlib.sha256).digest()
+
+
+def _single_flight_key(master_password: str, salt: bytes, kdf_params: KdfParams) -> bytes:
+    """
+    Identifies identical concurrent derivations without keeping the password around.
+    """
+    message = (
+        repr(tuple(kdf_params)).encode() + len(salt).to_bytes(4, "big") + salt
+        + master_password.encode()
+    )
+    return hmac.new(_SINGLE_FLIGHT_SECRET, message, hashlib.sha256).digest()
+
+
+def _finish_flight(flight_key: bytes, task: asyncio.Task[bytes]) -> None:
+    _in_flight.pop(flight_key, None)
+    if not task.cancelled():
+        task.exception()  # retrieved here in case every caller was cancelled
+
+
+def _derive_key(master_password: str, salt: bytes, kdf_params: KdfParams) -> bytes:
     raw_key = argon2.low_level.hash_secret_raw(
         secret=master_password.encode() + crypto_cfg.pepper,
         salt=salt,
-        time_cost=crypto_cfg.argon2_time_cost,
-        memory_cost=crypto_cfg.argon2_memory_cost,
-        parallelism=crypto_cfg.argon2_parallelism,
+        time_cost=kdf_params.time_cost,
+        memory_cost=kdf_params.memory_cost,
+        parallelism=kdf_params.parallelism,
         hash_len=crypto_cfg.argon2_hash_length,
         type=crypto_cfg.argon2_type,
     )
     return raw_key
 
 
-class EncryptedRecord(BaseModel):
+class EncryptedRecord(NamedTuple):
     """
     Represents an encrypted record containing a service name and ciphertext.
     """
     service: str
-    ciphertext: str
+    ciphertext: bytes
+    password_id: Optional[int] = None  # None until the record is stored
+    fingerprint: Optional[bytes] = None  # None for records stored before fingerprints existed
 
     @classmethod
     @overload
@@ -87,29 +209,37 @@ class EncryptedRecord(BaseModel):
     def _encrypt(
         cls,
         decrypted_records: Iterable[DecryptedRecord],
-        derived_key: bytes
+        derived_key: bytes,
+        aesgcm: Optional[AESGCM] = None
     ) -> list[EncryptedRecord]:
-        aesgcm = AESGCM(derived_key)
+        aesgcm = aesgcm or AESGCM(derived_key)
+        fingerprint_key = gen_fingerprint_key(derived_key)
+        version = RECORD_FORMAT_BINARY.to_bytes(1, "big")
 
         encrypted_records = []
         for decrypted_record in decrypted_records:
             nonce = gen_nonce()
-            plaintext = decrypted_record.model_dump_json(exclude={"service"}).encode("utf-8")
-            ciphertext = aesgcm.encrypt(nonce, plaintext, associated_data=None)
-            b64 = base64.urlsafe_b64encode(nonce + ciphertext).decode()
+            plaintext = _pack_credentials(decrypted_record.login, decrypted_record.password)
+            ciphertext = aesgcm.encrypt(nonce, plaintext, associated_data=version)
 
             service = strip_protocol(decrypted_record.service)
-            encrypted_records.append(cls(service=service, ciphertext=b64))
+            fingerprint = gen_fingerprint(
+                fingerprint_key, decrypted_record.login, decrypted_record.password
+            )
+            encrypted_records.append(cls(
+                service, version + nonce + ciphertext, decrypted_record.password_id, fingerprint
+            ))
         return encrypted_records
 
 
-class DecryptedRecord(BaseModel):
+class DecryptedRecord(NamedTuple):
     """
     Represents a decrypted record containing a service name, login, and password.
     """
     service: str
     login: str
     password: str
+    password_id: Optional[int] = None  # None until the record is stored
 
     @classmethod
     @overload
@@ -143,22 +273,76 @@ class DecryptedRecord(BaseModel):
     def _decrypt(
         cls,
         encrypted_records: Iterable[EncryptedRecord],
-        derived_key: bytes
+        derived_key: bytes,
+        aesgcm: Optional[AESGCM] = None
     ) -> list[DecryptedRecord]:
-        aesgcm = AESGCM(derived_key)
+        aesgcm = aesgcm or AESGCM(derived_key)
+        nonce_end = 1 + crypto_cfg.random_nonce_length
 
         decrypted_records = []
         for encrypted_record in encrypted_records:
-            b64 = base64.urlsafe_b64decode(encrypted_record.ciphertext)
-            nonce = b64[:crypto_cfg.random_nonce_length]
-            ciphertext = b64[crypto_cfg.random_nonce_length:]
+            blob = encrypted_record.ciphertext
+            version = blob[0]
+            nonce = blob[1:nonce_end]
+            ciphertext = blob[nonce_end:]
 
             try:
-                plaintext = aesgcm.decrypt(nonce, ciphertext, associated_data=None)
+                if version == RECORD_FORMAT_BINARY:
+                    plaintext = aesgcm.decrypt(nonce, ciphertext, associated_data=blob[:1])
+                    login, password = _unpack_credentials(plaintext)
+                elif version == RECORD_FORMAT_JSON:
+                    plaintext = aesgcm.decrypt(nonce, ciphertext, associated_data=None)
+                    data = json.loads(plaintext.decode("utf-8"))
+                    login, password = data["login"], data["password"]
+                else:
+                    raise ValueError(f"Unknown record format version: {version}")
             except InvalidTag:
                 raise
 
-            data = json.loads(plaintext.decode("utf-8"))
-            data["service"] = add_protocol(encrypted_record.service)
-            decrypted_records.append(cls(**data))
+            service = add_protocol(encrypted_record.service)
+            decrypted_records.append(cls(service, login, password, encrypted_record.password_id))
         return decrypted_records
+
+
+class ImportResult(NamedTuple):
+    """
+    Outcome of an import: `skipped` counts records already in the vault or repeated in the file.
+    """
+    inserted: int
+    skipped: int
+
+
+class CsvRecord(BaseModel):
+    """
+    A row of an imported CSV file. Validation happens here only, records are plain tuples after.
+    """
+    url: str = ""
+    username: str = ""
+    password: str = ""
+
+    @field_validator("url", "username", "password", mode="before")
+    @classmethod
+    def strip_separator(cls, value: Optional[str]) -> str:
+        return (value or "").replace(bot_cfg.sep, "")
+
+    def to_record(self) -> DecryptedRecord:
+        return DecryptedRecord(service=self.url, login=self.username, password=self.password)
+
+
+def _pack_credentials(login: str, password: str) -> bytes:
+    login_bytes, password_bytes = login.encode("utf-8"), password.encode("utf-8")
+    return b"".join((
+        _LENGTH_PREFIX.pack(len(login_bytes)), login_bytes,
+        _LENGTH_PREFIX.pack(len(password_bytes)), password_bytes
+    ))
+
+
+def _unpack_credentials(plaintext: bytes) -> tuple[str, str]:
+    (login_length,) = _LENGTH_PREFIX.unpack_from(plaintext, 0)
+    login_end = _LENGTH_PREFIX.size + login_length
+    (password_length,) = _LENGTH_PREFIX.unpack_from(plaintext, login_end)
+    password_start = login_end + _LENGTH_PREFIX.size
+    return (
+        plaintext[_LENGTH_PREFIX.size:login_end].decode("utf-8"),
+        plaintext[password_start:password_start + password_length].decode("utf-8")
+    )
@@ -2,12 +2,19 @@ from __future__ import annotations
 
 import asyncio
 import csv
+import hmac
+import logging
 import re
-from io import BytesIO
+from contextlib import aclosing
+from io import TextIOWrapper
+from tempfile import SpooledTemporaryFile
+from typing import (
+    AsyncIterable, AsyncIterator, Awaitable, BinaryIO, Callable, Iterable, NamedTuple, Optional
+)
 
 import aiofiles
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message, BufferedInputFile
+from aiogram.types import Message
 from cryptography.exceptions import InvalidTag
 from pydantic import ValidationError
 
@@ -15,17 +22,73 @@ import keyboards.inline
 from config import bot_cfg
 from database import db
 from models.callback_data import PasswordManagerCallbackData as PwdMgrCb
-from utils import delete_file, download_file, delete_fsm_message
+from utils import delete_file, download_file, delete_fsm_message, SpooledInputFile
 from . import derive_key
-from .pwd_mgr_crypto import DecryptedRecord, EncryptedRecord
+from .bulk_crypto import bulk_crypto
+from .key_cache import key_cache
+from .kdf_executor import KdfBusyError
+from .pwd_mgr_crypto import (
+    CsvRecord, CryptoProfile, DecryptedRecord, EncryptedRecord, ImportResult, KdfParams,
+    gen_fingerprint, gen_fingerprint_key, gen_key_check
+)
 
 MAX_CHAR_LIMIT = 64
 MAX_SERVICE_CHAR_LIMIT = 45
 MSG_ERROR_INVALID_FORMAT = "Wrong format"
 MSG_ERROR_LONG_INPUT = "Login or password is too long"
 MSG_ERROR_MASTER_PASS = "Wrong Master Password"
+MSG_ERROR_REKEY_PENDING = ("Changing the Master Password was interrupted. "
+                           "Please change it again with the same passwords to finish")
+MSG_ERROR_REKEY_MISMATCH = "The new Master Password differs from the one of the interrupted change"
+MSG_ERROR_REKEY_RUNNING = "The Master Password is already being changed"
+MSG_ERROR_KDF_MIGRATION_RUNNING = "Your vault is being upgraded, please try again in a minute"
+MSG_ERROR_PASSWORD_NOT_FOUND = "This password doesn't exist anymore"
+CSV_FIELDS = ("url", "username", "password")
 MIN_RECORD_LENGTH = len(f"{PwdMgrCb.EnterPassword.__prefix__}{bot_cfg.sep}{bot_cfg.sep}")
 
+_kdf_migrations: dict[int, asyncio.Task[None]] = {}
+
+
+class ServicesPage(NamedTuple):
+    """
+    A page of the services list. `cursor` reopens this page, `previous_cursor` and
+    `next_cursor` open the neighbouring ones and are None if there is no such page.
+    """
+    services: list[str]
+    cursor: int
+    previous_cursor: Optional[int]
+    next_cursor: Optional[int]
+
+
+async def get_services_page(user_id: int, cursor: int = 0, backward: bool = False) -> ServicesPage:
+    """
+    Fetches the page of services starting at the `cursor` service, or the page ending right
+    before it if `backward`.
+    """
+    limit = bot_cfg.dynamic_buttons_limit
+    if backward:
+        rows = await db.relational.get_services(user_id, cursor, backward=True)
+        if rows:
+            has_previous = len(rows) > limit
+            rows = rows[:limit][::-1]
+            first_cursor = rows[0][1] if has_previous else None
+            return ServicesPage(
+                services=[service for service, _ in rows],
+                cursor=first_cursor or 0,
+                previous_cursor=first_cursor,
+                next_cursor=cursor
+            )
+        cursor = 0  # Nothing before the cursor service anymore, start over
+
+    rows = await db.relational.get_services(user_id, cursor)
+    rows, more = rows[:limit], rows[limit:]
+    return ServicesPage(
+        services=[service for service, _ in rows],
+        cursor=cursor,
+        previous_cursor=rows[0][1] if cursor and rows else None,
+        next_cursor=more[0][1] if more else None
+    )
+
 
 async def show_service_logins(
     message: Message,
@@ -33,9 +96,11 @@ async def show_service_logins(
     derived_key: bytes,
     service: str
 ) -> tuple[list[DecryptedRecord], int, int]:
-    pwd_offset, services_offset = await db.key_value.execute_batch(
-        db.key_value.get_pwds_offset(state),
-        db.key_value.get_services_offset(state),
+    pwd_offset, services_cursor = await (
+        db.key_value.batch(state)
+        .get_pwds_offset()
+        .get_services_cursor()
+        .execute()
     )
     encrypted_records = await db.relational.get_passwords(
         user_id=message.from_user.id,
@@ -44,7 +109,22 @@ async def show_service_logins(
     )
     decrypted_records = await DecryptedRecord.decrypt(encrypted_records, derived_key)
 
-    return decrypted_records, pwd_offset, services_offset
+    return decrypted_records, pwd_offset, services_cursor
+
+
+async def get_password_record(
+    user_id: int, password_id: int, derived_key: bytes
+) -> DecryptedRecord:
+    """
+    Fetches and decrypts a single password, so its credentials never have to be kept between
+    requests.
+
+    :raise LookupError: If the password doesn't exist anymore.
+    """
+    encrypted_record = await db.relational.get_password(user_id, password_id)
+    if encrypted_record is None:
+        raise LookupError(MSG_ERROR_PASSWORD_NOT_FOUND)
+    return await DecryptedRecord.decrypt(encrypted_record, derived_key)
 
 
 def has_valid_input_length(login: str, password: str) -> None:
@@ -61,11 +141,18 @@ def has_valid_service_length(service: str) -> None:
 
 async def create_password_record(
     decrypted_record: DecryptedRecord, user_id: int, derived_key: bytes
-) -> None:
+) -> DecryptedRecord:
+    """
+    Encrypts and stores a record.
+
+    :return: The record with its assigned password_id.
+    """
     encrypted_record = await EncryptedRecord.encrypt(decrypted_record, derived_key)
-    await db.relational.create_password(
-        user_id, encrypted_record.service, encrypted_record.ciphertext
+    password_id = await db.relational.create_password(
+        user_id, encrypted_record.service, encrypted_record.ciphertext,
+        encrypted_record.fingerprint
     )
+    return decrypted_record._replace(password_id=password_id)
 
 
 def split_user_input(user_input: str, maxsplit: int, sep: str = bot_cfg.sep) -> tuple[str, ...]:
@@ -82,13 +169,15 @@ async def resend_user_input_request(
     error_message: str,
     current_state: str,
 ) -> Message:
-    input_format, _ = await db.key_value.execute_batch(
-        db.key_value.get_input_format_text(state),
-        db.key_value.set_state(current_state, state)
+    (input_format,) = await (
+        db.key_value.batch(state)
+        .get_input_format_text()
+        .set_state(current_state)
+        .execute()
     )
     message_to_delete = await message.answer(
         text=f"{error_message}\n\n{input_format}",
-        reply_markup=keyboards.inline.return_to_services_ikm(services_offset=0)
+        reply_markup=keyboards.inline.return_to_services_ikm(services_cursor=0)
     )
     await db.key_value.set_message_id_to_delete(message_to_delete.message_id, state)
     return message_to_delete
@@ -96,19 +185,21 @@ async def resend_user_input_request(
 
 async def handle_message_deletion(state: FSMContext, message: Message) -> str:
     results, _ = await asyncio.gather(
-        db.key_value.execute_batch(
-            db.key_value.get_state(state),
-            db.key_value.get_message_id_to_delete(state),
-            db.key_value.clear_state(state)
+        (
+            db.key_value.batch(state)
+            .get_state()
+            .get_message_id_to_delete()
+            .clear_state()
+            .execute()
         ),
         message.bot.delete_message(chat_id=message.chat.id, message_id=message.message_id),
     )
-    current_state, message_id, _ = results
+    current_state, message_id = results
     await delete_fsm_message(message_id, message)
     return current_state
 
 
-async def process_importing_from_file(message: Message, derived_key: bytes):
+async def process_importing_from_file(message: Message, derived_key: bytes) -> ImportResult:
     try:
         temp_file_path = await download_file(message)
     except Exception:
@@ -123,67 +214,329 @@ async def process_importing_from_file(message: Message, derived_key: bytes):
     finally:
         await delete_file(temp_file_path)
 
+    decrypted_records = parse_csv_records(lines)
+    await backfill_fingerprints(message.from_user.id, derived_key)
+
+    async with aclosing(bulk_crypto.encrypt(decrypted_records, derived_key)) as encrypted_batches:
+        return await db.relational.import_passwords(
+            user_id=message.from_user.id, encrypted_batches=encrypted_batches
+        )
+
+
+async def backfill_fingerprints(user_id: int, derived_key: bytes) -> None:
+    """
+    Fingerprints passwords stored before fingerprints existed, so imports can skip duplicates
+    of them. Does nothing once the whole vault is fingerprinted.
+    """
+    fingerprint_key = gen_fingerprint_key(derived_key)
+    batches = db.relational.export_passwords(user_id, unfingerprinted=True)
+    async with aclosing(batches) as encrypted_batches:
+        records = _flatten(encrypted_batches)
+        async for decrypted_records in bulk_crypto.decrypt(records, derived_key):
+            await db.relational.set_fingerprints(
+                user_id,
+                [record.password_id for record in decrypted_records],
+                [gen_fingerprint(fingerprint_key, r.login, r.password) for r in decrypted_records]
+            )
+
+
+def parse_csv_records(lines: Iterable[str]) -> list[DecryptedRecord]:
+    """
+    Parses an imported CSV file, skipping rows that don't pass validation.
+
+    :param lines: Lines of a CSV file with `url`, `username` and `password` columns.
+    """
     decrypted_records = []
     reader = csv.DictReader(lines)
     for row in reader:
-        service = row.get("url", "").replace(bot_cfg.sep, "")
-        login = row.get("username", "").replace(bot_cfg.sep, "")
-        password = row.get("password", "").replace(bot_cfg.sep, "")
         try:
-            has_valid_service_length(service)
-            has_valid_input_length(login, password)
-            decrypted_record = DecryptedRecord(service=service, login=login, password=password)
+            csv_record = CsvRecord.model_validate(row)
+            has_valid_service_length(csv_record.url)
+            has_valid_input_length(csv_record.username, csv_record.password)
         except (ValueError, ValidationError):
             continue
-        decrypted_records.append(decrypted_record)
-    encrypted_records = await EncryptedRecord.encrypt(decrypted_records, derived_key)
+        decrypted_records.append(csv_record.to_record())
+    return decrypted_records
 
-    await db.relational.import_passwords(
-        user_id=message.from_user.id, encrypted_records=encrypted_records
+
+def write_csv_rows(writer: csv.writer, decrypted_records: Iterable[DecryptedRecord]) -> None:
+    """
+    Writes records as exported CSV rows, under a `CSV_FIELDS` header.
+    """
+    writer.writerows(
+        (record.service, record.login, record.password) for record in decrypted_records
     )
 
 
-async def process_exporting_to_file(derived_key: bytes, user_id: int) -> BufferedInputFile:
-    encrypted_records = await db.relational.export_passwords(user_id=user_id)
-    decrypted_records = await DecryptedRecord.decrypt(encrypted_records, derived_key)
+async def write_csv_export(
+    file: BinaryIO, encrypted_batches: AsyncIterable[list[EncryptedRecord]], derived_key: bytes
+) -> None:
+    """
+    Decrypts batches of records as they arrive and appends them to `file` as CSV, so only a
+    few batches are held in memory at any time.
+    """
+    text = TextIOWrapper(file, encoding="utf-8", newline="")
+    writer = csv.writer(text, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    writer.writerow(CSV_FIELDS)
+    async for decrypted_records in bulk_crypto.decrypt(_flatten(encrypted_batches), derived_key):
+        write_csv_rows(writer, decrypted_records)
+    text.flush()
+    text.detach()  # leaves `file` open for the upload
 
-    csv_lines = ['"url","username","password"']
-    for record in decrypted_records:
-        csv_lines.append(
-            f'"{record.service}","{record.login}","{record.password}"'
-        )
 
-    csv_content = "\n".join(csv_lines).encode('utf-8')
-    buffer = BytesIO(csv_content)
+async def process_exporting_to_file(derived_key: bytes, user_id: int) -> SpooledInputFile:
+    """
+    Streams the vault through a server-side cursor into a CSV file that stays in memory while
+    small and spills to disk after `bot_cfg.export_spool_size` bytes.
+
+    :return: The file to upload, to be closed by the caller afterwards.
+    """
+    file = SpooledTemporaryFile(max_size=bot_cfg.export_spool_size)
+    try:
+        async with aclosing(db.relational.export_passwords(user_id)) as encrypted_batches:
+            await write_csv_export(file, encrypted_batches, derived_key)
+    except BaseException:
+        file.close()
+        raise
+    return SpooledInputFile(file, filename=f"{user_id}_passwords.csv")
 
-    return BufferedInputFile(file=buffer.read(), filename=f"{user_id}_passwords.csv")
 
+async def _flatten[T](batches: AsyncIterable[list[T]]) -> AsyncIterator[T]:
+    async for batch in batches:
+        for item in batch:
+            yield item
 
-async def validate_master_password(master_password: str, user_id: int) -> bytes:
+
+async def validate_master_password(
+    master_password: str, user_id: int, kdf_params: Optional[KdfParams] = None
+) -> bytes:
     """
-    Verifies the correctness of a master password.
+    Verifies the complexity of a new master password and derives its key.
 
     :param master_password: The user-provided master password.
     :param user_id: The ID of the user.
+    :param kdf_params: Argon2 parameters, the currently configured ones by default.
     :raise ValueError: If the password does not meet the required complexity.
-    :raise InvalidTag: If the decryption fails due to an incorrect key or data corruption.
     """
     try:
         _validate_master_password(master_password)
     except ValueError:
         raise
 
-    salt = await db.relational.get_salt(user_id)
-    return await derive_key(master_password, salt)
+    profile = await db.relational.get_crypto_profile(user_id)
+    return await derive_key(master_password, profile.salt, kdf_params or KdfParams.current())
+
+
+async def unlock_vault(master_password: str, user_id: int) -> bytes:
+    """
+    Returns the user's validated key, skipping Argon2 while an unlock session is alive.
+
+    :param master_password: The user-provided master password.
+    :param user_id: The ID of the user.
+    :raise ValueError: If the password does not meet the required complexity, a Master
+        Password change was interrupted or another instance is migrating the KDF parameters.
+    :raise InvalidTag: If the master password is wrong.
+    """
+    _validate_master_password(master_password)
+
+    profile = await db.relational.get_crypto_profile(user_id)
+    if profile.rekey_pending:
+        return await _resume_kdf_migration(master_password, user_id, profile)
+    derived_key = key_cache.get(user_id, profile.salt, master_password, profile.key_check)
+    if derived_key is not None:
+        return derived_key
+
+    derived_key = await derive_key(master_password, profile.salt, profile.kdf_params)
+    await validate_derived_key(user_id, derived_key, profile.key_check)
+    if profile.kdf_params != KdfParams.current():
+        derived_key = await _migrate_kdf_params(master_password, user_id, profile, derived_key)
+    key_cache.put(user_id, profile.salt, master_password, derived_key)
+    return derived_key
+
+
+async def change_master_password(
+    user_id: int,
+    old_master_password: str,
+    new_master_password: str,
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None
+) -> None:
+    """
+    Validates both Master Passwords, deriving their keys in parallel, and re-keys the vault.
+    An interrupted change is resumed with the KDF parameters it was started with.
+
+    :param on_progress: Called with the percentage of re-encrypted passwords.
+    :raise ValueError: If a password doesn't meet the complexity requirements or the new one
+        differs from the one of the interrupted change.
+    :raise InvalidTag: If the current Master Password is wrong.
+    """
+    _validate_master_password(old_master_password)
+    profile, job = await asyncio.gather(
+        db.relational.get_crypto_profile(user_id), db.relational.get_rekey_job(user_id)
+    )
+    kdf_params = job.kdf_params if job else KdfParams.current()
+    old_key, new_key = await asyncio.gather(
+        derive_key(old_master_password, profile.salt, profile.kdf_params),
+        validate_master_password(new_master_password, user_id, kdf_params)
+    )
+    await validate_derived_key(user_id, old_key, profile.key_check)
+    await rekey_vault(user_id, old_key, new_key, kdf_params, on_progress)
+
+
+async def rekey_vault(
+    user_id: int,
+    old_key: bytes,
+    new_key: bytes,
+    kdf_params: KdfParams,
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None
+) -> None:
+    """
+    Re-encrypts all passwords of a user under a new key derived with `kdf_params`.
+
+    Passwords are walked in password_id order, one transaction per batch, and every batch
+    moves the checkpoint of the user's re-key job. The vault can't be unlocked until the job
+    finishes, except by the Master Password of a KDF parameters migration, which resumes it.
+    Running it again with the same keys continues after the checkpoint.
+
+    :param on_progress: Called with the percentage of re-encrypted passwords, in steps of 10.
+    :raise ValueError: If `new_key` doesn't belong to an interrupted job or another run of the
+        job moved the checkpoint.
+    """
+    key_check = gen_key_check(new_key)
+    key_cache.invalidate(user_id)
+    job = await db.relational.start_rekey(user_id, key_check, kdf_params)
+    if not hmac.compare_digest(job.key_check, key_check):
+        raise ValueError(MSG_ERROR_REKEY_MISMATCH)
+
+    last_password_id = job.last_password_id
+    total = await db.relational.count_passwords(user_id, last_password_id)
+    done, reported = 0, None
+    while True:
+        percent = min(done * 100 // total, 100) // 10 * 10 if total else 100
+        if on_progress is not None and percent != reported:
+            await on_progress(percent)
+            reported = percent
+
+        encrypted_records = await db.relational.get_rekey_batch(user_id, last_password_id)
+        if not encrypted_records:
+            break
+        encrypted_records = [
+            record
+            async for chunk in bulk_crypto.encrypt(
+                bulk_crypto.decrypt_records(encrypted_records, old_key), new_key
+            )
+            for record in chunk
+        ]
+        if not await db.relational.rekey_batch(user_id, encrypted_records, last_password_id):
+            raise ValueError(MSG_ERROR_REKEY_RUNNING)
+        last_password_id = encrypted_records[-1].password_id
+        done += len(encrypted_records)
+
+    await db.relational.finish_rekey(user_id)
+    logging.info(f"Re-encrypted {done} passwords of user {user_id}")
+
+
+async def _migrate_kdf_params(
+    master_password: str, user_id: int, profile: CryptoProfile, derived_key: bytes
+) -> bytes:
+    """
+    Moves a user to the configured KDF parameters on unlock. The old key keeps working if the
+    migration can't run now, it is retried on the next unlock.
+    """
+    kdf_params = KdfParams.current()
+    try:
+        new_key = await derive_key(master_password, profile.salt, kdf_params)
+    except KdfBusyError:
+        logging.warning(f"KDF parameters migration of user {user_id} postponed, server is busy")
+        return derived_key
+    await _run_kdf_migration(user_id, derived_key, new_key, kdf_params)
+    logging.info(f"Migrated user {user_id} from {profile.kdf_params} to {kdf_params}")
+    return new_key
+
+
+async def _resume_kdf_migration(
+    master_password: str, user_id: int, profile: CryptoProfile
+) -> bytes:
+    """
+    Unlocks a vault whose re-key was interrupted. A KDF parameters migration keeps the Master
+    Password, so both of its keys derive from it and it is finished here. An interrupted
+    Master Password change is only finished by changing the password again.
+
+    :raise ValueError: If a Master Password change was interrupted or another instance is
+        migrating the KDF parameters.
+    :raise InvalidTag: If the master password is wrong.
+    """
+    job = await db.relational.get_rekey_job(user_id)
+    if job is None:  # Finished in the meantime
+        return await unlock_vault(master_password, user_id)
+
+    old_key, new_key = await asyncio.gather(
+        derive_key(master_password, profile.salt, profile.kdf_params),
+        derive_key(master_password, profile.salt, job.kdf_params)
+    )
+    is_old_key = profile.key_check is not None and hmac.compare_digest(
+        gen_key_check(old_key), profile.key_check
+    )
+    is_new_key = hmac.compare_digest(gen_key_check(new_key), job.key_check)
+    if is_old_key and is_new_key:
+        await _run_kdf_migration(user_id, old_key, new_key, job.kdf_params)
+        logging.info(f"Resumed KDF parameters migration of user {user_id}")
+        return new_key
+    if is_old_key or is_new_key:
+        raise ValueError(MSG_ERROR_REKEY_PENDING)
+    raise InvalidTag(MSG_ERROR_MASTER_PASS)
+
+
+async def _run_kdf_migration(
+    user_id: int, old_key: bytes, new_key: bytes, kdf_params: KdfParams
+) -> None:
+    """
+    Re-keys the vault in a task shared by concurrent unlocks of the user. The task isn't
+    cancelled with them, so an abandoned unlock doesn't leave the vault half re-keyed.
+
+    :raise ValueError: If another instance is running the migration.
+    """
+    task = _kdf_migrations.get(user_id)
+    if task is None:
+        task = asyncio.create_task(rekey_vault(user_id, old_key, new_key, kdf_params))
+        _kdf_migrations[user_id] = task
+        task.add_done_callback(lambda t: _finish_kdf_migration(user_id, t))
+    try:
+        await asyncio.shield(task)
+    except ValueError as e:
+        if str(e) == MSG_ERROR_REKEY_RUNNING:
+            raise ValueError(MSG_ERROR_KDF_MIGRATION_RUNNING) from e
+        raise
+
+
+def _finish_kdf_migration(user_id: int, task: asyncio.Task[None]) -> None:
+    _kdf_migrations.pop(user_id, None)
+    if not task.cancelled() and task.exception() is not None:
+        logging.warning(f"KDF parameters migration of user {user_id} failed: {task.exception()}")
+
+
+async def validate_derived_key(
+    user_id: int, derived_key: bytes, key_check: Optional[str]
+) -> None:
+    """
+    Compares the key against the stored key-check value.
+
+    Users created before key-check values existed are validated by decrypting one of their
+    records once, after which the key-check value is stored for them.
 
+    :raise InvalidTag: If the key doesn't belong to the user.
+    """
+    if key_check is not None:
+        if not hmac.compare_digest(gen_key_check(derived_key), key_check):
+            raise InvalidTag(MSG_ERROR_MASTER_PASS)
+        return
 
-async def validate_derived_key(user_id: int, derived_key: bytes) -> None:
     rand_encrypted_record = await db.relational.get_rand_password(user_id)
     if rand_encrypted_record:
         try:
             await DecryptedRecord.decrypt(rand_encrypted_record, derived_key)
         except InvalidTag:
             raise InvalidTag(MSG_ERROR_MASTER_PASS)
+    await db.relational.set_key_check(user_id, gen_key_check(derived_key))
 
 
 def _validate_master_password(master_password: str):
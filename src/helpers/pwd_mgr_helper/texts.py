@@ -6,6 +6,7 @@ SERVICE_TEXT = "*Service*: "
 ENTER_TEXT = "Choose option"
 IMPORT_FROM_FILE_TEXT = "Please send the .csv file and enter your Master Password in caption"
 NO_SERVICES_TEXT = "You don't have any services yet. Create one now?"
+SERVICES_TEXT = "Choose service"
 DELETE_SERVICES_TEXT = ("Are you sure you want to delete all services?\n\n"
                         "If yes - please enter your Master Password")
 ASK_MASTER_PASSWORD_TEXT = "Please enter your Master Password"
@@ -13,10 +14,9 @@ CREATE_PASSWORD_TEXT = "Please enter your <Master Password> <login> <password>"
 CHANGE_SERVICE_TEXT = "Please enter <Master Password> <new service name>"
 DELETE_SERVICE_TEXT = ("Are you sure you want to delete this service?\n\n"
                        "If yes - please enter your Master Password")
-DELETE_PASSWORD_TEXT = ("\n\nAre you sure you want to delete this password?\n"
-                        "If yes - please enter your <Master Password> <login> <password>")
-UPDATE_CREDENTIALS_TEXT = ("Please enter your <Master Password> <login> <password> "
-                           "<new login> <new password>")
+DELETE_PASSWORD_TEXT = ("Are you sure you want to delete this password?\n\n"
+                        "If yes - please enter your Master Password")
+UPDATE_CREDENTIALS_TEXT = "Please enter your <Master Password> <new login> <new password>"
 CHANGE_MASTER_PASSWORD_TEXT = "Please enter your <current Master Password> <new Master Password>"
 CREATE_SERVICE_TEXT = "Please enter <Master Password> <service name> <login> <password>"
 LOGIN_TEXT = "\n\n*Login*: "
@@ -31,11 +31,6 @@ WARNING = (
 )
 
 
-def gen_services_text(services_offset: int) -> str:
-    return (
-        "Choose service"
-        f"\nPage: {services_offset + 1}"
-    )
 
 
 def gen_credentials(service: str, login: str, password: str) -> str:
@@ -49,7 +44,6 @@ def gen_credentials(service: str, login: str, password: str) -> str:
 
 
 # FSM handler texts
-IMPORT_FROM_FILE_FSM = "Passwords were successfully imported from file\n\n"
 EXPORT_TO_FILE_TEXT = "Passwords were successfully exported to file"
 PASSWORD_DELETED_TEXT = "Password was deleted successfully\n\n"
 ALL_SERVICES_DELETED_TEXT = "All services deleted successfully"
@@ -63,3 +57,14 @@ def gen_passwords_text(service: str, pwds_offset: int) -> str:
             "Choose your login to see password" + "\n"
             f"Page: {pwds_offset + 1}"
     )
+
+
+def gen_rekey_progress_text(percent: int) -> str:
+    return f"Re-encrypting passwords with the new Master Password: {percent}%"
+
+
+def gen_import_text(inserted: int, skipped: int) -> str:
+    text = f"{inserted} passwords were successfully imported from file"
+    if skipped:
+        text += f", {skipped} duplicates skipped"
+    return text + "\n\n"
@@ -36,75 +36,75 @@ def _btn_return_to_pwd_mgr() -> InlineKeyboardButton:
     )
 
 
-def btn_return_to_services(services_offset: int) -> InlineKeyboardButton:
+def btn_return_to_services(services_cursor: int) -> InlineKeyboardButton:
     return create_button(
         text=f"{RETURN_CHAR} {return_to_services_text}",
-        callback_data=PwdMgrCb.EnterServices(services_offset=services_offset)
+        callback_data=PwdMgrCb.EnterServices(services_cursor=services_cursor)
     )
 
 
-def btn_create_service(services_offset: int) -> InlineKeyboardButton:
+def btn_create_service(services_cursor: int) -> InlineKeyboardButton:
     return create_button(
         text=create_service_text,
-        callback_data=PwdMgrCb.CreateService(services_offset=services_offset)
+        callback_data=PwdMgrCb.CreateService(services_cursor=services_cursor)
     )
 
 
 def btn_create_pwd(
-    service: str, services_offset: int, pwds_offset: int
+    service: str, services_cursor: int, pwds_offset: int
 ) -> InlineKeyboardButton:
     return create_button(
         text=create_password_text,
         callback_data=PwdMgrCb.CreatePassword(
-            service=service, services_offset=services_offset, pwds_offset=pwds_offset
+            service=service, services_cursor=services_cursor, pwds_offset=pwds_offset
         )
     )
 
 
-def btn_delete_services(services_offset: int) -> Optional[InlineKeyboardButton]:
+def btn_delete_services(services_cursor: int) -> Optional[InlineKeyboardButton]:
     return create_button(
         text=delete_services_text,
-        callback_data=PwdMgrCb.DeleteServices(services_offset=services_offset)
+        callback_data=PwdMgrCb.DeleteServices(services_cursor=services_cursor)
     )
 
 
 def btn_change_service(
-    service: str, services_offset: int, pwds_offset: int
+    service: str, services_cursor: int, pwds_offset: int
 ) -> InlineKeyboardButton:
     return create_button(
         text=change_service_text,
         callback_data=PwdMgrCb.ChangeService(
-            service=service, services_offset=services_offset, pwds_offset=pwds_offset
+            service=service, services_cursor=services_cursor, pwds_offset=pwds_offset
         )
     )
 
 
 def btn_delete_service(
-    service: str, services_offset: int, pwds_offset: int
+    service: str, services_cursor: int, pwds_offset: int
 ) -> InlineKeyboardButton:
     return create_button(
         text=delete_service_text,
         callback_data=PwdMgrCb.DeleteService(
-            service=service, services_offset=services_offset, pwds_offset=pwds_offset
+            service=service, services_cursor=services_cursor, pwds_offset=pwds_offset
         )
     )
 
 
-def btn_delete_pwd(login: str, password: str) -> InlineKeyboardButton:
+def btn_delete_pwd(password_id: int) -> InlineKeyboardButton:
     return create_button(
         text=delete_password_text,
-        callback_data=PwdMgrCb.DeletePassword(login=login, password=password)
+        callback_data=PwdMgrCb.DeletePassword(password_id=password_id)
     )
 
 
 def btns_service(
-    services: list[str], services_offset: int
+    services: list[str], services_cursor: int
 ) -> list[list[InlineKeyboardButton]]:
     def create_button_func(service: str) -> InlineKeyboardButton:
         return create_button(
             text=service,
             callback_data=PwdMgrCb.EnterService(
-                service=service, services_offset=services_offset, pwds_offset=0
+                service=service, services_cursor=services_cursor, pwds_offset=0
             )
         )
 
@@ -115,37 +115,34 @@ def btns_pwd(decrypted_records: list[DecryptedRecord]) -> list[list[InlineKeyboa
     def create_button_func(record: DecryptedRecord) -> InlineKeyboardButton:
         return create_button(
             text=record.login,
-            callback_data=PwdMgrCb.EnterPassword(login=record.login, password=record.password)
+            callback_data=PwdMgrCb.EnterPassword(password_id=record.password_id)
         )
 
     return gen_dynamic_buttons(decrypted_records, create_button_func)
 
 
-def btn_previous_page_services(offset: int) -> Optional[InlineKeyboardButton]:
-    if offset == 0:
+def btn_previous_page_services(previous_cursor: Optional[int]) -> Optional[InlineKeyboardButton]:
+    if previous_cursor is None:
         return None
 
     return create_button(
         text=PREVIOUS_PAGE_CHAR,
-        callback_data=PwdMgrCb.EnterServices(services_offset=offset - 1)
+        callback_data=PwdMgrCb.EnterServices(services_cursor=previous_cursor, backward=True)
     )
 
 
-def btn_next_page_services(
-    services: list[str], offset: int
-) -> Optional[InlineKeyboardButton]:
-    if len(services) <= bot_cfg.dynamic_buttons_limit:
+def btn_next_page_services(next_cursor: Optional[int]) -> Optional[InlineKeyboardButton]:
+    if next_cursor is None:
         return None
 
-    services.pop()
     return create_button(
         text=NEXT_PAGE_CHAR,
-        callback_data=PwdMgrCb.EnterServices(services_offset=offset + 1)
+        callback_data=PwdMgrCb.EnterServices(services_cursor=next_cursor)
     )
 
 
 def btn_previous_page_pwds(
-    services_offset: int, pwd_offset: int, service: str
+    services_cursor: int, pwd_offset: int, service: str
 ) -> Optional[InlineKeyboardButton]:
     if pwd_offset == 0:
         return None
@@ -153,13 +150,13 @@ def btn_previous_page_pwds(
     return create_button(
         text=PREVIOUS_PAGE_CHAR,
         callback_data=PwdMgrCb.EnterService(
-            service=service, services_offset=services_offset, pwds_offset=pwd_offset - 1
+            service=service, services_cursor=services_cursor, pwds_offset=pwd_offset - 1
         )
     )
 
 
 def btn_next_page_pwds(
-    decrypted_records: list[DecryptedRecord], service: str, services_offset: int, pwds_offset: int
+    decrypted_records: list[DecryptedRecord], service: str, services_cursor: int, pwds_offset: int
 ) -> Optional[InlineKeyboardButton]:
     if len(decrypted_records) <= bot_cfg.dynamic_buttons_limit:
         return None
@@ -168,7 +165,7 @@ def btn_next_page_pwds(
     return create_button(
         text=NEXT_PAGE_CHAR,
         callback_data=PwdMgrCb.EnterService(
-            service=service, services_offset=services_offset, pwds_offset=pwds_offset + 1
+            service=service, services_cursor=services_cursor, pwds_offset=pwds_offset + 1
         )
     )
 
@@ -176,7 +173,7 @@ def btn_next_page_pwds(
 def _btn_enter_services() -> InlineKeyboardButton:
     return create_button(
         text=enter_services_text,
-        callback_data=PwdMgrCb.EnterServices(services_offset=0)
+        callback_data=PwdMgrCb.EnterServices(services_cursor=0)
     )
 
 
@@ -204,25 +201,25 @@ def _btn_search_service() -> InlineKeyboardButton:
 def btn_inline_query_service(service: str) -> InlineKeyboardButton:
     return create_button(
         text=service,
-        callback_data=PwdMgrCb.EnterService(service=service, services_offset=0, pwds_offset=0)
+        callback_data=PwdMgrCb.EnterService(service=service, services_cursor=0, pwds_offset=0)
     )
 
 
 def btn_return_to_pwds(
-    service: str, services_offset: int, pwds_offset: int
+    service: str, services_cursor: int, pwds_offset: int
 ) -> InlineKeyboardButton:
     return create_button(
         text=f"{RETURN_CHAR} {return_to_passwords_text}",
         callback_data=PwdMgrCb.EnterService(
-            service=service, services_offset=services_offset, pwds_offset=pwds_offset
+            service=service, services_cursor=services_cursor, pwds_offset=pwds_offset
         )
     )
 
 
-def btn_return_to_password(login: str, password: str) -> InlineKeyboardButton:
+def btn_return_to_password(password_id: int) -> InlineKeyboardButton:
     return create_button(
         text=f"{RETURN_CHAR} {return_to_password_text}",
-        callback_data=PwdMgrCb.EnterPassword(login=login, password=password)
+        callback_data=PwdMgrCb.EnterPassword(password_id=password_id)
     )
 
 
@@ -233,10 +230,10 @@ def _btn_change_master_password() -> InlineKeyboardButton:
     )
 
 
-def btn_update_credentials(login: str, password: str) -> InlineKeyboardButton:
+def btn_update_credentials(password_id: int) -> InlineKeyboardButton:
     return create_button(
         text=update_credentials_text,
-        callback_data=PwdMgrCb.UpdateCredentials(login=login, password=password)
+        callback_data=PwdMgrCb.UpdateCredentials(password_id=password_id)
     )
 
 
@@ -7,7 +7,7 @@ from aiogram.types import InlineKeyboardMarkup
 from keyboards.buttons import pwd_mgr, start_menu
 
 if TYPE_CHECKING:
-    from helpers.pwd_mgr_helper import DecryptedRecord, EncryptedRecord
+    from helpers.pwd_mgr_helper import DecryptedRecord, EncryptedRecord, ServicesPage
 
 
 def pwd_mgr_menu_ikm(record: EncryptedRecord) -> InlineKeyboardMarkup:
@@ -33,7 +33,7 @@ def pwd_mgr_menu_ikm(record: EncryptedRecord) -> InlineKeyboardMarkup:
 
 def _pwd_mgr_no_services_ikm() -> InlineKeyboardMarkup:
     return_to_pwd_mgr_button = pwd_mgr.btn_return_to_pwd_mgr
-    create_new_service_button = pwd_mgr.btn_create_service(services_offset=0)
+    create_new_service_button = pwd_mgr.btn_create_service(services_cursor=0)
 
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -43,14 +43,15 @@ def _pwd_mgr_no_services_ikm() -> InlineKeyboardMarkup:
     )
 
 
-def pwd_mgr_services_ikm(services: list[str], services_offset: int) -> InlineKeyboardMarkup:
-    next_page = pwd_mgr.btn_next_page_services(services, services_offset)
+def pwd_mgr_services_ikm(services_page: ServicesPage) -> InlineKeyboardMarkup:
+    services_cursor = services_page.cursor
+    next_page = pwd_mgr.btn_next_page_services(services_page.next_cursor)
     search_button = pwd_mgr.btn_search_service
-    service_buttons_rows = pwd_mgr.btns_service(services, services_offset)
+    service_buttons_rows = pwd_mgr.btns_service(services_page.services, services_cursor)
     return_to_pwd_mgr = pwd_mgr.btn_return_to_pwd_mgr
-    create_new_service_button = pwd_mgr.btn_create_service(services_offset)
-    delete_services_button = pwd_mgr.btn_delete_services(services_offset)
-    previous_page = pwd_mgr.btn_previous_page_services(services_offset)
+    create_new_service_button = pwd_mgr.btn_create_service(services_cursor)
+    delete_services_button = pwd_mgr.btn_delete_services(services_cursor)
+    previous_page = pwd_mgr.btn_previous_page_services(services_page.previous_cursor)
 
     action_buttons_row = [
         button for button in [create_new_service_button, delete_services_button] if button
@@ -72,15 +73,15 @@ def pwd_mgr_passwords_ikm(
     decrypted_records: list[DecryptedRecord],
     service: str,
     pwd_offset: int,
-    services_offset: int
+    services_cursor: int
 ) -> InlineKeyboardMarkup:
-    next_page = pwd_mgr.btn_next_page_pwds(decrypted_records, service, services_offset, pwd_offset)
+    next_page = pwd_mgr.btn_next_page_pwds(decrypted_records, service, services_cursor, pwd_offset)
     passwords = pwd_mgr.btns_pwd(decrypted_records)
-    change_service_name = pwd_mgr.btn_change_service(service, services_offset, pwd_offset)
-    delete_service = pwd_mgr.btn_delete_service(service, services_offset, pwd_offset)
-    return_to_services = pwd_mgr.btn_return_to_services(services_offset)
-    create_new_password = pwd_mgr.btn_create_pwd(service, services_offset, pwd_offset)
-    previous_page = pwd_mgr.btn_previous_page_pwds(services_offset, pwd_offset, service)
+    change_service_name = pwd_mgr.btn_change_service(service, services_cursor, pwd_offset)
+    delete_service = pwd_mgr.btn_delete_service(service, services_cursor, pwd_offset)
+    return_to_services = pwd_mgr.btn_return_to_services(services_cursor)
+    create_new_password = pwd_mgr.btn_create_pwd(service, services_cursor, pwd_offset)
+    previous_page = pwd_mgr.btn_previous_page_pwds(services_cursor, pwd_offset, service)
 
     navigation_buttons_row = [
         button for button in [previous_page, return_to_services, next_page] if button
@@ -96,9 +97,9 @@ def pwd_mgr_passwords_ikm(
     )
 
 
-def return_to_services_ikm(services_offset: int) -> InlineKeyboardMarkup:
+def return_to_services_ikm(services_cursor: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
-        inline_keyboard=[[pwd_mgr.btn_return_to_services(services_offset)]]
+        inline_keyboard=[[pwd_mgr.btn_return_to_services(services_cursor)]]
     )
 
 
@@ -107,11 +108,14 @@ def _return_to_pwd_mgr_ikm() -> InlineKeyboardMarkup:
 
 
 def pwd_mgr_password_ikm(
-    service: str, login: str, password: str, pwds_offset: int, services_offset: int
+    service: str,
+    password_id: int,
+    pwds_offset: int,
+    services_cursor: int
 ) -> InlineKeyboardMarkup:
-    btn_return_to_pwds = pwd_mgr.btn_return_to_pwds(service, services_offset, pwds_offset)
-    btn_delete_pwd = pwd_mgr.btn_delete_pwd(login, password)
-    btn_update_credentials = pwd_mgr.btn_update_credentials(login, password)
+    btn_return_to_pwds = pwd_mgr.btn_return_to_pwds(service, services_cursor, pwds_offset)
+    btn_delete_pwd = pwd_mgr.btn_delete_pwd(password_id)
+    btn_update_credentials = pwd_mgr.btn_update_credentials(password_id)
 
     return InlineKeyboardMarkup(inline_keyboard=[
         [btn_delete_pwd],
@@ -127,17 +131,19 @@ def pwd_mgr_inline_search_ikm(service: str) -> InlineKeyboardMarkup:
 
 
 def return_to_passwords_ikm(
-    service: str, services_offset: int, pwds_offset: int
+    service: str, services_cursor: int, pwds_offset: int
 ) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [pwd_mgr.btn_return_to_pwds(service, services_offset, pwds_offset)]
+            [pwd_mgr.btn_return_to_pwds(service, services_cursor, pwds_offset)]
         ]
     )
 
 
-def return_to_password_ikm(login: str, password: str) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[[pwd_mgr.btn_return_to_password(login, password)]])
+def return_to_password_ikm(password_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[pwd_mgr.btn_return_to_password(password_id)]]
+    )
 
 
 pwd_mgr_no_services_ikm: InlineKeyboardMarkup = _pwd_mgr_no_services_ikm()
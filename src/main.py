@@ -8,7 +8,9 @@ from aiohttp import web
 from config import bot_cfg
 from database import db
 from handlers import handlers_router
+from helpers.pwd_mgr_helper import bulk_crypto, kdf_executor
 from middleware import AutoDeleteMessagesMiddleware
+from utils import metrics
 
 bot = Bot(token=bot_cfg.token)
 dispatcher = Dispatcher()
@@ -31,6 +33,8 @@ async def on_shutdown() -> None:
     logging.info("Bot is shutting down...")
     await bot.session.close()
     await db.close()
+    kdf_executor.shutdown()
+    bulk_crypto.shutdown()
 
 
 async def start_polling_mode() -> None:
@@ -66,6 +70,10 @@ async def set_webhook() -> None:
         logging.info("Webhook is already set correctly.")
 
 
+async def metrics_handler(_: web.Request) -> web.Response:
+    return web.Response(text=metrics.render(), content_type="text/plain")
+
+
 def start_webhook_mode() -> None:
     setup_dispatcher()
     dispatcher.startup.register(set_webhook)
@@ -74,6 +82,7 @@ def start_webhook_mode() -> None:
         dispatcher=dispatcher, bot=bot, secret_token=bot_cfg.webhook_secret
     )
     webhook_requests_handler.register(app, path=bot_cfg.webhook_path)
+    app.router.add_get(bot_cfg.metrics_path, metrics_handler)
     setup_application(app, dispatcher, bot=bot)
     web.run_app(app, host=bot_cfg.web_server_host, port=bot_cfg.web_server_port)
 
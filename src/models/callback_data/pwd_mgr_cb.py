@@ -13,42 +13,40 @@ class PasswordManagerCallbackData:
     class ChangeMasterPassword(CallbackData, prefix="pm_change_master_pwd", sep=bot_cfg.sep): ...
 
     class EnterServices(CallbackData, prefix="pmesvcs", sep=bot_cfg.sep):
-        services_offset: int
+        services_cursor: int
+        backward: bool = False
 
     class DeleteServices(CallbackData, prefix="pmdsvcs", sep=bot_cfg.sep):
-        services_offset: int
+        services_cursor: int
 
     class CreateService(CallbackData, prefix="pmasvc", sep=bot_cfg.sep):
-        services_offset: int
+        services_cursor: int
 
     class EnterService(CallbackData, prefix="pmesvc", sep=bot_cfg.sep):
         service: str
-        services_offset: int
+        services_cursor: int
         pwds_offset: int
 
     class DeleteService(CallbackData, prefix="pmdsvc", sep=bot_cfg.sep):
         service: str
-        services_offset: int
+        services_cursor: int
         pwds_offset: int
 
     class ChangeService(CallbackData, prefix="pmcsvc", sep=bot_cfg.sep):
         service: str
-        services_offset: int
+        services_cursor: int
         pwds_offset: int
 
     class CreatePassword(CallbackData, prefix="pmapwd", sep=bot_cfg.sep):
         service: str
-        services_offset: int
+        services_cursor: int
         pwds_offset: int
 
     class DeletePassword(CallbackData, prefix="pmdpwd", sep=bot_cfg.sep):
-        login: str
-        password: str
+        password_id: int
 
     class EnterPassword(CallbackData, prefix="pmepwd", sep=bot_cfg.sep):
-        login: str
-        password: str
+        password_id: int
 
     class UpdateCredentials(CallbackData, prefix="pmucrd", sep=bot_cfg.sep):
-        login: str
-        password: str
+        password_id: int
@@ -1,11 +1,14 @@
-from .cache_user_created import GetCacheUserCreated, SetCacheUserCreated
+from .crypto_profile import (
+    GetCryptoProfile, SetCryptoProfile, GetCryptoProfileVersion, SetCryptoProfileVersion
+)
 from .data import GetData, SetData
 from .hash_type import GetHashType, SetHashType
 from .input_format import GetInputFormat, SetInputFormat
 from .message_id_to_delete import GetMessageIdToDelete, SetMessageIdToDelete
+from .password_id import GetPasswordId, SetPasswordId
 from .pwds_offset import GetPasswordsOffset, SetPasswordsOffset
 from .service import GetService, SetService
-from .services_offset import GetServicesOffset, SetServicesOffset
+from .services_cursor import GetServicesCursor, SetServicesCursor
 from .state import GetState, SetState
 
 __all__ = (
@@ -17,12 +20,16 @@ __all__ = (
     "SetInputFormat",
     "GetService",
     "SetService",
-    "GetServicesOffset",
-    "SetServicesOffset",
+    "GetServicesCursor",
+    "SetServicesCursor",
     "GetPasswordsOffset",
     "SetPasswordsOffset",
-    "GetCacheUserCreated",
-    "SetCacheUserCreated",
+    "GetPasswordId",
+    "SetPasswordId",
+    "GetCryptoProfile",
+    "SetCryptoProfile",
+    "GetCryptoProfileVersion",
+    "SetCryptoProfileVersion",
     "GetState",
     "SetState",
     "GetData",
@@ -0,0 +1,50 @@
+from typing import Optional
+
+from models.kv.base import BaseKeyValueGet, BaseKeyValue, BaseKeyValueSet
+
+
+class BaseCryptoProfile(BaseKeyValue):
+    """User-scoped entry, so it is keyed by user_id instead of an FSM storage key."""
+
+    def __init__(self, user_id: int, version: Optional[str] = None):
+        super().__init__(storage_key=None)
+        self.user_id = user_id
+        self.version = version
+
+    @property
+    def key(self) -> str:
+        if self.version is None:
+            return f"crypto_profile:{self.user_id}"
+        return f"crypto_profile:{self.user_id}:{self.version}"
+
+
+class SetCryptoProfile(BaseKeyValueSet, BaseCryptoProfile):
+    def __init__(self, user_id: int, version: Optional[str], value: str, expire: Optional[int]):
+        BaseCryptoProfile.__init__(self, user_id, version)
+        self.value = value
+        self.expire = expire
+
+
+class GetCryptoProfile(BaseKeyValueGet, BaseCryptoProfile): ...
+
+
+class BaseCryptoProfileVersion(BaseKeyValue):
+    """Replaced whenever the user's crypto profile changes, see `CryptoProfileCache`."""
+
+    def __init__(self, user_id: int):
+        super().__init__(storage_key=None)
+        self.user_id = user_id
+
+    @property
+    def key(self) -> str:
+        return f"crypto_profile_version:{self.user_id}"
+
+
+class SetCryptoProfileVersion(BaseKeyValueSet, BaseCryptoProfileVersion):
+    def __init__(self, user_id: int, value: str, expire: Optional[int]):
+        BaseCryptoProfileVersion.__init__(self, user_id)
+        self.value = value
+        self.expire = expire
+
+
+class GetCryptoProfileVersion(BaseKeyValueGet, BaseCryptoProfileVersion): ...
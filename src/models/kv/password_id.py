@@ -0,0 +1,13 @@
+from models.kv.base import BaseKeyValueGet, BaseKeyValue, BaseKeyValueSet
+
+
+class BasePasswordId(BaseKeyValue):
+    @property
+    def key(self) -> str:
+        return "password_id"
+
+
+class SetPasswordId(BaseKeyValueSet, BasePasswordId): ...
+
+
+class GetPasswordId(BaseKeyValueGet, BasePasswordId): ...
@@ -0,0 +1,13 @@
+from models.kv.base import BaseKeyValueGet, BaseKeyValue, BaseKeyValueSet
+
+
+class BaseServicesCursor(BaseKeyValue):
+    @property
+    def key(self) -> str:
+        return "services_cursor"
+
+
+class SetServicesCursor(BaseKeyValueSet, BaseServicesCursor): ...
+
+
+class GetServicesCursor(BaseKeyValueGet, BaseServicesCursor): ...
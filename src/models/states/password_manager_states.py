@@ -5,6 +5,7 @@ class PasswordManagerStates(StatesGroup):
     CreatePassword = State()
     CreateService = State()
     EnterService = State()
+    EnterPassword = State()
     ChangeService = State()
     DeleteServices = State()
     DeleteService = State()
@@ -0,0 +1,91 @@
+"""
+Recommends Argon2 parameters that meet a latency target on the current host.
+
+Memory is preferred over iterations: the largest memory cost (up to --max-memory) that derives
+within the target with one iteration is picked, then iterations are added while they fit.
+
+Run from src/: python -m tools.calibrate_kdf [--target-ms 500] [--max-memory 262144]
+"""
+import argparse
+import os
+import statistics
+import time
+
+from config import crypto_cfg
+from helpers.pwd_mgr_helper import KdfParams
+from helpers.pwd_mgr_helper.pwd_mgr_crypto import _derive_key
+
+MIN_MEMORY_COST = 19456  # KiB (19 MiB), OWASP minimum for Argon2id
+MAX_TIME_COST = 10
+
+
+def measure(kdf_params: KdfParams, rounds: int) -> float:
+    """
+    :return: Median duration of a derivation in seconds.
+    """
+    salt = os.urandom(crypto_cfg.argon2_random_salt_length)
+    durations = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        _derive_key("Calibration-Password-1!", salt, kdf_params)
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def calibrate(
+    target: float, max_memory: int, parallelism: int, rounds: int
+) -> tuple[KdfParams, float]:
+    memory_cost = max_memory
+    while True:
+        kdf_params = KdfParams(time_cost=1, memory_cost=memory_cost, parallelism=parallelism)
+        duration = measure(kdf_params, rounds)
+        print(f"  {kdf_params} -> {duration * 1000:.0f} ms")
+        if duration <= target or memory_cost // 2 < MIN_MEMORY_COST:
+            break
+        memory_cost //= 2
+
+    best, best_duration = kdf_params, duration
+    for time_cost in range(2, MAX_TIME_COST + 1):
+        kdf_params = best._replace(time_cost=time_cost)
+        if best_duration / best.time_cost * time_cost > target:
+            break
+        duration = measure(kdf_params, rounds)
+        print(f"  {kdf_params} -> {duration * 1000:.0f} ms")
+        if duration > target:
+            break
+        best, best_duration = kdf_params, duration
+    return best, best_duration
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recommend Argon2 parameters for this host.")
+    parser.add_argument("--target-ms", type=float, default=500, help="latency of one derivation")
+    parser.add_argument(
+        "--max-memory", type=int, default=crypto_cfg.kdf_memory_budget, help="KiB per derivation"
+    )
+    parser.add_argument("--parallelism", type=int, default=crypto_cfg.argon2_parallelism)
+    parser.add_argument("--rounds", type=int, default=3, help="measurements per candidate")
+    args = parser.parse_args()
+
+    current = KdfParams.current()
+    print(f"Current {current} -> {measure(current, args.rounds) * 1000:.0f} ms")
+    print(f"Calibrating for {args.target_ms:.0f} ms:")
+    kdf_params, duration = calibrate(
+        args.target_ms / 1000, args.max_memory, args.parallelism, args.rounds
+    )
+    if duration > args.target_ms / 1000:
+        print(f"Target can't be met with at least {MIN_MEMORY_COST} KiB of memory")
+
+    concurrent = max(1, crypto_cfg.kdf_memory_budget // kdf_params.memory_cost)
+    print(
+        f"\nRecommended ({duration * 1000:.0f} ms, {concurrent} concurrent derivations within "
+        f"CRYPTO_KDF_MEMORY_BUDGET={crypto_cfg.kdf_memory_budget}):\n"
+        f"CRYPTO_ARGON2_TIME_COST={kdf_params.time_cost}\n"
+        f"CRYPTO_ARGON2_MEMORY_COST={kdf_params.memory_cost}\n"
+        f"CRYPTO_ARGON2_PARALLELISM={kdf_params.parallelism}\n"
+        "\nNew users get these parameters, existing users migrate on their next unlock."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Applies pending schema migrations, e.g. ahead of a deploy with RELATIONAL_DB_MIGRATE_ON_CONNECT
+disabled. Safe to run while the bot is up: concurrent runs wait for each other.
+
+Run from src/: python -m tools.migrate [--status]
+"""
+import argparse
+import asyncio
+import logging
+
+import asyncpg
+
+from database.relational_db.connection import connect_params
+from database.relational_db.migrations import get_pending, get_schema_version, migrate
+
+
+async def run(status: bool) -> None:
+    con = await asyncpg.connect(**connect_params())
+    try:
+        version = await get_schema_version(con)
+        pending = get_pending(version)
+        print(f"Schema version {version}, {len(pending)} pending migrations")
+        for migration in pending:
+            print(f"  {migration.version} {migration.name}")
+        if not status and pending:
+            await migrate(con)
+            print(f"Schema version {await get_schema_version(con)}")
+    finally:
+        await con.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument(
+        "--status", action="store_true", help="only list the pending migrations"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(run(args.status))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Converts the FSM data that aiogram's `RedisStorage` kept as JSON strings to the hashes of
+`RedisHashStorage`. The bot converts a key on its first use anyway, so this only saves that
+round trip. Safe to run while the bot is up: every key is converted atomically.
+
+Run from src/: python -m tools.migrate_fsm_data [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+
+from database.key_value_db.redis import RedisManager
+
+BATCH_SIZE = 500
+
+
+async def run(dry_run: bool) -> None:
+    manager = RedisManager()
+    storage = manager.storage
+    separator = storage.key_builder.separator
+    pattern = f"{storage.key_builder.prefix}{separator}*{separator}data"
+    found = converted = 0
+    try:
+        data_keys = []
+        async for data_key in manager.redis.scan_iter(
+            match=pattern, count=BATCH_SIZE, _type="string"
+        ):
+            found += 1
+            if dry_run:
+                continue
+            data_keys.append(data_key)
+            if len(data_keys) >= BATCH_SIZE:
+                converted += await storage.migrate_data(data_keys)
+                data_keys = []
+        if data_keys and not dry_run:
+            converted += await storage.migrate_data(data_keys)
+    finally:
+        await manager.close()
+
+    if dry_run:
+        print(f"{found} keys to convert")
+    else:
+        print(f"Converted {converted} of {found} keys")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert FSM data in Redis to hashes.")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only count the keys to convert"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(run(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
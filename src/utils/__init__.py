@@ -4,9 +4,12 @@ from .bot_utils import (
     download_file,
     add_protocol,
     strip_protocol,
-    escape_markdown_v2
+    escape_markdown_v2,
+    SpooledInputFile
 )
 from .kb_utils import gen_dynamic_buttons, create_button
+from .lru_cache import LRUCache
+from .metrics import metrics
 
 __all__ = (
     "delete_file",
@@ -15,6 +18,9 @@ __all__ = (
     "add_protocol",
     "strip_protocol",
     "escape_markdown_v2",
+    "SpooledInputFile",
     "gen_dynamic_buttons",
     "create_button",
+    "LRUCache",
+    "metrics",
 )
@@ -1,8 +1,33 @@
 import re
+from typing import TYPE_CHECKING, AsyncGenerator, BinaryIO
 
 from aiofiles import os
 from aiogram import types
 from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputFile
+from aiogram.types.input_file import DEFAULT_CHUNK_SIZE
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+
+class SpooledInputFile(InputFile):
+    """
+    Uploads a binary file object, e.g. a `SpooledTemporaryFile`, chunk by chunk instead of
+    loading it into memory first. The file is read from the start on every upload attempt.
+    """
+
+    def __init__(self, file: BinaryIO, filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot: "Bot") -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
+
+    def close(self) -> None:
+        self.file.close()
 
 
 async def download_file(message: types.Message) -> str: